@@ -1,33 +1,164 @@
 """Client helper for writing audit log events."""
 from __future__ import annotations
 
+from contextlib import contextmanager
 from datetime import datetime
+import queue
 import sqlite3
+import threading
+from typing import Iterable, Iterator
 
-from services.audit.db import AuditLogRepository
+from services.audit.db import AuditEntry, AuditLogRepository, configure_connection
 from services.audit.chain import AuditRecord
+from services.audit.archive import SegmentArchive, SegmentInfo
+from services.audit.query import AuditPage, AuditQuery
+
+from .writer import AuditWriter
 
 
 class AuditClient:
-    """High level client for appending entries to the audit log."""
+    """High level client for appending entries to the audit log.
+
+    The client is long-lived: a single writer connection is opened lazily,
+    the schema is checked once, and reads are served from a small pool of WAL
+    reader connections so they never wait on the writer. Use it as a context
+    manager (or call :meth:`close`) to flush and release the connections.
+    """
 
-    def __init__(self, database_path: str):
+    def __init__(
+        self,
+        database_path: str,
+        *,
+        pool_size: int = 4,
+        busy_timeout_ms: int = 5000,
+        signing_key: bytes | None = None,
+        sign_every: int = 0,
+        archive_dir: str | None = None,
+    ):
+        if pool_size < 1:
+            raise ValueError("pool_size must be at least 1")
         self._database_path = database_path
+        self._pool_size = pool_size
+        self._busy_timeout_ms = busy_timeout_ms
+        self._signing_key = signing_key
+        self._sign_every = sign_every
+        self._archive = SegmentArchive(archive_dir) if archive_dir else None
+        self._write_lock = threading.Lock()
+        self._writer: sqlite3.Connection | None = None
+        self._repository: AuditLogRepository | None = None
+        self._readers: queue.LifoQueue[sqlite3.Connection] = queue.LifoQueue()
+        self._reader_count = 0
+        self._reader_lock = threading.Lock()
+        self._closed = False
 
     @property
     def database_path(self) -> str:
         return self._database_path
 
+    def __enter__(self) -> "AuditClient":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
     def log(self, actor: str, action: str, payload: object, ts: datetime | None = None) -> AuditRecord:
-        with sqlite3.connect(self._database_path) as conn:
-            repository = AuditLogRepository(conn)
+        with self._write_lock:
+            repository = self._writer_repository()
             return repository.append(actor, action, payload, ts=ts)
 
+    def log_many(self, entries: Iterable[AuditEntry]) -> list[AuditRecord]:
+        """Append ``(actor, action, payload, ts)`` entries in one transaction."""
+        with self._write_lock:
+            repository = self._writer_repository()
+            return repository.append_many(entries)
+
     def iter_records(self) -> list[AuditRecord]:
-        with sqlite3.connect(self._database_path) as conn:
-            repository = AuditLogRepository(conn)
+        with self._reader() as conn:
+            repository = AuditLogRepository(conn, create_schema=False, archive=self._archive)
             chain = repository.all_records()
             return list(chain)
 
+    def query(self, query: AuditQuery | None = None, *, after_id: int = 0, limit: int = 100) -> AuditPage:
+        """Return one page of records matching ``query`` from a pooled reader."""
+        with self._reader() as conn:
+            repository = AuditLogRepository(conn, create_schema=False, archive=self._archive)
+            return repository.query(query, after_id=after_id, limit=limit)
+
+    def iter_query(self, query: AuditQuery | None = None, *, page_size: int = 500) -> Iterator[AuditRecord]:
+        """Stream matching records page by page, holding a reader only per page."""
+        cursor: int | None = 0
+        while cursor is not None:
+            page = self.query(query, after_id=cursor, limit=page_size)
+            yield from page.records
+            cursor = page.next_after_id
+
+    def rotate(self, keep_live: int) -> SegmentInfo | None:
+        """Archive all but the newest ``keep_live`` records into a compressed segment."""
+        with self._write_lock:
+            return self._writer_repository().rotate(keep_live)
+
+    def flush(self) -> None:
+        """Commit outstanding writes and checkpoint the WAL into the main file."""
+        with self._write_lock:
+            if self._writer is not None:
+                self._writer.commit()
+                self._writer.execute("PRAGMA wal_checkpoint(PASSIVE)")
+
+    def close(self) -> None:
+        """Flush and close every pooled connection. Safe to call twice."""
+        if self._closed:
+            return
+        self.flush()
+        with self._write_lock:
+            self._closed = True
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
+                self._repository = None
+        while True:
+            try:
+                self._readers.get_nowait().close()
+            except queue.Empty:
+                break
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self._database_path, check_same_thread=False)
+        configure_connection(conn, busy_timeout_ms=self._busy_timeout_ms)
+        return conn
+
+    def _writer_repository(self) -> AuditLogRepository:
+        """Return the writer repository, creating it on first use. Caller holds the write lock."""
+        if self._closed:
+            raise RuntimeError("AuditClient is closed")
+        if self._repository is None:
+            self._writer = self._connect()
+            self._repository = AuditLogRepository(
+                self._writer,
+                signing_key=self._signing_key,
+                sign_every=self._sign_every,
+                archive=self._archive,
+            )
+        return self._repository
+
+    @contextmanager
+    def _reader(self) -> Iterator[sqlite3.Connection]:
+        with self._write_lock:
+            self._writer_repository()
+        try:
+            conn = self._readers.get_nowait()
+        except queue.Empty:
+            with self._reader_lock:
+                grow = self._reader_count < self._pool_size
+                if grow:
+                    self._reader_count += 1
+            conn = self._connect() if grow else self._readers.get()
+        try:
+            yield conn
+        finally:
+            if self._closed:
+                conn.close()
+            else:
+                self._readers.put(conn)
+
 
-__all__ = ["AuditClient", "AuditRecord"]
+__all__ = ["AuditClient", "AuditQuery", "AuditRecord", "AuditWriter"]
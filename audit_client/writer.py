@@ -0,0 +1,256 @@
+"""Background audit writer that keeps SQLite I/O off the request path."""
+from __future__ import annotations
+
+from datetime import datetime, timezone
+import json
+import logging
+import os
+from pathlib import Path
+import queue
+import threading
+from typing import TYPE_CHECKING, List
+
+from services.audit.db import AuditEntry
+
+if TYPE_CHECKING:  # pragma: no cover - import cycle guard
+    from . import AuditClient
+
+logger = logging.getLogger(__name__)
+
+BACKPRESSURE_POLICIES = ("block", "drop", "spill")
+
+_STOP = object()
+
+
+class AuditWriter:
+    """Bounded in-process queue drained by a writer thread in batches.
+
+    ``submit`` only timestamps the entry and enqueues it. When the queue is
+    full the configured backpressure policy applies: ``block`` waits for room,
+    ``drop`` discards the entry and increments :attr:`dropped`, and ``spill``
+    appends it to a local JSONL file that is replayed into the chain once the
+    writer catches up (and on the next start if the process died first).
+    Spilled entries are delivered at least once; see :meth:`_replay_spill`.
+    """
+
+    def __init__(
+        self,
+        client: "AuditClient",
+        *,
+        max_queue: int = 10_000,
+        batch_size: int = 256,
+        backpressure: str = "block",
+        spill_path: str | os.PathLike[str] | None = None,
+    ):
+        if backpressure not in BACKPRESSURE_POLICIES:
+            raise ValueError(f"backpressure must be one of {', '.join(BACKPRESSURE_POLICIES)}")
+        if backpressure == "spill" and spill_path is None:
+            raise ValueError("spill_path is required when backpressure is 'spill'")
+        if max_queue < 1 or batch_size < 1:
+            raise ValueError("max_queue and batch_size must be positive")
+        self._client = client
+        self._batch_size = batch_size
+        self._backpressure = backpressure
+        self._spill_path = Path(spill_path) if spill_path is not None else None
+        self._spill_lock = threading.Lock()
+        self._replay_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self._queue: queue.Queue[object] = queue.Queue(maxsize=max_queue)
+        # Guards ``_closed`` and counts submits between their closed check and their enqueue.
+        self._state = threading.Condition()
+        self._closed = False
+        self._submitting = 0
+        self.written = 0
+        self.dropped = 0
+        self.spilled = 0
+        self.failed = 0
+        self._thread = threading.Thread(target=self._run, name="audit-writer", daemon=True)
+        self._thread.start()
+
+    def __enter__(self) -> "AuditWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def submit(self, actor: str, action: str, payload: object, ts: datetime | None = None) -> bool:
+        """Enqueue an entry; returns ``False`` only when it was dropped.
+
+        Raises ``ValueError`` for a payload that is not JSON (or JSON text), which
+        could never be written to the chain or the spill file.
+        """
+        _check_payload(payload)
+        entry: AuditEntry = (actor, action, payload, ts or datetime.now(timezone.utc))
+        with self._state:
+            if self._closed:
+                raise RuntimeError("AuditWriter is closed")
+            self._submitting += 1
+        try:
+            return self._enqueue(entry)
+        finally:
+            with self._state:
+                self._submitting -= 1
+                if not self._submitting:
+                    self._state.notify_all()
+
+    def _enqueue(self, entry: AuditEntry) -> bool:
+        if self._backpressure == "block":
+            self._queue.put(entry)
+            return True
+        try:
+            self._queue.put_nowait(entry)
+        except queue.Full:
+            if self._backpressure == "drop":
+                self._count("dropped", 1)
+                return False
+            self._spill([entry])
+        return True
+
+    def flush(self) -> None:
+        """Wait until every queued entry and any spilled entry is in the chain."""
+        if self._thread.is_alive():
+            self._queue.join()
+        self._replay_spill()
+        self._client.flush()
+
+    def close(self) -> None:
+        """Stop accepting entries, drain the queue and stop the writer thread.
+
+        Submits already past their closed check finish enqueueing first, so the
+        stop marker is always the last item and nothing queued is lost.
+        """
+        with self._state:
+            if self._closed:
+                return
+            self._closed = True
+            while self._submitting:
+                self._state.wait()
+        while self._thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=0.1)
+                break
+            except queue.Full:
+                continue
+        self._thread.join()
+        # Only non-empty if the writer thread died; write what it left behind.
+        leftover = [item for item in self._drain_queue() if item is not _STOP]
+        for start in range(0, len(leftover), self._batch_size):
+            self._write(leftover[start : start + self._batch_size])  # type: ignore[arg-type]
+        self._replay_spill()
+        self._client.flush()
+
+    def _drain_queue(self) -> List[object]:
+        items: List[object] = []
+        while True:
+            try:
+                items.append(self._queue.get_nowait())
+            except queue.Empty:
+                return items
+            self._queue.task_done()
+
+    def _count(self, name: str, amount: int) -> None:
+        with self._stats_lock:
+            setattr(self, name, getattr(self, name) + amount)
+
+    def _run(self) -> None:
+        self._replay_spill_safely()
+        while True:
+            batch: List[object] = [self._queue.get()]
+            while len(batch) < self._batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            entries = [item for item in batch if item is not _STOP]
+            if entries:
+                self._write(entries)  # type: ignore[arg-type]
+            for _ in batch:
+                self._queue.task_done()
+            if len(entries) != len(batch):
+                return
+            if self._queue.empty():
+                self._replay_spill_safely()
+
+    def _write(self, entries: List[AuditEntry]) -> None:
+        try:
+            self._client.log_many(entries)
+        except Exception:
+            logger.exception("Failed to write %d audit entries", len(entries))
+            if self._spill_path is not None:
+                try:
+                    self._spill(entries)
+                    return
+                except Exception:
+                    logger.exception("Failed to spill %d audit entries", len(entries))
+            self._count("failed", len(entries))
+            return
+        self._count("written", len(entries))
+
+    def _spill(self, entries: List[AuditEntry]) -> None:
+        assert self._spill_path is not None
+        lines = [
+            json.dumps(
+                {"actor": actor, "action": action, "payload": payload, "ts": ts.isoformat() if ts else None},
+                sort_keys=True,
+                separators=(",", ":"),
+            )
+            for actor, action, payload, ts in entries
+        ]
+        with self._spill_lock:
+            with self._spill_path.open("a", encoding="utf-8") as handle:
+                handle.write("\n".join(lines) + "\n")
+        self._count("spilled", len(entries))
+
+    def _replay_spill_safely(self) -> None:
+        try:
+            self._replay_spill()
+        except Exception:
+            logger.exception("Failed to replay spilled audit entries; will retry")
+
+    def _replay_spill(self) -> None:
+        """Move the spill file aside and append its entries in one transaction.
+
+        A leftover ``.replay`` file from a failed attempt is retried before any
+        new spill, so no entry is lost and a failed append is not duplicated.
+        Delivery is at least once, though: if the process dies after the append
+        commits but before the ``.replay`` file is removed, the next start
+        appends those entries again.
+        """
+        if self._spill_path is None:
+            return
+        replay_path = self._spill_path.with_name(self._spill_path.name + ".replay")
+        with self._replay_lock:
+            if not replay_path.exists():
+                with self._spill_lock:
+                    if not self._spill_path.exists():
+                        return
+                    os.replace(self._spill_path, replay_path)
+            entries: List[AuditEntry] = []
+            with replay_path.open("r", encoding="utf-8") as handle:
+                for line in handle:
+                    if not line.strip():
+                        continue
+                    raw = json.loads(line)
+                    ts = datetime.fromisoformat(raw["ts"]) if raw.get("ts") else None
+                    entries.append((raw["actor"], raw["action"], raw["payload"], ts))
+            if entries:
+                self._client.log_many(entries)
+                self._count("written", len(entries))
+            replay_path.unlink()
+
+
+def _check_payload(payload: object) -> None:
+    try:
+        if isinstance(payload, str):
+            json.loads(payload)
+        elif payload is not None:
+            json.dumps(payload)
+    except (TypeError, ValueError) as exc:
+        raise ValueError(f"audit payload must be JSON-serializable: {exc}") from None
+
+
+__all__ = ["AuditWriter", "BACKPRESSURE_POLICIES"]
@@ -0,0 +1,90 @@
+"""Throughput benchmark for ``create_collect`` under concurrent callers.
+
+Compares the pooled thread-local connections against opening a fresh
+connection per transaction. ``--provider-latency`` adds a simulated provider
+round trip; since the provider is called outside any transaction, throughput
+should scale with ``--threads`` rather than serialise on that latency. Usage::
+
+    python scripts/bench_payments_collect.py --threads 8 --calls 500
+    python scripts/bench_payments_collect.py --threads 16 --calls 20 --provider-latency 0.05
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+_TMP = tempfile.mkdtemp(prefix="payments-bench-")
+os.environ["PAYMENTS_DATABASE_PATH"] = str(Path(_TMP) / "bench.db")
+
+from services.payments.database import initialize_schema, pool  # noqa: E402
+from services.payments.providers.stripe_provider import stripe_collect_provider  # noqa: E402
+from services.payments.schemas import CollectRequest  # noqa: E402
+from services.payments.service import create_collect  # noqa: E402
+
+
+def run(threads: int, calls: int, *, reuse: bool) -> float:
+    pool.close_all()
+    pool.reuse = reuse
+    initialize_schema()
+    barrier = threading.Barrier(threads + 1)
+    errors: List[BaseException] = []
+
+    def worker(worker_id: int) -> None:
+        request = CollectRequest(amount=Decimal("100.00"), currency="USD", customer_meta={"worker": worker_id})
+        barrier.wait()
+        try:
+            for i in range(calls):
+                create_collect(request, f"bench-{reuse}-{worker_id}-{i}")
+        except BaseException as exc:  # pragma: no cover - reported below
+            errors.append(exc)
+
+    workers = [threading.Thread(target=worker, args=(n,)) for n in range(threads)]
+    for thread in workers:
+        thread.start()
+    barrier.wait()
+    started = time.perf_counter()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        raise errors[0]
+    return threads * calls / elapsed
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--calls", type=int, default=500)
+    parser.add_argument("--provider-latency", type=float, default=0.0, help="Seconds per simulated provider call")
+    args = parser.parse_args(argv)
+
+    if args.provider_latency:
+        original = stripe_collect_provider.create_collect
+
+        def slow_create_collect(*call_args, **kwargs):
+            time.sleep(args.provider_latency)
+            return original(*call_args, **kwargs)
+
+        stripe_collect_provider.create_collect = slow_create_collect  # type: ignore[method-assign]
+        ceiling = args.threads / args.provider_latency
+        print(f"provider latency {args.provider_latency * 1000:.0f} ms; ideal ceiling {ceiling:,.0f} collects/s")
+
+    fresh = run(args.threads, args.calls, reuse=False)
+    pooled = run(args.threads, args.calls, reuse=True)
+    print(f"connect per transaction: {fresh:,.0f} collects/s")
+    print(f"pooled connections:      {pooled:,.0f} collects/s ({pooled / fresh:.2f}x)")
+    pool.close_all()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
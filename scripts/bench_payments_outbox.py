@@ -0,0 +1,69 @@
+"""Measure the settlement write path and outbox relay throughput separately.
+
+The write path is ``settle_payment_by_id``, i.e. the status update plus the
+outbox insert in one transaction. The relay drains the resulting rows into the
+durable event queue. Usage::
+
+    python scripts/bench_payments_outbox.py --payments 5000 --batch-size 500
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from decimal import Decimal
+from pathlib import Path
+from typing import List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+_TMP = tempfile.mkdtemp(prefix="payments-outbox-bench-")
+os.environ["PAYMENTS_DATABASE_PATH"] = str(Path(_TMP) / "bench.db")
+
+from services.payments.database import db_transaction, initialize_schema  # noqa: E402
+from services.payments.outbox import OutboxRelay  # noqa: E402
+from services.payments.service import settle_payment_by_id  # noqa: E402
+
+
+def _seed(count: int) -> List[str]:
+    ids = [f"bench-{n}" for n in range(count)]
+    with db_transaction() as conn:
+        conn.executemany(
+            """
+            INSERT INTO payments (id, provider, amount, amount_units, currency, status, created_at, updated_at)
+            VALUES (?, 'stripe_ach', '10.00', 100000, 'USD', 'pending', '2024-01-01', '2024-01-01')
+            """,
+            [(payment_id,) for payment_id in ids],
+        )
+    return ids
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--payments", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=500)
+    args = parser.parse_args(argv)
+
+    initialize_schema()
+    ids = _seed(args.payments)
+
+    started = time.perf_counter()
+    for payment_id in ids:
+        settle_payment_by_id(payment_id, Decimal("10.00"), "USD")
+    write_seconds = time.perf_counter() - started
+
+    relay = OutboxRelay(batch_size=args.batch_size)
+    relayed = relay.relay_all()
+
+    print(f"settle + outbox write: {args.payments / write_seconds:,.0f} tx/s")
+    print(
+        f"relay: {relayed:,} events in {relay.stats.batches} batches, "
+        f"{relay.stats.events_per_second:,.0f} events/s"
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
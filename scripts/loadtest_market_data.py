@@ -0,0 +1,96 @@
+"""Compare requests per second of the WSGI and ASGI market data apps.
+
+Runs both adapters in-process against the same seeded ``ServiceState`` so the
+numbers reflect the request path (routing, lookups, serialization) rather
+than a particular HTTP server. Usage::
+
+    python scripts/loadtest_market_data.py --requests 20000 --concurrency 64
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.market_data.app import MarketDataApp, ServiceState  # noqa: E402
+from services.market_data.asgi import MarketDataASGIApp  # noqa: E402
+
+PATHS: List[Tuple[str, str]] = [
+    ("/fx/spot", "pair=USDMXN"),
+    ("/fx/spot", "pair=EURMXN"),
+    ("/iv/atm", "pair=USDMXN&tenor=1M"),
+    ("/iv/atm", "pair=USDMXN&tenor=3M"),
+    ("/fx/spot/batch", "pairs=USDMXN,EURMXN"),
+]
+
+
+def _seeded_state() -> ServiceState:
+    state = ServiceState()
+    state.manual_spot_store.set_fix("USDMXN", 17.1)
+    state.manual_spot_store.set_fix("EURMXN", 18.6)
+    state.manual_iv_store.set_sigma("USDMXN", "1M", 0.11)
+    state.manual_iv_store.set_sigma("USDMXN", "3M", 0.12)
+    return state
+
+
+def run_wsgi(app: MarketDataApp, total: int) -> float:
+    def start_response(status: str, headers: list) -> Callable[[bytes], None]:
+        return lambda data: None
+
+    started = time.perf_counter()
+    for i in range(total):
+        path, query = PATHS[i % len(PATHS)]
+        environ: Dict[str, object] = {"REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": query}
+        b"".join(app(environ, start_response))
+    return total / (time.perf_counter() - started)
+
+
+async def _asgi_worker(app: MarketDataASGIApp, indices: range) -> None:
+    async def receive() -> Dict[str, object]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Dict[str, object]) -> None:
+        return None
+
+    for i in indices:
+        path, query = PATHS[i % len(PATHS)]
+        scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode()}
+        await app(scope, receive, send)
+
+
+def run_asgi(app: MarketDataASGIApp, total: int, concurrency: int) -> float:
+    async def main() -> float:
+        per_worker = total // concurrency
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(_asgi_worker(app, range(w * per_worker, (w + 1) * per_worker)) for w in range(concurrency))
+        )
+        return per_worker * concurrency / (time.perf_counter() - started)
+
+    return asyncio.run(main())
+
+
+def main(argv: List[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20_000)
+    parser.add_argument("--concurrency", type=int, default=64)
+    args = parser.parse_args(argv)
+
+    state = _seeded_state()
+    wsgi = MarketDataApp(state=state)
+    asgi = MarketDataASGIApp(wsgi)
+    wsgi_rps = run_wsgi(wsgi, args.requests)
+    asgi_rps = run_asgi(asgi, args.requests, args.concurrency)
+    print(f"wsgi: {wsgi_rps:,.0f} req/s")
+    print(f"asgi: {asgi_rps:,.0f} req/s (concurrency {args.concurrency})")
+    print(f"ratio: {asgi_rps / wsgi_rps:.2f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
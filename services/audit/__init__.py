@@ -1,11 +1,33 @@
 """Audit service package providing tamper-evident logging."""
 
+from .archive import SegmentArchive, SegmentInfo
 from .chain import AuditChain, AuditRecord
 from .db import AuditLogRepository, ensure_schema
+from .merkle import (
+    ConsistencyProof,
+    InclusionProof,
+    MerkleIndex,
+    MerkleProofError,
+    SignedRoot,
+    verify_consistency,
+    verify_inclusion,
+)
+from .query import AuditPage, AuditQuery
 
 __all__ = [
     "AuditChain",
     "AuditRecord",
     "AuditLogRepository",
+    "AuditPage",
+    "AuditQuery",
     "ensure_schema",
+    "ConsistencyProof",
+    "InclusionProof",
+    "MerkleIndex",
+    "MerkleProofError",
+    "SignedRoot",
+    "verify_consistency",
+    "verify_inclusion",
+    "SegmentArchive",
+    "SegmentInfo",
 ]
@@ -0,0 +1,218 @@
+"""Compressed, append-only segment archive for sealed ranges of the audit chain.
+
+Each segment is a gzip-compressed JSON-lines file holding a contiguous id range
+of ``audit_log`` rows. ``manifest.jsonl`` gets one line per segment with its id
+range, time range, head ``prev_hash``, tail ``this_hash`` and file digest, so the
+chain can be stitched back together (and checked) without opening every file.
+"""
+from __future__ import annotations
+
+from dataclasses import asdict, dataclass
+import gzip
+import hashlib
+import json
+import mmap
+import os
+from pathlib import Path
+import sqlite3
+import threading
+from typing import Iterator, List, Optional, Sequence, Tuple
+import zlib
+
+from .chain import AuditChain, AuditRecord, ChainIntegrityError
+from .query import RECORD_COLUMNS, AuditPage, AuditQuery, _canonical_bound
+
+MANIFEST_NAME = "manifest.jsonl"
+_READ_CHUNK = 1 << 16
+
+
+@dataclass(frozen=True)
+class SegmentInfo:
+    """Manifest entry describing one archived segment."""
+
+    file: str
+    first_id: int
+    last_id: int
+    count: int
+    head_prev_hash: str
+    tail_hash: str
+    min_ts: str
+    max_ts: str
+    sha256: str
+
+
+class SegmentArchive:
+    """Directory of sealed audit segments plus their manifest."""
+
+    def __init__(self, directory: str | os.PathLike[str], *, create: bool = True):
+        self._directory = Path(directory)
+        if create:
+            self._directory.mkdir(parents=True, exist_ok=True)
+        self._manifest_path = self._directory / MANIFEST_NAME
+        self._lock = threading.Lock()
+        self._segments: List[SegmentInfo] = self._load_manifest()
+
+    @property
+    def directory(self) -> Path:
+        return self._directory
+
+    @property
+    def segments(self) -> Sequence[SegmentInfo]:
+        with self._lock:
+            return tuple(self._segments)
+
+    @property
+    def last_id(self) -> int:
+        """Highest archived record id, or 0 when nothing is archived."""
+        return self.snapshot()[1]
+
+    def snapshot(self) -> Tuple[Tuple[SegmentInfo, ...], int]:
+        """Return the sealed segments and their highest record id, read together."""
+        with self._lock:
+            segments = tuple(self._segments)
+        return segments, segments[-1].last_id if segments else 0
+
+    @property
+    def tail_hash(self) -> str:
+        segments = self.segments
+        return segments[-1].tail_hash if segments else AuditChain.GENESIS_HASH
+
+    def seal(self, conn: sqlite3.Connection, through_id: int) -> Optional[SegmentInfo]:
+        """Move live rows with ``id <= through_id`` into a new segment.
+
+        The most recent live row is never archived so the table always holds
+        the chain tail that the next append links to. The segment file and its
+        manifest line are made durable before the rows are deleted; if the
+        process dies in between, readers skip the duplicated live rows. The
+        delete runs on ``conn`` without committing; the caller owns the
+        transaction.
+        """
+        newest = conn.execute("SELECT MAX(id) FROM audit_log").fetchone()[0]
+        if newest is None:
+            return None
+        through_id = min(through_id, newest - 1)
+        rows = conn.execute(
+            f"SELECT {RECORD_COLUMNS} FROM audit_log WHERE id > ? AND id <= ? ORDER BY id",
+            (self.last_id, through_id),
+        ).fetchall()
+        if not rows:
+            return None
+        records = [AuditRecord(*row) for row in rows]
+        if records[0].prev_hash != self.tail_hash:
+            raise ChainIntegrityError(
+                f"record {records[0].id} does not link to archived tail {self.tail_hash}"
+            )
+
+        name = f"segment-{records[0].id:012d}-{records[-1].id:012d}.jsonl.gz"
+        path = self._directory / name
+        temp_path = path.with_name(name + ".tmp")
+        digest = hashlib.sha256()
+        with temp_path.open("wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", mtime=0) as handle:
+                for row in rows:
+                    handle.write(json.dumps(list(row), separators=(",", ":")).encode("utf-8") + b"\n")
+            raw.flush()
+            os.fsync(raw.fileno())
+        digest.update(temp_path.read_bytes())
+        os.replace(temp_path, path)
+
+        info = SegmentInfo(
+            file=name,
+            first_id=records[0].id,
+            last_id=records[-1].id,
+            count=len(records),
+            head_prev_hash=records[0].prev_hash,
+            tail_hash=records[-1].this_hash,
+            min_ts=min(record.ts for record in records),
+            max_ts=max(record.ts for record in records),
+            sha256=digest.hexdigest(),
+        )
+        with self._lock:
+            with self._manifest_path.open("a", encoding="utf-8") as manifest:
+                manifest.write(json.dumps(asdict(info), sort_keys=True) + "\n")
+                manifest.flush()
+                os.fsync(manifest.fileno())
+            self._segments.append(info)
+
+        conn.execute("DELETE FROM audit_log WHERE id <= ?", (info.last_id,))
+        return info
+
+    def iter_segment(self, info: SegmentInfo) -> Iterator[AuditRecord]:
+        """Stream records of one segment, decompressing from a memory map."""
+        path = self._directory / info.file
+        with path.open("rb") as handle, mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            decompressor = zlib.decompressobj(wbits=31)
+            pending = b""
+            for offset in range(0, len(mapped), _READ_CHUNK):
+                pending += decompressor.decompress(mapped[offset : offset + _READ_CHUNK])
+                *lines, pending = pending.split(b"\n")
+                for line in lines:
+                    yield AuditRecord(*json.loads(line))
+            pending += decompressor.flush()
+            for line in pending.split(b"\n"):
+                if line:
+                    yield AuditRecord(*json.loads(line))
+
+    def iter_records(
+        self,
+        after_id: int = 0,
+        query: Optional[AuditQuery] = None,
+        *,
+        segments: Optional[Sequence[SegmentInfo]] = None,
+    ) -> Iterator[AuditRecord]:
+        """Stream archived records with ``id > after_id``, skipping whole segments when possible.
+
+        ``segments`` restricts the read to a :meth:`snapshot` taken by the caller.
+        """
+        for info in self.segments if segments is None else segments:
+            if info.last_id <= after_id or (query is not None and not _may_match(info, query)):
+                continue
+            for record in self.iter_segment(info):
+                if record.id > after_id and (query is None or query.matches(record)):
+                    yield record
+
+    def query_page(
+        self,
+        query: AuditQuery,
+        *,
+        after_id: int = 0,
+        limit: int = 100,
+        segments: Optional[Sequence[SegmentInfo]] = None,
+    ) -> AuditPage:
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        records: List[AuditRecord] = []
+        for record in self.iter_records(after_id, query, segments=segments):
+            if len(records) == limit:
+                return AuditPage(records=records, next_after_id=records[-1].id)
+            records.append(record)
+        return AuditPage(records=records, next_after_id=None)
+
+    def verify_files(self) -> None:
+        """Check every segment file against its manifest digest and boundaries."""
+        prev_tail = AuditChain.GENESIS_HASH
+        for info in self.segments:
+            data = (self._directory / info.file).read_bytes()
+            if hashlib.sha256(data).hexdigest() != info.sha256:
+                raise ChainIntegrityError(f"segment {info.file} does not match its manifest digest")
+            if info.head_prev_hash != prev_tail:
+                raise ChainIntegrityError(f"segment {info.file} does not link to the previous segment")
+            prev_tail = info.tail_hash
+
+    def _load_manifest(self) -> List[SegmentInfo]:
+        if not self._manifest_path.exists():
+            return []
+        with self._manifest_path.open("r", encoding="utf-8") as manifest:
+            return [SegmentInfo(**json.loads(line)) for line in manifest if line.strip()]
+
+
+def _may_match(info: SegmentInfo, query: AuditQuery) -> bool:
+    """Prune segments whose time range cannot intersect the query bounds."""
+    if query.since is not None and info.max_ts < _canonical_bound(query.since):
+        return False
+    if query.until is not None and info.min_ts >= _canonical_bound(query.until):
+        return False
+    return True
+
+
+__all__ = ["MANIFEST_NAME", "SegmentArchive", "SegmentInfo"]
@@ -1,33 +1,135 @@
-"""CLI tool to verify audit log integrity."""
+"""CLI tool to verify and query the audit log."""
 from __future__ import annotations
 
 import argparse
+import json
 import sqlite3
 import sys
 
+from .archive import SegmentArchive
 from .chain import ChainIntegrityError
-from .db import AuditLogRepository
+from .db import AuditLogRepository, connect_read_only
+from .query import AuditQuery, record_to_dict
 
 
-def main(argv: list[str] | None = None) -> int:
-    """Entry point for the audit_verify command."""
+def _archive(directory: str | None) -> SegmentArchive | None:
+    return SegmentArchive(directory, create=False) if directory else None
+
+
+def _open(database: str, archive_dir: str | None) -> tuple[sqlite3.Connection, AuditLogRepository]:
+    """Open ``database`` read-only; the CLI never creates schema, indexes or Merkle rows."""
+    conn = connect_read_only(database)
+    try:
+        return conn, AuditLogRepository(conn, read_only=True, archive=_archive(archive_dir))
+    except Exception:
+        conn.close()
+        raise
+
+
+def _verify(argv: list[str]) -> int:
     parser = argparse.ArgumentParser(description="Verify the tamper-evident audit log chain")
     parser.add_argument("database", help="Path to the SQLite database file containing audit_log")
+    parser.add_argument("--archive-dir", help="Directory of archived segments to verify as part of the chain")
     args = parser.parse_args(argv)
 
-    conn = sqlite3.connect(args.database)
     try:
-        repository = AuditLogRepository(conn)
+        conn, repository = _open(args.database, args.archive_dir)
+    except sqlite3.Error as exc:
+        print(f"cannot open audit log: {exc}", file=sys.stderr)
+        return 2
+    try:
         repository.verify()
-        count = conn.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0]
+        count = len(repository.all_records())
         print(f"audit log ok: {count} entries verified")
         return 0
     except ChainIntegrityError as exc:
         print(f"audit log verification failed: {exc}", file=sys.stderr)
         return 1
+    except sqlite3.Error as exc:
+        print(f"cannot read audit log: {exc}", file=sys.stderr)
+        return 2
     finally:
         conn.close()
 
 
+def _parse_payload_filter(raw: str) -> tuple[str, object]:
+    key, sep, value = raw.partition("=")
+    if not sep or not key:
+        raise argparse.ArgumentTypeError("payload filters must look like key=value")
+    try:
+        return key, json.loads(value)
+    except json.JSONDecodeError:
+        return key, value
+
+
+def _query(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(
+        prog="audit_verify query", description="Query audit log entries as JSON lines"
+    )
+    parser.add_argument("database", help="Path to the SQLite database file containing audit_log")
+    parser.add_argument("--actor")
+    parser.add_argument("--action")
+    parser.add_argument("--since", help="Inclusive ISO-8601 lower bound on ts")
+    parser.add_argument("--until", help="Exclusive ISO-8601 upper bound on ts")
+    parser.add_argument(
+        "--payload",
+        action="append",
+        default=[],
+        type=_parse_payload_filter,
+        metavar="KEY=VALUE",
+        help="Match a payload field; VALUE is parsed as JSON when possible",
+    )
+    parser.add_argument("--archive-dir", help="Directory of archived segments to search as well")
+    parser.add_argument("--after-id", type=int, default=0, help="Resume after this record id")
+    parser.add_argument("--limit", type=int, default=100, help="Page size; 0 streams every match")
+    args = parser.parse_args(argv)
+
+    query = AuditQuery(
+        actor=args.actor,
+        action=args.action,
+        since=args.since,
+        until=args.until,
+        payload=dict(args.payload),
+    )
+    try:
+        conn, repository = _open(args.database, args.archive_dir)
+    except sqlite3.Error as exc:
+        print(f"cannot open audit log: {exc}", file=sys.stderr)
+        return 2
+    try:
+        if args.limit:
+            page = repository.query(query, after_id=args.after_id, limit=args.limit)
+            records = page.records
+        else:
+            records = repository.iter_query(query)
+        for record in records:
+            print(json.dumps(record_to_dict(record), sort_keys=True))
+        if args.limit and page.next_after_id is not None:
+            print(f"next page: --after-id {page.next_after_id}", file=sys.stderr)
+        return 0
+    except ValueError as exc:
+        print(f"invalid query: {exc}", file=sys.stderr)
+        return 2
+    except sqlite3.Error as exc:
+        print(f"cannot read audit log: {exc}", file=sys.stderr)
+        return 2
+    finally:
+        conn.close()
+
+
+def main(argv: list[str] | None = None) -> int:
+    """Entry point for the audit_verify command.
+
+    ``audit_verify DB`` (or ``audit_verify verify DB``) checks the chain, and
+    ``audit_verify query DB [filters]`` prints matching records.
+    """
+    args = list(sys.argv[1:] if argv is None else argv)
+    if args and args[0] == "query":
+        return _query(args[1:])
+    if args and args[0] == "verify":
+        args = args[1:]
+    return _verify(args)
+
+
 if __name__ == "__main__":  # pragma: no cover - CLI passthrough
     sys.exit(main())
@@ -3,9 +3,28 @@ from __future__ import annotations
 
 from datetime import datetime, timezone
 import json
+import os
+from pathlib import Path
 import sqlite3
+from typing import Callable, Iterable, Iterator, Optional, Sequence, Tuple, TypeVar
 
+from .archive import SegmentArchive, SegmentInfo
 from .chain import AuditChain, AuditRecord
+from .merkle import ConsistencyProof, InclusionProof, MerkleIndex, SignedRoot
+from .query import (
+    RECORD_COLUMNS,
+    AuditPage,
+    AuditQuery,
+    ensure_indexes,
+    ensure_payload_index,
+    iter_query,
+    query_page,
+)
+
+AuditEntry = Tuple[str, str, object, Optional[datetime]]
+T = TypeVar("T")
+
+_SELECT_LIVE = f"SELECT {RECORD_COLUMNS} FROM audit_log WHERE id > ? ORDER BY id"
 
 SCHEMA = """
 CREATE TABLE IF NOT EXISTS audit_log (
@@ -21,23 +40,89 @@ CREATE TABLE IF NOT EXISTS audit_log (
 
 
 def ensure_schema(conn: sqlite3.Connection) -> None:
-    """Ensure the audit_log table exists."""
+    """Ensure the audit_log table and its secondary indexes exist."""
     conn.execute(SCHEMA)
+    ensure_indexes(conn)
     conn.commit()
 
 
+def configure_connection(conn: sqlite3.Connection, *, busy_timeout_ms: int = 5000) -> None:
+    """Apply the pragmas used by long-lived audit connections.
+
+    WAL lets readers proceed while the writer appends, and ``synchronous=NORMAL``
+    only fsyncs at checkpoints, which is still durable across application
+    crashes in WAL mode.
+    """
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+    conn.execute("PRAGMA temp_store=MEMORY")
+
+
+def connect_read_only(path: str | os.PathLike[str]) -> sqlite3.Connection:
+    """Open the audit database with ``mode=ro``, so nothing can be written to it."""
+    return sqlite3.connect(f"{Path(path).resolve().as_uri()}?mode=ro", uri=True)
+
+
 class AuditLogRepository:
-    """Repository providing append-only access to the audit log."""
+    """Repository providing append-only access to the audit log.
+
+    ``read_only=True`` skips schema, index and Merkle backfill work and rejects
+    writes; pair it with :func:`connect_read_only` for inspection tools.
+    """
 
-    def __init__(self, conn: sqlite3.Connection):
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        *,
+        signing_key: bytes | None = None,
+        sign_every: int = 0,
+        create_schema: bool = True,
+        archive: SegmentArchive | None = None,
+        read_only: bool = False,
+    ):
+        if sign_every < 0:
+            raise ValueError("sign_every must be non-negative")
         self._conn = conn
-        ensure_schema(self._conn)
+        self._read_only = read_only
+        create_schema = create_schema and not read_only
+        if create_schema:
+            ensure_schema(self._conn)
+        self._merkle = MerkleIndex(self._conn, create_schema=create_schema)
+        self._signing_key = signing_key
+        self._sign_every = sign_every
+        self._archive = archive
+        if create_schema and self._merkle.backfill():
+            self._conn.commit()
 
     def append(self, actor: str, action: str, payload: object, ts: datetime | None = None) -> AuditRecord:
         """Append a new audit entry."""
+        self._check_writable()
+        record = self._insert(self._previous_hash(), actor, action, payload, ts)
+        self._conn.commit()
+        return record
+
+    def append_many(self, entries: Iterable[AuditEntry]) -> list[AuditRecord]:
+        """Append ``(actor, action, payload, ts)`` entries in a single transaction."""
+        self._check_writable()
+        records: list[AuditRecord] = []
+        prev_hash = self._previous_hash()
+        try:
+            for actor, action, payload, ts in entries:
+                record = self._insert(prev_hash, actor, action, payload, ts)
+                records.append(record)
+                prev_hash = record.this_hash
+        except Exception:
+            self._conn.rollback()
+            raise
+        self._conn.commit()
+        return records
+
+    def _insert(
+        self, prev_hash: str, actor: str, action: str, payload: object, ts: datetime | None
+    ) -> AuditRecord:
         timestamp = self._canonical_timestamp(ts)
         payload_json = self._canonical_payload(payload)
-        prev_hash = self._previous_hash()
         this_hash = AuditChain.compute_hash(prev_hash, timestamp, actor, action, payload_json)
         cursor = self._conn.execute(
             """
@@ -46,27 +131,155 @@ class AuditLogRepository:
             """,
             (timestamp, actor, action, payload_json, prev_hash, this_hash),
         )
-        self._conn.commit()
         rowid = cursor.lastrowid
+        leaf_index = self._merkle.append(rowid, this_hash)
+        if self._signing_key and self._sign_every and (leaf_index + 1) % self._sign_every == 0:
+            self._merkle.record_signed_root(self._signing_key)
         return AuditRecord(rowid, timestamp, actor, action, payload_json, prev_hash, this_hash)
 
     def all_records(self) -> AuditChain:
-        """Return all audit records ordered by id."""
-        cursor = self._conn.execute(
-            "SELECT id, ts, actor, action, payload_json, prev_hash, this_hash FROM audit_log ORDER BY id"
-        )
-        rows = cursor.fetchall()
-        return AuditChain.from_rows(rows)
+        """Return all audit records ordered by id, archived segments first."""
+        if self._archive is None:
+            return AuditChain.from_rows(self._conn.execute(_SELECT_LIVE, (0,)).fetchall())
+
+        def read(segments: Sequence[SegmentInfo], archived_through: int) -> AuditChain:
+            archived = list(self._archive.iter_records(segments=segments))
+            rows = self._conn.execute(_SELECT_LIVE, (archived_through,)).fetchall()
+            return AuditChain(archived + list(AuditChain.from_rows(rows)))
+
+        return self._consistent(read)
+
+    def query(self, query: AuditQuery | None = None, *, after_id: int = 0, limit: int = 100) -> AuditPage:
+        """Return one keyset-paginated page of records matching ``query``."""
+        if limit < 1:
+            raise ValueError("limit must be positive")
+        query = query or AuditQuery()
+        if self._archive is None:
+            return query_page(self._conn, query, after_id=after_id, limit=limit)
+
+        def read(segments: Sequence[SegmentInfo], archived_through: int) -> AuditPage:
+            if after_id >= archived_through:
+                return query_page(self._conn, query, after_id=after_id, limit=limit)
+            page = self._archive.query_page(query, after_id=after_id, limit=limit, segments=segments)
+            if page.next_after_id is not None:
+                return page
+            remaining = limit - len(page.records)
+            if remaining == 0:
+                live = query_page(self._conn, query, after_id=archived_through, limit=1)
+                return AuditPage(page.records, page.records[-1].id if live.records else None)
+            live = query_page(self._conn, query, after_id=archived_through, limit=remaining)
+            records = list(page.records) + list(live.records)
+            next_after_id = records[-1].id if live.next_after_id is not None else None
+            return AuditPage(records=records, next_after_id=next_after_id)
+
+        return self._consistent(read)
+
+    def iter_query(self, query: AuditQuery | None = None, *, page_size: int = 500) -> Iterator[AuditRecord]:
+        """Stream records matching ``query`` without loading the whole table."""
+        query = query or AuditQuery()
+        if self._archive is None:
+            yield from iter_query(self._conn, query, page_size=page_size)
+            return
+        segments, cursor = self._archive.snapshot()
+        yield from self._archive.iter_records(query=query, segments=segments)
+        while True:
+            segments, archived_through = self._archive.snapshot()
+            if archived_through > cursor:
+                # Rows sealed since the last page now live in the archive.
+                yield from self._archive.iter_records(cursor, query, segments=segments)
+                cursor = archived_through
+            page = query_page(self._conn, query, after_id=cursor, limit=page_size)
+            if self._archive.last_id != archived_through:
+                continue
+            yield from page.records
+            if page.next_after_id is None:
+                return
+            cursor = page.next_after_id
+
+    def index_payload_key(self, key: str) -> str:
+        """Add an expression index so payload filters on ``key`` avoid table scans."""
+        self._check_writable()
+        name = ensure_payload_index(self._conn, key)
+        self._conn.commit()
+        return name
 
     def verify(self) -> None:
-        """Verify the integrity of the stored chain."""
+        """Verify the integrity of the stored chain, including archived segments."""
+        if self._archive is not None:
+            self._archive.verify_files()
         chain = self.all_records()
         chain.verify()
 
+    def archive_through(self, record_id: int) -> SegmentInfo | None:
+        """Seal live records up to ``record_id`` into a compressed segment."""
+        self._check_writable()
+        if self._archive is None:
+            raise ValueError("no segment archive is configured")
+        try:
+            info = self._archive.seal(self._conn, record_id)
+        except Exception:
+            self._conn.rollback()
+            raise
+        self._conn.commit()
+        return info
+
+    def rotate(self, keep_live: int) -> SegmentInfo | None:
+        """Archive everything except the newest ``keep_live`` live records."""
+        if keep_live < 1:
+            raise ValueError("keep_live must be at least 1")
+        row = self._conn.execute(
+            "SELECT id FROM audit_log ORDER BY id DESC LIMIT 1 OFFSET ?", (keep_live,)
+        ).fetchone()
+        if row is None:
+            return None
+        return self.archive_through(row[0])
+
+    def _check_writable(self) -> None:
+        if self._read_only:
+            raise ValueError("audit log repository is read-only")
+
+    def _consistent(self, read: Callable[[Sequence[SegmentInfo], int], T]) -> T:
+        """Run ``read`` on one ``(segments, last_id)`` archive snapshot.
+
+        A seal that lands while ``read`` runs may delete live rows the snapshot
+        still treats as live, so the read is repeated on the new snapshot.
+        """
+        while True:
+            segments, archived_through = self._archive.snapshot()
+            result = read(segments, archived_through)
+            if self._archive.last_id == archived_through:
+                return result
+
+    @property
+    def merkle(self) -> MerkleIndex:
+        """Merkle index maintained alongside the hash chain."""
+        return self._merkle
+
+    def merkle_root(self, tree_size: int | None = None) -> str:
+        """Return the Merkle root over the first ``tree_size`` records."""
+        return self._merkle.root(tree_size)
+
+    def inclusion_proof(self, record_id: int, tree_size: int | None = None) -> InclusionProof:
+        """Return an O(log n) proof that ``record_id`` is part of the tree."""
+        return self._merkle.inclusion_proof(record_id, tree_size)
+
+    def consistency_proof(self, old_size: int, new_size: int | None = None) -> ConsistencyProof:
+        """Return a proof that the tree of ``old_size`` is a prefix of ``new_size``."""
+        return self._merkle.consistency_proof(old_size, new_size)
+
+    def sign_root(self, key: bytes | None = None) -> SignedRoot:
+        """Sign and persist the current Merkle root."""
+        signing_key = key or self._signing_key
+        if not signing_key:
+            raise ValueError("a signing key is required to sign the merkle root")
+        signed = self._merkle.record_signed_root(signing_key)
+        self._conn.commit()
+        return signed
+
     def _previous_hash(self) -> str:
         row = self._conn.execute("SELECT this_hash FROM audit_log ORDER BY id DESC LIMIT 1").fetchone()
         if row is None:
-            return AuditChain.GENESIS_HASH
+            return self._archive.tail_hash if self._archive is not None else AuditChain.GENESIS_HASH
         return row[0]
 
     @staticmethod
@@ -88,4 +301,4 @@ class AuditLogRepository:
         return json.dumps(parsed, sort_keys=True, separators=(",", ":"))
 
 
-__all__ = ["AuditLogRepository", "ensure_schema", "SCHEMA"]
+__all__ = ["AuditEntry", "AuditLogRepository", "configure_connection", "connect_read_only", "ensure_schema", "SCHEMA"]
@@ -0,0 +1,352 @@
+"""Merkle tree index maintained alongside the audit log hash chain.
+
+The tree follows the RFC 6962 / RFC 9162 layout: leaves are hashed with a
+``0x00`` prefix and interior nodes with a ``0x01`` prefix, and trees whose size
+is not a power of two are split at the largest power of two smaller than the
+size. Only perfect, aligned subtrees are persisted so every append touches
+O(log n) rows and every proof is assembled from O(log n) lookups.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import hashlib
+import hmac
+import sqlite3
+from typing import Callable, List, Optional, Sequence
+
+MERKLE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS audit_merkle_leaf (
+    record_id INTEGER PRIMARY KEY,
+    leaf_index INTEGER NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS audit_merkle_node (
+    level INTEGER NOT NULL,
+    idx INTEGER NOT NULL,
+    hash TEXT NOT NULL,
+    PRIMARY KEY (level, idx)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS audit_merkle_root (
+    tree_size INTEGER PRIMARY KEY,
+    root_hash TEXT NOT NULL,
+    signed_at TEXT NOT NULL,
+    signature TEXT NOT NULL
+);
+"""
+
+EMPTY_ROOT = hashlib.sha256(b"").hexdigest()
+
+
+class MerkleProofError(ValueError):
+    """Raised when a proof cannot be produced for the requested tree state."""
+
+
+def leaf_hash(record_hash: str) -> str:
+    """Return the Merkle leaf hash for an audit record's ``this_hash``."""
+    return hashlib.sha256(b"\x00" + bytes.fromhex(record_hash)).hexdigest()
+
+
+def node_hash(left: str, right: str) -> str:
+    """Return the interior node hash combining two child hashes."""
+    return hashlib.sha256(b"\x01" + bytes.fromhex(left) + bytes.fromhex(right)).hexdigest()
+
+
+def _split(size: int) -> int:
+    """Largest power of two strictly smaller than ``size`` (``size`` > 1)."""
+    return 1 << ((size - 1).bit_length() - 1)
+
+
+SubtreeHash = Callable[[int, int], str]
+
+
+def inclusion_path(index: int, start: int, end: int, subtree: SubtreeHash) -> List[str]:
+    """RFC 6962 ``PATH`` for leaf ``index`` within leaves ``[start, end)``."""
+    if end - start <= 1:
+        return []
+    k = _split(end - start)
+    if index < start + k:
+        return inclusion_path(index, start, start + k, subtree) + [subtree(start + k, end)]
+    return inclusion_path(index, start + k, end, subtree) + [subtree(start, start + k)]
+
+
+def consistency_path(old_size: int, start: int, end: int, subtree: SubtreeHash, complete: bool = True) -> List[str]:
+    """RFC 6962 ``SUBPROOF`` between the first ``old_size`` leaves and ``[start, end)``."""
+    if old_size == end - start:
+        return [] if complete else [subtree(start, end)]
+    k = _split(end - start)
+    if old_size <= k:
+        return consistency_path(old_size, start, start + k, subtree, complete) + [subtree(start + k, end)]
+    return consistency_path(old_size - k, start + k, end, subtree, False) + [subtree(start, start + k)]
+
+
+def verify_inclusion(leaf: str, index: int, tree_size: int, path: Sequence[str], root: str) -> bool:
+    """Check an inclusion proof following RFC 9162 section 2.1.3.2."""
+    if index < 0 or index >= tree_size:
+        return False
+    fn, sn, result = index, tree_size - 1, leaf
+    for sibling in path:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            result = node_hash(sibling, result)
+            while not fn & 1 and fn != 0:
+                fn >>= 1
+                sn >>= 1
+        else:
+            result = node_hash(result, sibling)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and hmac.compare_digest(result, root)
+
+
+def verify_consistency(old_size: int, new_size: int, old_root: str, new_root: str, path: Sequence[str]) -> bool:
+    """Check a consistency proof following RFC 9162 section 2.1.4.2."""
+    if old_size < 0 or old_size > new_size:
+        return False
+    if old_size == new_size:
+        return not path and hmac.compare_digest(old_root, new_root)
+    if old_size == 0:
+        return not path
+    if not path:
+        return False
+    nodes = list(path)
+    if old_size & (old_size - 1) == 0:
+        nodes.insert(0, old_root)
+    fn, sn = old_size - 1, new_size - 1
+    while fn & 1:
+        fn >>= 1
+        sn >>= 1
+    first = second = nodes[0]
+    for sibling in nodes[1:]:
+        if sn == 0:
+            return False
+        if fn & 1 or fn == sn:
+            first = node_hash(sibling, first)
+            second = node_hash(sibling, second)
+            while not fn & 1 and fn != 0:
+                fn >>= 1
+                sn >>= 1
+        else:
+            second = node_hash(second, sibling)
+        fn >>= 1
+        sn >>= 1
+    return sn == 0 and hmac.compare_digest(first, old_root) and hmac.compare_digest(second, new_root)
+
+
+def sign_root(key: bytes, tree_size: int, root_hash: str, signed_at: str) -> str:
+    """HMAC-SHA256 signature binding a tree size, root hash and signing time."""
+    message = f"{tree_size}:{root_hash}:{signed_at}".encode("utf-8")
+    return hmac.new(key, message, hashlib.sha256).hexdigest()
+
+
+@dataclass(frozen=True)
+class InclusionProof:
+    """Audit path proving that a record's leaf is part of a tree of ``tree_size``."""
+
+    record_id: int
+    leaf_index: int
+    tree_size: int
+    leaf_hash: str
+    path: tuple[str, ...]
+    root_hash: str
+
+    def verify(self, record_hash: Optional[str] = None) -> bool:
+        """Verify the proof, optionally recomputing the leaf from ``record_hash``."""
+        leaf = leaf_hash(record_hash) if record_hash is not None else self.leaf_hash
+        return verify_inclusion(leaf, self.leaf_index, self.tree_size, self.path, self.root_hash)
+
+
+@dataclass(frozen=True)
+class ConsistencyProof:
+    """Proof that the tree of ``old_size`` is a prefix of the tree of ``new_size``."""
+
+    old_size: int
+    new_size: int
+    old_root: str
+    new_root: str
+    path: tuple[str, ...]
+
+    def verify(self) -> bool:
+        return verify_consistency(self.old_size, self.new_size, self.old_root, self.new_root, self.path)
+
+
+@dataclass(frozen=True)
+class SignedRoot:
+    """Merkle root checkpoint signed with the audit signing key."""
+
+    tree_size: int
+    root_hash: str
+    signed_at: str
+    signature: str
+
+    def verify(self, key: bytes) -> bool:
+        expected = sign_root(key, self.tree_size, self.root_hash, self.signed_at)
+        return hmac.compare_digest(expected, self.signature)
+
+
+def ensure_merkle_schema(conn: sqlite3.Connection) -> None:
+    """Ensure the Merkle index tables exist."""
+    conn.executescript(MERKLE_SCHEMA)
+
+
+class MerkleIndex:
+    """SQLite persisted Merkle tree over audit log leaves.
+
+    The index never commits on its own; callers append leaves inside the same
+    transaction that inserts the audit row so the tree and chain stay in step.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, *, create_schema: bool = True):
+        self._conn = conn
+        if create_schema:
+            ensure_merkle_schema(self._conn)
+
+    @property
+    def size(self) -> int:
+        row = self._conn.execute("SELECT COALESCE(MAX(leaf_index) + 1, 0) FROM audit_merkle_leaf").fetchone()
+        return int(row[0])
+
+    def append(self, record_id: int, record_hash: str) -> int:
+        """Add the leaf for ``record_id`` and update the perfect subtrees it completes."""
+        index = self.size
+        self._conn.execute(
+            "INSERT INTO audit_merkle_leaf (record_id, leaf_index) VALUES (?, ?)", (record_id, index)
+        )
+        current = leaf_hash(record_hash)
+        nodes = [(0, index, current)]
+        level, position = 0, index
+        while position & 1:
+            left = self._node(level, position - 1)
+            current = node_hash(left, current)
+            level += 1
+            position >>= 1
+            nodes.append((level, position, current))
+        self._conn.executemany("INSERT INTO audit_merkle_node (level, idx, hash) VALUES (?, ?, ?)", nodes)
+        return index
+
+    def backfill(self) -> int:
+        """Index any audit_log rows that predate the Merkle tables."""
+        rows = self._conn.execute(
+            """
+            SELECT a.id, a.this_hash FROM audit_log AS a
+            WHERE a.id > COALESCE((SELECT MAX(record_id) FROM audit_merkle_leaf), 0)
+            ORDER BY a.id
+            """
+        ).fetchall()
+        for record_id, record_hash in rows:
+            self.append(record_id, record_hash)
+        return len(rows)
+
+    def leaf_index(self, record_id: int) -> int:
+        row = self._conn.execute(
+            "SELECT leaf_index FROM audit_merkle_leaf WHERE record_id = ?", (record_id,)
+        ).fetchone()
+        if row is None:
+            raise MerkleProofError(f"record {record_id} is not indexed")
+        return int(row[0])
+
+    def root(self, tree_size: Optional[int] = None) -> str:
+        """Return the root hash of the first ``tree_size`` leaves (default: all)."""
+        size = self._resolve_size(tree_size)
+        if size == 0:
+            return EMPTY_ROOT
+        return self._subtree(0, size)
+
+    def inclusion_proof(self, record_id: int, tree_size: Optional[int] = None) -> InclusionProof:
+        size = self._resolve_size(tree_size)
+        index = self.leaf_index(record_id)
+        if index >= size:
+            raise MerkleProofError(f"record {record_id} is not part of a tree of size {size}")
+        path = inclusion_path(index, 0, size, self._subtree)
+        return InclusionProof(
+            record_id=record_id,
+            leaf_index=index,
+            tree_size=size,
+            leaf_hash=self._node(0, index),
+            path=tuple(path),
+            root_hash=self._subtree(0, size),
+        )
+
+    def consistency_proof(self, old_size: int, new_size: Optional[int] = None) -> ConsistencyProof:
+        size = self._resolve_size(new_size)
+        if old_size < 0 or old_size > size:
+            raise MerkleProofError(f"cannot prove consistency from size {old_size} to {size}")
+        path = consistency_path(old_size, 0, size, self._subtree) if 0 < old_size < size else []
+        return ConsistencyProof(
+            old_size=old_size,
+            new_size=size,
+            old_root=self.root(old_size),
+            new_root=self.root(size),
+            path=tuple(path),
+        )
+
+    def record_signed_root(self, key: bytes, signed_at: Optional[datetime] = None) -> SignedRoot:
+        """Sign the current root and persist it as a checkpoint."""
+        size = self.size
+        root_hash = self.root(size)
+        moment = (signed_at or datetime.now(timezone.utc)).astimezone(timezone.utc)
+        timestamp = moment.isoformat(timespec="microseconds")
+        signature = sign_root(key, size, root_hash, timestamp)
+        self._conn.execute(
+            """
+            INSERT OR REPLACE INTO audit_merkle_root (tree_size, root_hash, signed_at, signature)
+            VALUES (?, ?, ?, ?)
+            """,
+            (size, root_hash, timestamp, signature),
+        )
+        return SignedRoot(size, root_hash, timestamp, signature)
+
+    def signed_roots(self) -> List[SignedRoot]:
+        rows = self._conn.execute(
+            "SELECT tree_size, root_hash, signed_at, signature FROM audit_merkle_root ORDER BY tree_size"
+        ).fetchall()
+        return [SignedRoot(*row) for row in rows]
+
+    def latest_signed_root(self) -> Optional[SignedRoot]:
+        row = self._conn.execute(
+            """
+            SELECT tree_size, root_hash, signed_at, signature FROM audit_merkle_root
+            ORDER BY tree_size DESC LIMIT 1
+            """
+        ).fetchone()
+        return SignedRoot(*row) if row else None
+
+    def _resolve_size(self, tree_size: Optional[int]) -> int:
+        current = self.size
+        if tree_size is None:
+            return current
+        if tree_size < 0 or tree_size > current:
+            raise MerkleProofError(f"tree size {tree_size} is outside the indexed range 0..{current}")
+        return tree_size
+
+    def _node(self, level: int, index: int) -> str:
+        row = self._conn.execute(
+            "SELECT hash FROM audit_merkle_node WHERE level = ? AND idx = ?", (level, index)
+        ).fetchone()
+        if row is None:
+            raise MerkleProofError(f"missing merkle node at level {level} index {index}")
+        return row[0]
+
+    def _subtree(self, start: int, end: int) -> str:
+        """Hash of leaves ``[start, end)`` built from the stored perfect subtrees."""
+        width = end - start
+        if width & (width - 1) == 0 and start % width == 0:
+            return self._node(width.bit_length() - 1, start // width)
+        k = _split(width)
+        return node_hash(self._subtree(start, start + k), self._subtree(start + k, end))
+
+
+__all__ = [
+    "ConsistencyProof",
+    "EMPTY_ROOT",
+    "InclusionProof",
+    "MERKLE_SCHEMA",
+    "MerkleIndex",
+    "MerkleProofError",
+    "SignedRoot",
+    "ensure_merkle_schema",
+    "leaf_hash",
+    "node_hash",
+    "verify_consistency",
+    "verify_inclusion",
+]
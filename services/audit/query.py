@@ -0,0 +1,183 @@
+"""Indexed, paginated lookups over the audit log."""
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+import json
+import re
+import sqlite3
+from typing import Dict, Iterator, List, Mapping, Optional, Sequence, Tuple
+
+from .chain import AuditRecord
+
+INDEXES: Tuple[str, ...] = (
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_actor ON audit_log (actor)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_action ON audit_log (action)",
+    "CREATE INDEX IF NOT EXISTS idx_audit_log_ts ON audit_log (ts)",
+)
+
+RECORD_COLUMNS = "id, ts, actor, action, payload_json, prev_hash, this_hash"
+
+_PAYLOAD_KEY = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*(\.[A-Za-z_][A-Za-z0-9_]*)*$")
+
+
+def ensure_indexes(conn: sqlite3.Connection) -> None:
+    """Create the secondary indexes used by :func:`query_page`."""
+    for statement in INDEXES:
+        conn.execute(statement)
+
+
+def _payload_expression(key: str) -> str:
+    """SQL expression extracting ``key`` from the payload.
+
+    The path is inlined rather than bound so the planner can match it against
+    an expression index created by :func:`ensure_payload_index`.
+    """
+    if not _PAYLOAD_KEY.match(key):
+        raise ValueError(f"invalid payload key {key!r}")
+    return f"json_extract(payload_json, '$.{key}')"
+
+
+def ensure_payload_index(conn: sqlite3.Connection, key: str) -> str:
+    """Create an expression index for a frequently queried payload ``key``."""
+    expression = _payload_expression(key)
+    name = "idx_audit_log_payload_" + key.replace(".", "__")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {name} ON audit_log ({expression})")
+    return name
+
+
+def _canonical_bound(value: datetime | str) -> str:
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        raise ValueError("time range bounds must be timezone aware")
+    return value.astimezone(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _lookup(document: object, key: str) -> object:
+    for part in key.split("."):
+        if not isinstance(document, dict):
+            return None
+        document = document.get(part)
+    return document
+
+
+@dataclass(frozen=True)
+class AuditQuery:
+    """Filters applied to the audit log; every field is optional."""
+
+    actor: Optional[str] = None
+    action: Optional[str] = None
+    since: Optional[datetime | str] = None
+    until: Optional[datetime | str] = None
+    payload: Mapping[str, object] = field(default_factory=dict)
+
+    def matches(self, record: AuditRecord) -> bool:
+        """Evaluate the filters in Python, for records outside the SQLite table."""
+        if self.actor is not None and record.actor != self.actor:
+            return False
+        if self.action is not None and record.action != self.action:
+            return False
+        if self.since is not None and record.ts < _canonical_bound(self.since):
+            return False
+        if self.until is not None and record.ts >= _canonical_bound(self.until):
+            return False
+        if self.payload:
+            document = json.loads(record.payload_json) if record.payload_json else None
+            for key, value in self.payload.items():
+                _payload_expression(key)
+                if _lookup(document, key) != value:
+                    return False
+        return True
+
+    def where_clause(self) -> Tuple[List[str], List[object]]:
+        clauses: List[str] = []
+        params: List[object] = []
+        if self.actor is not None:
+            clauses.append("actor = ?")
+            params.append(self.actor)
+        if self.action is not None:
+            clauses.append("action = ?")
+            params.append(self.action)
+        if self.since is not None:
+            clauses.append("ts >= ?")
+            params.append(_canonical_bound(self.since))
+        if self.until is not None:
+            clauses.append("ts < ?")
+            params.append(_canonical_bound(self.until))
+        for key, value in self.payload.items():
+            if isinstance(value, (dict, list)):
+                raise ValueError("payload filters only support scalar values")
+            if value is None:
+                clauses.append(f"{_payload_expression(key)} IS NULL")
+            else:
+                clauses.append(f"{_payload_expression(key)} = ?")
+                params.append(value)
+        return clauses, params
+
+
+@dataclass(frozen=True)
+class AuditPage:
+    """One page of query results plus the cursor for the next page."""
+
+    records: Sequence[AuditRecord]
+    next_after_id: Optional[int]
+
+
+def _row_to_record(row: Sequence[object]) -> AuditRecord:
+    return AuditRecord(*row)  # type: ignore[arg-type]
+
+
+def query_page(
+    conn: sqlite3.Connection, query: AuditQuery, *, after_id: int = 0, limit: int = 100
+) -> AuditPage:
+    """Return up to ``limit`` records with ``id > after_id`` matching ``query``.
+
+    Pagination is keyset based, so each page costs an index seek rather than
+    an ``OFFSET`` scan over the preceding rows.
+    """
+    if limit < 1:
+        raise ValueError("limit must be positive")
+    clauses, params = query.where_clause()
+    clauses.append("id > ?")
+    params.append(after_id)
+    sql = f"SELECT {RECORD_COLUMNS} FROM audit_log WHERE {' AND '.join(clauses)} ORDER BY id LIMIT ?"
+    rows = conn.execute(sql, (*params, limit + 1)).fetchall()
+    records = [_row_to_record(row) for row in rows[:limit]]
+    next_after_id = records[-1].id if len(rows) > limit else None
+    return AuditPage(records=records, next_after_id=next_after_id)
+
+
+def iter_query(
+    conn: sqlite3.Connection, query: AuditQuery, *, after_id: int = 0, page_size: int = 500
+) -> Iterator[AuditRecord]:
+    """Stream every matching record, fetching ``page_size`` rows at a time."""
+    cursor: Optional[int] = after_id
+    while cursor is not None:
+        page = query_page(conn, query, after_id=cursor, limit=page_size)
+        yield from page.records
+        cursor = page.next_after_id
+
+
+def record_to_dict(record: AuditRecord) -> Dict[str, object]:
+    return {
+        "id": record.id,
+        "ts": record.ts,
+        "actor": record.actor,
+        "action": record.action,
+        "payload_json": record.payload_json,
+        "prev_hash": record.prev_hash,
+        "this_hash": record.this_hash,
+    }
+
+
+__all__ = [
+    "AuditPage",
+    "AuditQuery",
+    "INDEXES",
+    "ensure_indexes",
+    "ensure_payload_index",
+    "iter_query",
+    "query_page",
+    "record_to_dict",
+]
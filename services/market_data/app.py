@@ -3,27 +3,59 @@ from __future__ import annotations
 
 import json
 import os
-from dataclasses import dataclass
+from dataclasses import dataclass, replace
 from datetime import datetime, timezone
-from typing import Dict, Mapping, Optional, Tuple
+from typing import Dict, Iterator, Mapping, Optional, Tuple
 from urllib.parse import parse_qs
 
 from .providers.banxico_fix import BanxicoFixClient, BanxicoFixError, BanxicoFixQuote
 from .providers.manual_iv_store import ManualIVEntry, ManualIVStore
+from .metrics import MarketDataMetrics
+from .persistence import MarketDataPersistence
 from .providers.manual_spot_store import ManualSpotEntry, ManualSpotStore
+from .response_cache import CACHEABLE_SOURCES, EncodedResponse, ResponseCache, cache_key, encode_response
+from .stream import MarketDataBroker, Subscription
+from .surface import tenor_to_years
+
+ROUTES = frozenset({"/fx/spot", "/iv/atm", "/fx/spot/batch", "/iv/surface"})
+
+JSON_HEADERS: Tuple[Tuple[str, str], ...] = (("Content-Type", "application/json"),)
+
+SSE_HEADERS: Tuple[Tuple[str, str], ...] = (
+    ("Content-Type", "text/event-stream"),
+    ("Cache-Control", "no-cache"),
+    ("X-Accel-Buffering", "no"),
+)
 
 
 @dataclass
 class Response:
     status: int
     body: Dict[str, object]
-    headers: Tuple[Tuple[str, str], ...] = (("Content-Type", "application/json"),)
+    headers: Tuple[Tuple[str, str], ...] = JSON_HEADERS
+
+    @property
+    def status_line(self) -> str:
+        return f"{self.status} {HTTP_STATUS_TEXT.get(self.status, 'OK')}"
+
+    def encode(self, *, age_pair: Optional[str] = None) -> EncodedResponse:
+        headers = self.headers
+        if age_pair is not None:
+            headers = tuple(header for header in headers if header[0] != "Age")
+        source = self.body.get("source")
+        return encode_response(
+            self.status,
+            self.status_line,
+            self.body,
+            headers,
+            age_pair=age_pair,
+            source=source if isinstance(source, str) else None,
+        )
 
     def to_wsgi(self) -> Tuple[str, list[Tuple[str, str]], bytes]:
         payload = json.dumps(self.body).encode("utf-8")
-        status_line = f"{self.status} {HTTP_STATUS_TEXT.get(self.status, 'OK')}"
         headers = list(self.headers) + [("Content-Length", str(len(payload)))]
-        return status_line, headers, payload
+        return self.status_line, headers, payload
 
 
 HTTP_STATUS_TEXT = {
@@ -41,14 +73,61 @@ def _to_iso(value: datetime) -> str:
     return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
 
 
+def _split_list(value: Optional[str]) -> list[str]:
+    """Parse a comma separated query value into unique, upper-cased keys."""
+    if not value:
+        return []
+    items: list[str] = []
+    for raw in value.split(","):
+        item = raw.strip().upper()
+        if item and item not in items:
+            items.append(item)
+    return items
+
+
+def _parse_as_of(value: str) -> Optional[datetime]:
+    # A literal "+" in a query string decodes to a space.
+    candidate = value.strip().replace(" ", "+").replace("Z", "+00:00")
+    try:
+        parsed = datetime.fromisoformat(candidate)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed
+
+
 class ServiceState:
     """Container holding shared dependencies for the service."""
 
-    def __init__(self) -> None:
-        token = os.getenv("BANXICO_TOKEN")
-        self.banxico_client = BanxicoFixClient(token=token)
+    def __init__(self, banxico_client: Optional[BanxicoFixClient] = None) -> None:
+        if banxico_client is None:
+            token = os.getenv("BANXICO_TOKEN")
+            banxico_client = BanxicoFixClient(token=token)
+            if token and os.getenv("BANXICO_BACKGROUND_REFRESH", "true").lower() != "false":
+                banxico_client.start()
+        # An injected client is wired like the default one; starting it is up to the caller.
+        self.banxico_client = banxico_client
         self.manual_spot_store = ManualSpotStore()
         self.manual_iv_store = ManualIVStore()
+        self.persistence: Optional[MarketDataPersistence] = None
+        state_dir = os.getenv("MARKET_DATA_STATE_DIR")
+        if state_dir:
+            self.persistence = MarketDataPersistence(state_dir)
+            self.persistence.bind(self.manual_spot_store, self.manual_iv_store)
+        self.stream = MarketDataBroker()
+        self.manual_spot_store.add_listener(self.stream.on_manual_spot)
+        self.manual_iv_store.add_listener(self.stream.on_manual_iv)
+        self.banxico_client.add_listener(self.stream.on_banxico_fix)
+        self.metrics = MarketDataMetrics()
+        self.manual_spot_store.add_listener(self.metrics.on_manual_spot)
+        self.manual_iv_store.add_listener(self.metrics.on_manual_iv)
+        self.banxico_client.add_listener(self.metrics.on_banxico_fix)
+        self.banxico_client.add_fetch_observer(self.metrics.record_upstream)
+        self.response_cache = ResponseCache()
+        self.manual_spot_store.add_listener(lambda pair, _entry: self.response_cache.invalidate(pair))
+        self.manual_iv_store.add_surface_listener(self.response_cache.invalidate)
+        self.banxico_client.add_listener(lambda pair, _quote: self.response_cache.invalidate(pair))
 
 
 class MarketDataApp:
@@ -57,15 +136,17 @@ class MarketDataApp:
     def __init__(self, state: Optional[ServiceState] = None) -> None:
         self.state = state or ServiceState()
 
-    def __call__(self, environ, start_response):  # pragma: no cover - WSGI adapter
+    def __call__(self, environ, start_response):
         method = environ.get("REQUEST_METHOD", "GET").upper()
         path = environ.get("PATH_INFO", "")
         query_params = parse_qs(environ.get("QUERY_STRING", ""))
         flat_query = {key: values[-1] for key, values in query_params.items() if values}
-        response = self.handle_request(method, path, flat_query)
-        status_line, headers, payload = response.to_wsgi()
-        start_response(status_line, headers)
-        return [payload]
+        if method == "GET" and path == "/stream":
+            start_response("200 OK", list(SSE_HEADERS))
+            return self.stream_events(flat_query)
+        response = self.respond(method, path, flat_query)
+        start_response(response.status_line, list(response.headers))
+        return [response.body]
 
     def handle_request(
         self, method: str, path: str, query: Mapping[str, str]
@@ -77,15 +158,104 @@ class MarketDataApp:
             return self._handle_spot(query)
         if path == "/iv/atm":
             return self._handle_iv(query)
+        if path == "/fx/spot/batch":
+            return self._handle_spot_batch(query)
+        if path == "/iv/surface":
+            return self._handle_iv_surface(query)
+        if path == "/metrics":
+            return Response(status=200, body=self.state.metrics.snapshot())
 
         return Response(status=404, body={"detail": "Not found"})
 
+    def respond(self, method: str, path: str, query: Mapping[str, str]) -> EncodedResponse:
+        """Encoded response for a request, served from the response cache when possible."""
+        key = cache_key(path, query) if method == "GET" else None
+        if key is None:
+            response = self.handle_request(method, path, query)
+            self._record_request(path, response)
+            return response.encode()
+
+        cache = self.state.response_cache
+        cached = cache.get(key)
+        if cached is None:
+            generation = cache.generation(key[1])
+            response = self.handle_request(method, path, query)
+            self._record_request(path, response)
+            source = response.body.get("source") if response.status == 200 else None
+            if source not in CACHEABLE_SOURCES:
+                return response.encode()
+            cached = response.encode(age_pair=key[1] if source == "banxico_fix" else None)
+            cache.store(key, generation, cached)
+        else:
+            self.state.metrics.record_request(path, cached.source or "unknown", cached=True)
+        if cached.age_pair is None:
+            return cached
+        return self._with_age(cached)
+
+    def _record_request(self, path: str, response: Response) -> None:
+        if path not in ROUTES:
+            return
+        metrics = self.state.metrics
+        if response.status != 200:
+            metrics.record_request(path, f"error_{response.status}")
+            return
+        source = response.body.get("source")
+        for item in source if isinstance(source, list) else [source]:
+            metrics.record_request(path, item or "missing")
+
+    def _with_age(self, cached: EncodedResponse) -> EncodedResponse:
+        client = self.state.banxico_client
+        if client.needs_refresh(cached.age_pair):
+            # Kick off the stale-while-revalidate refresh; returns without blocking.
+            client.get_latest_fix(cached.age_pair)
+        age = client.quote_age(cached.age_pair)
+        if age is None:
+            return cached
+        value = str(max(0, int(age.total_seconds())))
+        return replace(
+            cached,
+            headers=cached.headers + (("Age", value),),
+            raw_headers=cached.raw_headers + ((b"age", value.encode("latin-1")),),
+        )
+
+    def subscribe(self, query: Mapping[str, str]) -> Subscription:
+        """Subscribe to updates for ``pairs`` (all pairs when omitted).
+
+        The subscription starts with the current manual spot and IV values so a
+        client does not have to poll once before listening.
+        """
+        broker = self.state.stream
+        subscription = broker.subscribe(_split_list(query.get("pairs") or query.get("pair")) or None)
+        wanted = subscription.pairs
+        for pair in self.state.manual_spot_store.pairs():
+            entry = self.state.manual_spot_store.get_fix(pair)
+            if entry is not None and (wanted is None or pair in wanted):
+                subscription.offer(broker.event("spot", pair, entry.value, entry.ts, "manual"))
+        for pair, tenor in self.state.manual_iv_store.keys():
+            iv_entry = self.state.manual_iv_store.get_sigma(pair, tenor)
+            if iv_entry is not None and (wanted is None or pair in wanted):
+                subscription.offer(broker.event("iv", pair, iv_entry.sigma, iv_entry.ts, "manual", tenor))
+        return subscription
+
+    def stream_events(self, query: Mapping[str, str], *, heartbeat: float = 15.0) -> Iterator[bytes]:
+        """Server-sent event stream of spot and IV updates."""
+        subscription = self.subscribe(query)
+        try:
+            yield b"retry: 2000\n\n"
+            while not subscription.closed:
+                event = subscription.get(timeout=heartbeat)
+                yield event.to_sse() if event is not None else b": keepalive\n\n"
+        finally:
+            subscription.close()
+
     def _handle_spot(self, query: Mapping[str, str]) -> Response:
         pair = query.get("pair")
         if not pair:
             return Response(status=400, body={"detail": "pair parameter is required"})
 
         pair = pair.upper()
+        if "as_of" in query:
+            return self._handle_spot_as_of(pair, query["as_of"])
         manual_entry = self.state.manual_spot_store.get_fix(pair)
         if manual_entry:
             return Response(
@@ -100,7 +270,23 @@ class MarketDataApp:
         except BanxicoFixError as exc:
             return Response(status=503, body={"detail": str(exc)})
 
-        return Response(status=200, body=self._serialize_spot(fix, "banxico_fix"))
+        headers = JSON_HEADERS
+        age = self.state.banxico_client.quote_age(pair)
+        if age is not None:
+            headers = headers + (("Age", str(max(0, int(age.total_seconds())))),)
+        return Response(status=200, body=self._serialize_spot(fix, "banxico_fix"), headers=headers)
+
+    def _handle_spot_as_of(self, pair: str, raw_as_of: str) -> Response:
+        as_of = _parse_as_of(raw_as_of)
+        if as_of is None:
+            return Response(status=400, body={"detail": "as_of must be an ISO-8601 timestamp"})
+        manual_entry = self.state.manual_spot_store.get_fix_as_of(pair, as_of)
+        if manual_entry:
+            return Response(status=200, body=self._serialize_spot(manual_entry, "manual"))
+        fix = self.state.banxico_client.get_fix_as_of(pair, as_of)
+        if fix:
+            return Response(status=200, body=self._serialize_spot(fix, "banxico_fix"))
+        return Response(status=404, body={"detail": "No spot available as of the requested time"})
 
     def _handle_iv(self, query: Mapping[str, str]) -> Response:
         pair = query.get("pair")
@@ -113,12 +299,127 @@ class MarketDataApp:
 
         pair = pair.upper()
         tenor = tenor.upper()
-        manual_entry = self.state.manual_iv_store.get_sigma(pair, tenor)
+        if "as_of" in query:
+            as_of = _parse_as_of(query["as_of"])
+            if as_of is None:
+                return Response(status=400, body={"detail": "as_of must be an ISO-8601 timestamp"})
+            manual_entry = self.state.manual_iv_store.get_sigma_as_of(pair, tenor, as_of)
+        else:
+            manual_entry = self.state.manual_iv_store.get_sigma(pair, tenor)
         if manual_entry:
             return Response(status=200, body=self._serialize_iv(manual_entry, "manual"))
 
+        surface = None if "as_of" in query else self.state.manual_iv_store.surface(pair)
+        if surface is not None:
+            try:
+                covered = surface.covers(tenor)
+            except ValueError as exc:
+                return Response(status=400, body={"detail": str(exc)})
+            # Interpolate between quoted tenors only; flat extrapolation past them is not a quote.
+            if covered:
+                return Response(
+                    status=200,
+                    body=self._serialize_iv({"sigma": surface.atm(tenor), "ts": surface.ts}, "manual_interpolated"),
+                )
+
         return Response(status=404, body={"detail": "No implied volatility available"})
 
+    def _handle_spot_batch(self, query: Mapping[str, str]) -> Response:
+        pairs = _split_list(query.get("pairs") or query.get("pair"))
+        if not pairs:
+            return Response(status=400, body={"detail": "pairs parameter is required"})
+
+        values: list[Optional[float]] = []
+        stamps: list[Optional[str]] = []
+        sources: list[Optional[str]] = []
+        errors: Dict[str, str] = {}
+        fallback: list[str] = []
+        for pair in pairs:
+            manual_entry = self.state.manual_spot_store.get_fix(pair)
+            if manual_entry is None:
+                try:
+                    self.state.banxico_client.series_id(pair)
+                except ValueError as exc:
+                    errors[pair] = str(exc)
+                else:
+                    fallback.append(pair)
+
+        fixes: Dict[str, BanxicoFixQuote] = {}
+        if fallback:
+            try:
+                fixes = self.state.banxico_client.get_latest_fixes(fallback, strict=False)
+            except BanxicoFixError as exc:
+                errors.update({pair: str(exc) for pair in fallback})
+
+        for pair in pairs:
+            manual_entry = self.state.manual_spot_store.get_fix(pair)
+            entry: ManualSpotEntry | BanxicoFixQuote | None = manual_entry or fixes.get(pair)
+            if entry is None:
+                errors.setdefault(pair, "No spot available")
+                values.append(None)
+                stamps.append(None)
+                sources.append(None)
+                continue
+            values.append(entry.value)
+            stamps.append(_to_iso(entry.ts))
+            sources.append("manual" if manual_entry else "banxico_fix")
+
+        return Response(
+            status=200,
+            body={"pairs": pairs, "value": values, "ts": stamps, "source": sources, "errors": errors},
+        )
+
+    def _handle_iv_surface(self, query: Mapping[str, str]) -> Response:
+        pairs = _split_list(query.get("pairs") or query.get("pair"))
+        tenors = _split_list(query.get("tenors") or query.get("tenor"))
+        if not pairs or not tenors:
+            return Response(
+                status=400,
+                body={"detail": "pairs and tenors parameters are required"},
+            )
+
+        try:
+            for tenor in tenors:
+                tenor_to_years(tenor)
+        except ValueError as exc:
+            return Response(status=400, body={"detail": str(exc)})
+
+        store = self.state.manual_iv_store
+        sigmas: list[list[Optional[float]]] = []
+        stamps: list[list[Optional[str]]] = []
+        interpolated: list[list[bool]] = []
+        for pair in pairs:
+            row_sigma: list[Optional[float]] = [None] * len(tenors)
+            row_ts: list[Optional[str]] = [None] * len(tenors)
+            row_interpolated = [False] * len(tenors)
+            surface = store.surface(pair)
+            if surface is not None:
+                for i, (tenor, sigma) in enumerate(zip(tenors, surface.sigma(tenors))):
+                    # Cells outside the quoted tenor range stay empty rather than flat-extrapolated.
+                    if not surface.covers(tenor):
+                        continue
+                    entry = store.get_sigma(pair, tenor)
+                    if entry is not None:
+                        row_sigma[i], row_ts[i] = entry.sigma, _to_iso(entry.ts)
+                    else:
+                        row_sigma[i], row_interpolated[i] = sigma, True
+                        row_ts[i] = _to_iso(surface.ts) if surface.ts else None
+            sigmas.append(row_sigma)
+            stamps.append(row_ts)
+            interpolated.append(row_interpolated)
+
+        return Response(
+            status=200,
+            body={
+                "pairs": pairs,
+                "tenors": tenors,
+                "sigma": sigmas,
+                "ts": stamps,
+                "interpolated": interpolated,
+                "source": "manual",
+            },
+        )
+
     def _serialize_spot(
         self, entry: ManualSpotEntry | Dict[str, object] | BanxicoFixQuote, source: str
     ) -> Dict[str, object]:
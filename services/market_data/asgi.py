@@ -0,0 +1,137 @@
+"""ASGI adapter for the market data service.
+
+Shares :class:`ServiceState` with the WSGI app. Requests that can be answered
+from memory (response cache hits, manual quotes, warm Banxico quotes) run
+inline on the event loop; anything that may have to wait for Banxico is
+offloaded to a thread pool so it never blocks the loop.
+"""
+from __future__ import annotations
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Mapping, MutableMapping, Optional
+from urllib.parse import parse_qs
+
+from .app import SSE_HEADERS, MarketDataApp, ServiceState, _split_list
+from .app import app as wsgi_app
+from .response_cache import EncodedResponse
+
+Scope = MutableMapping[str, Any]
+Receive = Callable[[], Awaitable[MutableMapping[str, Any]]]
+Send = Callable[[MutableMapping[str, Any]], Awaitable[None]]
+
+_SSE_RAW_HEADERS = [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in SSE_HEADERS]
+_UPSTREAM_PATHS = frozenset({"/fx/spot", "/fx/spot/batch"})
+
+
+class MarketDataASGIApp:
+    """ASGI application serving the same routes as :class:`MarketDataApp`."""
+
+    def __init__(
+        self,
+        app: Optional[MarketDataApp] = None,
+        *,
+        state: Optional[ServiceState] = None,
+        max_workers: int = 8,
+        heartbeat: float = 15.0,
+    ) -> None:
+        self.app = app or MarketDataApp(state=state)
+        self.heartbeat = heartbeat
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="market-data-asgi")
+
+    @property
+    def state(self) -> ServiceState:
+        return self.app.state
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] == "lifespan":
+            await self._lifespan(receive, send)
+            return
+        if scope["type"] != "http":  # pragma: no cover - websocket not served
+            return
+
+        method = scope.get("method", "GET").upper()
+        path = scope.get("path", "")
+        raw_query = scope.get("query_string", b"").decode("latin-1")
+        query = {key: values[-1] for key, values in parse_qs(raw_query).items() if values}
+
+        if method == "GET" and path == "/stream":
+            await self._stream(query, receive, send)
+            return
+
+        if self._may_block(method, path, query):
+            loop = asyncio.get_running_loop()
+            response = await loop.run_in_executor(self._executor, self.app.respond, method, path, query)
+        else:
+            response = self.app.respond(method, path, query)
+        await _send_response(send, response)
+
+    def _may_block(self, method: str, path: str, query: Mapping[str, str]) -> bool:
+        """Whether answering may wait on Banxico (cold cache for a requested pair)."""
+        if method != "GET" or path not in _UPSTREAM_PATHS or "as_of" in query:
+            return False
+        pairs = _split_list(query.get("pairs") or query.get("pair"))
+        pending = [pair for pair in pairs if self.state.manual_spot_store.get_fix(pair) is None]
+        return bool(pending) and not self.state.banxico_client.is_warm(pending)
+
+    async def _stream(self, query: Mapping[str, str], receive: Receive, send: Send) -> None:
+        loop = asyncio.get_running_loop()
+        ready = asyncio.Event()
+
+        def wake() -> None:
+            try:
+                loop.call_soon_threadsafe(ready.set)
+            except RuntimeError:  # pragma: no cover - loop already closed
+                pass
+
+        subscription = self.app.subscribe(query)
+        subscription.on_ready = wake
+        disconnected = asyncio.ensure_future(_wait_disconnect(receive))
+        try:
+            await send({"type": "http.response.start", "status": 200, "headers": _SSE_RAW_HEADERS})
+            await send({"type": "http.response.body", "body": b"retry: 2000\n\n", "more_body": True})
+            while not disconnected.done():
+                ready.clear()
+                event = subscription.get(timeout=0)
+                if event is not None:
+                    await send({"type": "http.response.body", "body": event.to_sse(), "more_body": True})
+                    continue
+                waiter = asyncio.ensure_future(ready.wait())
+                done, _ = await asyncio.wait(
+                    {waiter, disconnected}, timeout=self.heartbeat, return_when=asyncio.FIRST_COMPLETED
+                )
+                waiter.cancel()
+                if not done:
+                    await send({"type": "http.response.body", "body": b": keepalive\n\n", "more_body": True})
+        finally:
+            subscription.close()
+            disconnected.cancel()
+
+    async def _lifespan(self, receive: Receive, send: Send) -> None:
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                self.state.banxico_client.stop(timeout=5)
+                self._executor.shutdown(wait=False)
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+
+async def _wait_disconnect(receive: Receive) -> None:
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _send_response(send: Send, response: EncodedResponse) -> None:
+    await send({"type": "http.response.start", "status": response.status, "headers": list(response.raw_headers)})
+    await send({"type": "http.response.body", "body": response.body})
+
+
+# Shares ServiceState (stores, Banxico client, caches) with the WSGI ``app``.
+app = MarketDataASGIApp(wsgi_app)
+
+__all__ = ["app", "MarketDataASGIApp"]
@@ -0,0 +1,217 @@
+"""Quality and load metrics for the market data service."""
+from __future__ import annotations
+
+import time
+from bisect import bisect_left
+from collections import deque
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Callable, Deque, Dict, List, Optional, Sequence, Tuple
+
+MetricKey = Tuple[str, str, Optional[str], str]
+
+DEFAULT_LATENCY_BUCKETS: Tuple[float, ...] = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Fixed-bucket histogram; ``counts[i]`` holds observations ``<= buckets[i]``."""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_LATENCY_BUCKETS) -> None:
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def as_dict(self) -> Dict[str, object]:
+        cumulative = 0
+        buckets: Dict[str, int] = {}
+        for bound, count in zip([*map(str, self.buckets), "+Inf"], self.counts):
+            cumulative += count
+            buckets[bound] = cumulative
+        return {"buckets": buckets, "count": self.count, "sum": self.total}
+
+
+@dataclass
+class _KeyStats:
+    value: float
+    ts: datetime
+    updated_at: float
+    updates: int = 0
+    recent: Deque[float] = field(default_factory=lambda: deque(maxlen=1024))
+
+
+@dataclass(frozen=True)
+class JumpAlert:
+    kind: str
+    pair: str
+    tenor: Optional[str]
+    previous: float
+    value: float
+    change: float
+    ts: datetime
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "kind": self.kind,
+            "pair": self.pair,
+            "tenor": self.tenor,
+            "previous": self.previous,
+            "value": self.value,
+            "change": self.change,
+            "ts": _iso(self.ts),
+        }
+
+
+def _iso(value: datetime) -> str:
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _label(key: Dict[str, object]) -> str:
+    parts = [key["kind"], key["pair"]] + ([key["tenor"]] if key["tenor"] else []) + [key["source"]]
+    return ":".join(str(part) for part in parts)
+
+
+class MarketDataMetrics:
+    """Tracks per-key freshness, request sources, upstream latency and jumps.
+
+    Keys are ``(kind, pair, tenor, source)``. ``jump_threshold`` is a relative
+    move (``0.02`` = 2%) between consecutive values of the same key that
+    raises a :class:`JumpAlert`; keys whose data timestamp is older than
+    ``stale_after`` are reported as stale.
+    """
+
+    def __init__(
+        self,
+        *,
+        jump_threshold: float = 0.02,
+        stale_after: timedelta = timedelta(hours=26),
+        rate_window: timedelta = timedelta(minutes=1),
+        max_alerts: int = 100,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.jump_threshold = jump_threshold
+        self.stale_after = stale_after
+        self._rate_window = rate_window.total_seconds()
+        self._clock = clock
+        self._lock = Lock()
+        self._keys: Dict[MetricKey, _KeyStats] = {}
+        self._requests: Dict[str, Dict[str, int]] = {}
+        self._cache_hits: Dict[str, int] = {}
+        self._upstream_latency = Histogram()
+        self._upstream_requests = 0
+        self._upstream_failures = 0
+        self._upstream_by_pair: Dict[str, int] = {}
+        self._alerts: Deque[JumpAlert] = deque(maxlen=max_alerts)
+        self._jump_count = 0
+
+    def record_update(
+        self, kind: str, pair: str, value: float, ts: datetime, source: str, tenor: Optional[str] = None
+    ) -> Optional[JumpAlert]:
+        key = (kind, pair.upper(), tenor, source)
+        now = self._clock()
+        with self._lock:
+            stats = self._keys.get(key)
+            alert = None
+            if stats is None:
+                stats = self._keys[key] = _KeyStats(value=value, ts=ts, updated_at=now)
+            else:
+                if stats.value:
+                    change = value / stats.value - 1.0
+                    if abs(change) > self.jump_threshold:
+                        alert = JumpAlert(kind, key[1], tenor, stats.value, value, change, ts)
+                        self._alerts.append(alert)
+                        self._jump_count += 1
+                stats.value, stats.ts, stats.updated_at = value, ts, now
+            stats.updates += 1
+            stats.recent.append(now)
+        return alert
+
+    def record_request(self, route: str, source: str, *, cached: bool = False) -> None:
+        with self._lock:
+            by_source = self._requests.setdefault(route, {})
+            by_source[source] = by_source.get(source, 0) + 1
+            if cached:
+                self._cache_hits[route] = self._cache_hits.get(route, 0) + 1
+
+    def record_upstream(self, pairs: Sequence[str], seconds: float, ok: bool) -> None:
+        with self._lock:
+            self._upstream_latency.observe(seconds)
+            self._upstream_requests += 1
+            if not ok:
+                self._upstream_failures += 1
+            for pair in pairs:
+                self._upstream_by_pair[pair] = self._upstream_by_pair.get(pair, 0) + 1
+
+    # Listener adapters, mirroring MarketDataBroker.
+
+    def on_manual_spot(self, pair: str, entry) -> None:
+        if entry is not None:
+            self.record_update("spot", pair, entry.value, entry.ts, "manual")
+
+    def on_manual_iv(self, pair: str, tenor: str, entry) -> None:
+        if entry is not None:
+            self.record_update("iv", pair, entry.sigma, entry.ts, "manual", tenor=tenor)
+
+    def on_banxico_fix(self, pair: str, quote) -> None:
+        self.record_update("spot", pair, quote.value, quote.ts, "banxico_fix")
+
+    def alerts(self) -> List[JumpAlert]:
+        with self._lock:
+            return list(self._alerts)
+
+    def snapshot(self, now: Optional[datetime] = None) -> Dict[str, object]:
+        wall = now or datetime.now(tz=timezone.utc)
+        tick = self._clock()
+        with self._lock:
+            keys = []
+            for (kind, pair, tenor, source), stats in sorted(self._keys.items(), key=lambda item: str(item[0])):
+                data_ts = stats.ts if stats.ts.tzinfo else stats.ts.replace(tzinfo=timezone.utc)
+                age = (wall - data_ts).total_seconds()
+                recent = sum(1 for stamp in stats.recent if tick - stamp <= self._rate_window)
+                keys.append(
+                    {
+                        "kind": kind,
+                        "pair": pair,
+                        "tenor": tenor,
+                        "source": source,
+                        "value": stats.value,
+                        "ts": _iso(stats.ts),
+                        "age_seconds": age,
+                        "since_update_seconds": tick - stats.updated_at,
+                        "stale": age > self.stale_after.total_seconds(),
+                        "updates": stats.updates,
+                        "updates_per_minute": recent * 60.0 / self._rate_window,
+                    }
+                )
+            requests = {}
+            for route, by_source in self._requests.items():
+                total = sum(by_source.values())
+                requests[route] = {
+                    "total": total,
+                    "by_source": dict(by_source),
+                    "hit_rate": {source: count / total for source, count in by_source.items()},
+                    "response_cache_hit_rate": self._cache_hits.get(route, 0) / total,
+                }
+            return {
+                "keys": keys,
+                "stale_keys": [_label(key) for key in keys if key["stale"]],
+                "requests": requests,
+                "upstream": {
+                    "requests": self._upstream_requests,
+                    "failures": self._upstream_failures,
+                    "latency_seconds": self._upstream_latency.as_dict(),
+                    "by_pair": dict(self._upstream_by_pair),
+                },
+                "jumps": {"count": self._jump_count, "recent": [alert.as_dict() for alert in self._alerts]},
+            }
+
+
+__all__ = ["DEFAULT_LATENCY_BUCKETS", "Histogram", "JumpAlert", "MarketDataMetrics"]
@@ -0,0 +1,240 @@
+"""Journal and snapshot persistence for the manual market data stores.
+
+Every manual update is appended to ``journal.bin`` before it is applied to the
+in-memory store. :meth:`MarketDataPersistence.snapshot` periodically writes
+every retained point to ``snapshot.bin`` and truncates the journal. Both files
+use the same fixed-width little-endian records, so a warm start memory-maps the
+snapshot and decodes it with a single ``struct.iter_unpack`` pass before
+replaying the (short) journal tail.
+
+Both headers carry a generation number. Each snapshot takes the next
+generation and the journal is then restarted with it, so a journal left behind
+by a crash between the two is older than the snapshot and is not replayed.
+
+Journal records are flushed to the OS after every update but only fsync'd when
+``fsync=True``. By default a crashed process loses nothing, while an OS crash or
+power loss can drop the most recent updates since the last snapshot. Snapshots,
+and therefore a store's ``clear()``, are always fsync'd along with the rename.
+"""
+from __future__ import annotations
+
+import mmap
+import os
+import struct
+from datetime import datetime
+from pathlib import Path
+from threading import RLock
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Tuple
+
+from .timeseries import to_micros
+
+if TYPE_CHECKING:  # pragma: no cover - typing only
+    from .providers.manual_iv_store import ManualIVStore
+    from .providers.manual_spot_store import ManualSpotStore
+
+SPOT = 1
+IV_ATM = 2
+IV_SMILE = 3
+
+SNAPSHOT_NAME = "snapshot.bin"
+JOURNAL_NAME = "journal.bin"
+
+_SNAPSHOT_MAGIC = b"MDSNAP02"
+_JOURNAL_MAGIC = b"MDJRNL02"
+_SNAPSHOT_HEADER = struct.Struct("<8sqq")  # magic, generation, record count
+_JOURNAL_HEADER = struct.Struct("<8sq")  # magic, generation
+_RECORD = struct.Struct("<Bqd40s")
+_KEY_SEPARATOR = "|"
+
+Point = Tuple[int, Tuple[str, ...], datetime, float]
+
+
+def _encode_key(key: Tuple[str, ...]) -> bytes:
+    raw = _KEY_SEPARATOR.join(key).encode("utf-8")
+    if len(raw) > 40:
+        raise ValueError(f"market data key {key!r} is too long to persist")
+    return raw
+
+
+def _decode_key(raw_key: bytes) -> Tuple[str, ...]:
+    return tuple(raw_key.rstrip(b"\0").decode("utf-8").split(_KEY_SEPARATOR))
+
+
+class MarketDataPersistence:
+    """Write-ahead journal plus compact snapshot for manual spot and IV stores."""
+
+    def __init__(
+        self, directory: str | os.PathLike[str], *, snapshot_every: int = 10_000, fsync: bool = False
+    ) -> None:
+        self._directory = Path(directory)
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._snapshot_path = self._directory / SNAPSHOT_NAME
+        self._journal_path = self._directory / JOURNAL_NAME
+        self._snapshot_every = snapshot_every
+        self._fsync = fsync
+        self.lock = RLock()
+        self._journal = None
+        self._journal_records = 0
+        self._generation = 0
+        self._spot: Optional["ManualSpotStore"] = None
+        self._iv: Optional["ManualIVStore"] = None
+
+    @property
+    def journal_records(self) -> int:
+        return self._journal_records
+
+    def bind(self, spot_store: "ManualSpotStore", iv_store: "ManualIVStore") -> int:
+        """Warm-start both stores from disk and journal their future updates.
+
+        Returns the number of points restored.
+        """
+        with self.lock:
+            self._spot, self._iv = spot_store, iv_store
+            groups: Dict[Tuple[int, bytes], Tuple[List[int], List[float]]] = {}
+            restored = 0
+            snapshot_generation, snapshot_records = self._read_snapshot()
+            journal_generation, journal_records = self._read_journal()
+            if journal_generation is None or journal_generation < snapshot_generation:
+                # Missing, or written before the snapshot it would be replayed onto.
+                journal_records = []
+            self._generation = max(snapshot_generation, journal_generation or 0)
+            for records in (snapshot_records, journal_records):
+                for kind, micros, value, raw_key in records:
+                    stamps, values = groups.setdefault((kind, raw_key), ([], []))
+                    stamps.append(micros)
+                    values.append(value)
+                    restored += 1
+            for (kind, raw_key), (stamps, values) in groups.items():
+                self._restore(kind, _decode_key(raw_key), stamps, values)
+            self._open_journal()
+            spot_store.attach_journal(self)
+            iv_store.attach_journal(self)
+            return restored
+
+    def apply(self, kind: int, key: Tuple[str, ...], ts: datetime, value: float, write: Callable[[], None]) -> None:
+        """Journal one update, then apply it with ``write`` under the same lock."""
+        record = _RECORD.pack(kind, to_micros(ts), value, _encode_key(key))
+        with self.lock:
+            journal = self._journal
+            if journal is not None:
+                journal.write(record)
+                journal.flush()
+                if self._fsync:
+                    os.fsync(journal.fileno())
+                self._journal_records += 1
+            write()
+            if self._snapshot_every and self._journal_records >= self._snapshot_every:
+                self.snapshot()
+
+    def reset(self, write: Callable[[], None]) -> None:
+        """Empty the stores with ``write`` and snapshot the result under the same lock.
+
+        No update can land between the two, so the snapshot matches what ``write`` left.
+        """
+        with self.lock:
+            write()
+            self.snapshot()
+
+    def snapshot(self) -> int:
+        """Write every retained point to a new snapshot and reset the journal."""
+        with self.lock:
+            points = list(self._export())
+            generation = self._generation + 1
+            temp_path = self._snapshot_path.with_name(SNAPSHOT_NAME + ".tmp")
+            with temp_path.open("wb") as handle:
+                handle.write(_SNAPSHOT_HEADER.pack(_SNAPSHOT_MAGIC, generation, len(points)))
+                handle.write(
+                    b"".join(
+                        _RECORD.pack(kind, to_micros(ts), value, _encode_key(key)) for kind, key, ts, value in points
+                    )
+                )
+                handle.flush()
+                os.fsync(handle.fileno())
+            os.replace(temp_path, self._snapshot_path)
+            self._fsync_directory()
+            self._generation = generation
+            self._reset_journal()
+            return len(points)
+
+    def close(self) -> None:
+        with self.lock:
+            if self._journal is not None:
+                self._journal.close()
+                self._journal = None
+
+    def _export(self) -> Iterator[Point]:
+        if self._spot is not None:
+            yield from self._spot.export_points()
+        if self._iv is not None:
+            yield from self._iv.export_points()
+
+    def _restore(self, kind: int, key: Tuple[str, ...], micros: List[int], values: List[float]) -> None:
+        if kind == SPOT and self._spot is not None:
+            self._spot.restore_points(key, micros, values)
+        elif kind in (IV_ATM, IV_SMILE) and self._iv is not None:
+            self._iv.restore_points(kind, key, micros, values)
+
+    def _read_snapshot(self) -> Tuple[int, List[Tuple[int, int, float, bytes]]]:
+        if not self._snapshot_path.exists() or self._snapshot_path.stat().st_size < _SNAPSHOT_HEADER.size:
+            return 0, []
+        with self._snapshot_path.open("rb") as handle, mmap.mmap(
+            handle.fileno(), 0, access=mmap.ACCESS_READ
+        ) as mapped:
+            magic, generation, count = _SNAPSHOT_HEADER.unpack_from(mapped, 0)
+            if magic != _SNAPSHOT_MAGIC:
+                raise ValueError(f"{self._snapshot_path} is not a market data snapshot")
+            end = _SNAPSHOT_HEADER.size + count * _RECORD.size
+            with memoryview(mapped)[_SNAPSHOT_HEADER.size : end] as view:
+                return generation, list(_RECORD.iter_unpack(view))
+
+    def _read_journal(self) -> Tuple[Optional[int], List[Tuple[int, int, float, bytes]]]:
+        if not self._journal_path.exists():
+            return None, []
+        data = self._journal_path.read_bytes()
+        if len(data) < _JOURNAL_HEADER.size:
+            return None, []
+        magic, generation = _JOURNAL_HEADER.unpack_from(data, 0)
+        if magic != _JOURNAL_MAGIC:
+            return None, []
+        body = memoryview(data)[_JOURNAL_HEADER.size :]
+        # A torn final record (crash mid-write) is ignored.
+        usable = len(body) - len(body) % _RECORD.size
+        return generation, list(_RECORD.iter_unpack(body[:usable]))
+
+    def _open_journal(self) -> None:
+        fresh = True
+        if self._journal_path.exists():
+            with self._journal_path.open("rb") as handle:
+                header = handle.read(_JOURNAL_HEADER.size)
+            fresh = header != _JOURNAL_HEADER.pack(_JOURNAL_MAGIC, self._generation)
+        if fresh:
+            self._reset_journal()
+            return
+        # Drop any torn tail so new records stay aligned.
+        size = self._journal_path.stat().st_size
+        aligned = _JOURNAL_HEADER.size + (size - _JOURNAL_HEADER.size) // _RECORD.size * _RECORD.size
+        if aligned != size:
+            os.truncate(self._journal_path, aligned)
+        self._journal = self._journal_path.open("ab")
+
+    def _fsync_directory(self) -> None:
+        if not hasattr(os, "O_DIRECTORY"):  # pragma: no cover - Windows cannot fsync a directory
+            return
+        fd = os.open(self._directory, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _reset_journal(self) -> None:
+        if self._journal is not None:
+            self._journal.close()
+        with self._journal_path.open("wb") as handle:
+            handle.write(_JOURNAL_HEADER.pack(_JOURNAL_MAGIC, self._generation))
+            handle.flush()
+            os.fsync(handle.fileno())
+        self._journal = self._journal_path.open("ab")
+        self._journal_records = 0
+
+
+__all__ = ["IV_ATM", "IV_SMILE", "SPOT", "MarketDataPersistence"]
@@ -3,15 +3,29 @@ from __future__ import annotations
 
 import json
 import logging
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
 from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
-from typing import Dict, Optional
+from threading import Event, Lock, Thread
+from typing import Callable, Dict, Iterable, List, Mapping, Optional, Sequence
 from urllib.error import HTTPError, URLError
-from urllib.parse import urlencode
+from urllib.parse import quote, urlencode
 from urllib.request import Request, urlopen
 
+from ..timeseries import TimeSeriesStore
+
 logger = logging.getLogger(__name__)
 
+# SIE series publishing the daily peso exchange rates against each currency.
+DEFAULT_SERIES: Mapping[str, str] = {
+    "USDMXN": "SF43718",  # FIX
+    "EURMXN": "SF46410",
+    "GBPMXN": "SF46407",
+    "JPYMXN": "SF46406",
+    "CADMXN": "SF60632",
+}
+
 
 class BanxicoFixError(RuntimeError):
     """Raised when the Banxico FIX quote cannot be retrieved."""
@@ -26,10 +40,38 @@ class BanxicoFixQuote:
         return {"value": self.value, "ts": self.ts}
 
 
+@dataclass
+class _SeriesCache:
+    quote: Optional[BanxicoFixQuote] = None
+    expiry: Optional[datetime] = None
+    last_request_at: Optional[datetime] = None
+    fetched_at: Optional[datetime] = None
+    failures: int = 0
+    retry_at: Optional[datetime] = None
+
+
 class BanxicoFixClient:
-    """Client responsible for fetching FIX data from Banxico."""
+    """Client responsible for fetching FIX data from Banxico.
+
+    Every configured pair maps to an SIE series id. Each series keeps its own
+    cache entry, TTL and rate-limit guard, and whenever one series needs a
+    refresh every other due series is fetched in the same upstream request
+    (SIE accepts comma-separated series ids).
+
+    Reads are stale-while-revalidate: once a series has been fetched, callers
+    always get the cached quote immediately and expired (or nearly expired)
+    series are refreshed on a single background worker. Concurrent refreshes
+    of the same series coalesce onto one in-flight request. Only a cold cache
+    makes the caller wait for the upstream call.
 
-    SERIES_ID = "SF43718"  # Daily USD/MXN FIX
+    After a failed request the background refresher backs off exponentially
+    per series (from ``min_request_interval`` up to ``max_retry_backoff``)
+    instead of retrying on every poll; a caller reading a cold series still
+    triggers a request.
+    """
+
+    SERIES_ID = DEFAULT_SERIES["USDMXN"]  # Daily USD/MXN FIX
+    BASE_URL = "https://www.banxico.org.mx/SieAPIRest/service/v1/series/"
 
     def __init__(
         self,
@@ -37,53 +79,273 @@ class BanxicoFixClient:
         token: Optional[str],
         cache_ttl: timedelta = timedelta(minutes=5),
         min_request_interval: timedelta = timedelta(seconds=30),
+        series: Optional[Mapping[str, str]] = None,
+        series_ttl: Optional[Mapping[str, timedelta]] = None,
+        refresh_ahead: timedelta = timedelta(seconds=30),
+        max_retry_backoff: timedelta = timedelta(minutes=10),
     ) -> None:
         self._token = token
         self._cache_ttl = cache_ttl
         self._min_request_interval = min_request_interval
-        self._cached_quote: Optional[BanxicoFixQuote] = None
-        self._cache_expiry: Optional[datetime] = None
-        self._last_request_at: Optional[datetime] = None
+        self._refresh_ahead = refresh_ahead
+        self._max_retry_backoff = max_retry_backoff
+        self._series = {pair.upper(): series_id for pair, series_id in (series or DEFAULT_SERIES).items()}
+        self._pairs_by_series = {series_id: pair for pair, series_id in self._series.items()}
+        self._series_ttl = {series_id: ttl for series_id, ttl in (series_ttl or {}).items()}
+        self._cache: Dict[str, _SeriesCache] = {series_id: _SeriesCache() for series_id in self._series.values()}
+        self._lock = Lock()
+        self._history: TimeSeriesStore[str] = TimeSeriesStore(capacity=5_000)
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._inflight: Dict[str, Future] = {}
+        self._refresher: Optional[Thread] = None
+        self._stop = Event()
+        self._listeners: List[Callable[[str, BanxicoFixQuote], None]] = []
+        self._fetch_observers: List[Callable[[List[str], float, bool], None]] = []
+
+    def add_listener(self, callback: Callable[[str, BanxicoFixQuote], None]) -> None:
+        """Call ``callback(pair, quote)`` whenever a refresh yields a new FIX."""
+        self._listeners.append(callback)
+
+    @property
+    def supported_pairs(self) -> List[str]:
+        return list(self._series)
+
+    def series_id(self, pair: str) -> str:
+        try:
+            return self._series[pair.upper()]
+        except KeyError:
+            supported = ", ".join(self._series)
+            raise ValueError(f"Banxico FIX only supports the {supported} pairs") from None
 
     def get_latest_fix(self, pair: str) -> BanxicoFixQuote:
-        if pair.upper() != "USDMXN":
-            raise ValueError("Banxico FIX only supports the USDMXN pair")
+        return self.get_latest_fixes([pair])[pair.upper()]
 
+    def get_latest_fixes(self, pairs: Iterable[str], *, strict: bool = True) -> Dict[str, BanxicoFixQuote]:
+        """Return quotes for ``pairs``, refreshing every due series in one request.
+
+        With ``strict=False`` pairs that have no quote yet are left out of the
+        result instead of raising :class:`BanxicoFixError`.
+        """
+        requested = {pair.upper(): self.series_id(pair) for pair in pairs}
         now = datetime.now(tz=timezone.utc)
-        if self._cached_quote and self._cache_expiry and now < self._cache_expiry:
-            return self._cached_quote
+        with self._lock:
+            missing = [sid for sid in requested.values() if self._cache[sid].quote is None]
+            due = self._due_series(now, missing)
+            if due:
+                self._submit(due)
+            waiting = {self._inflight[sid] for sid in missing if sid in self._inflight}
+
+        if waiting:
+            wait(waiting)
+
+        result: Dict[str, BanxicoFixQuote] = {}
+        with self._lock:
+            for pair, sid in requested.items():
+                cached = self._cache[sid].quote
+                if cached is None:
+                    if not strict:
+                        continue
+                    raise BanxicoFixError(f"Unable to fetch Banxico FIX for {pair}")
+                result[pair] = cached
+        return result
+
+    def quote_age(self, pair: str, now: Optional[datetime] = None) -> Optional[timedelta]:
+        """How long ago the cached quote for ``pair`` was fetched from Banxico."""
+        entry = self._cache[self.series_id(pair)]
+        if entry.fetched_at is None:
+            return None
+        return (now or datetime.now(tz=timezone.utc)) - entry.fetched_at
+
+    def add_fetch_observer(self, callback: Callable[[List[str], float, bool], None]) -> None:
+        """Call ``callback(pairs, seconds, ok)`` after every upstream request."""
+        self._fetch_observers.append(callback)
+
+    def needs_refresh(self, pair: str) -> bool:
+        """Whether the cached quote for ``pair`` is missing or close to expiry."""
+        return self._needs_refresh(self.series_id(pair), datetime.now(tz=timezone.utc))
+
+    def is_warm(self, pairs: Iterable[str]) -> bool:
+        """Whether every supported pair in ``pairs`` has a cached quote (reads won't block)."""
+        for pair in pairs:
+            series_id = self._series.get(pair.upper())
+            if series_id is not None and self._cache[series_id].quote is None:
+                return False
+        return True
+
+    def get_fix_as_of(self, pair: str, ts: datetime) -> Optional[BanxicoFixQuote]:
+        """Return the last fetched FIX published at or before ``ts``."""
+        point = self._history.as_of(pair.upper(), ts)
+        return BanxicoFixQuote(value=point[1], ts=point[0]) if point else None
+
+    def start(self, poll_interval: timedelta = timedelta(seconds=5)) -> None:
+        """Start a daemon thread that refreshes series ahead of their expiry."""
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._stop.clear()
+            self._refresher = Thread(
+                target=self._refresh_loop, args=(poll_interval,), name="banxico-refresher", daemon=True
+            )
+            self._refresher.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop the refresher thread and wait for in-flight requests."""
+        self._stop.set()
+        refresher = self._refresher
+        if refresher is not None:
+            refresher.join(timeout)
+        self.wait_idle(timeout)
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
 
-        if (
-            self._last_request_at
-            and now - self._last_request_at < self._min_request_interval
-            and self._cached_quote
-        ):
-            logger.debug("Returning cached Banxico FIX due to rate-limit guard")
-            return self._cached_quote
+    def wait_idle(self, timeout: Optional[float] = None) -> None:
+        """Block until every in-flight refresh has completed."""
+        with self._lock:
+            pending = set(self._inflight.values())
+        if pending:
+            wait(pending, timeout=timeout)
 
+    def _refresh_loop(self, poll_interval: timedelta) -> None:
+        while not self._stop.is_set():
+            now = datetime.now(tz=timezone.utc)
+            with self._lock:
+                due = self._due_series(now, [])
+                if due:
+                    self._submit(due)
+                next_due = min(
+                    (
+                        max(entry.expiry - self._refresh_ahead, entry.last_request_at + self._min_request_interval)
+                        for entry in self._cache.values()
+                        if entry.expiry and entry.last_request_at
+                    ),
+                    default=now + poll_interval,
+                )
+            delay = max(timedelta(0), min(next_due - now, poll_interval))
+            self._stop.wait(delay.total_seconds() or 0.01)
+
+    def _ttl(self, series_id: str) -> timedelta:
+        return self._series_ttl.get(series_id, self._cache_ttl)
+
+    def _needs_refresh(self, series_id: str, now: datetime) -> bool:
+        entry = self._cache[series_id]
+        if entry.quote is None or entry.expiry is None:
+            return True
+        return now >= entry.expiry - self._refresh_ahead
+
+    def _is_rate_limited(self, series_id: str, now: datetime) -> bool:
+        entry = self._cache[series_id]
+        return bool(
+            entry.quote
+            and entry.last_request_at
+            and now - entry.last_request_at < self._min_request_interval
+        )
+
+    def _is_backing_off(self, series_id: str, now: datetime) -> bool:
+        retry_at = self._cache[series_id].retry_at
+        return retry_at is not None and now < retry_at
+
+    def _due_series(self, now: datetime, required: Sequence[str]) -> List[str]:
+        """Series to refresh: ``required`` plus every other series that is due.
+
+        Caller holds the lock. Series already being fetched are left out.
+        """
+        due = [sid for sid in required if sid not in self._inflight]
+        for series_id in self._cache:
+            if series_id in due or series_id in self._inflight:
+                continue
+            if (
+                self._needs_refresh(series_id, now)
+                and not self._is_rate_limited(series_id, now)
+                and not self._is_backing_off(series_id, now)
+            ):
+                due.append(series_id)
+        return due
+
+    def _submit(self, series_ids: Sequence[str]) -> None:
+        """Schedule one upstream request for ``series_ids``. Caller holds the lock."""
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="banxico-fetch")
+        future = self._executor.submit(self._refresh, list(series_ids))
+        for series_id in series_ids:
+            self._inflight[series_id] = future
+
+    def _refresh(self, series_ids: Sequence[str]) -> None:
+        now = datetime.now(tz=timezone.utc)
+        started = time.perf_counter()
         try:
-            quote = self._fetch_latest_fix()
+            quotes = self._fetch_series(series_ids)
         except Exception as exc:  # pragma: no cover - defensive
-            if self._cached_quote:
+            self._observe_fetch(series_ids, time.perf_counter() - started, False)
+            with self._lock:
+                for series_id in series_ids:
+                    self._cache[series_id].last_request_at = now
+                    self._back_off(series_id, now)
+                    self._inflight.pop(series_id, None)
+                cached = any(self._cache[sid].quote for sid in series_ids)
+            if cached:
                 logger.warning("Falling back to cached Banxico FIX: %s", exc)
-                return self._cached_quote
+                return
             raise BanxicoFixError("Unable to fetch Banxico FIX") from exc
 
-        self._cached_quote = quote
-        self._cache_expiry = now + self._cache_ttl
-        self._last_request_at = now
-        return quote
+        self._observe_fetch(series_ids, time.perf_counter() - started, True)
+        changed: List[tuple[str, BanxicoFixQuote]] = []
+        with self._lock:
+            for series_id in series_ids:
+                self._inflight.pop(series_id, None)
+                entry = self._cache[series_id]
+                entry.last_request_at = now
+                quote_ = quotes.get(series_id)
+                if quote_ is None:
+                    logger.warning("Banxico response missing series %s", series_id)
+                    self._back_off(series_id, now)
+                    continue
+                pair = self._pairs_by_series[series_id]
+                if self._record(pair, quote_):
+                    changed.append((pair, quote_))
+                entry.quote = quote_
+                entry.expiry = now + self._ttl(series_id)
+                entry.fetched_at = now
+                entry.failures = 0
+                entry.retry_at = None
+
+        for pair, quote_ in changed:
+            for callback in self._listeners:
+                try:
+                    callback(pair, quote_)
+                except Exception:  # pragma: no cover - defensive
+                    logger.exception("Banxico FIX listener failed for %s", pair)
 
-    def _fetch_latest_fix(self) -> BanxicoFixQuote:
+    def _back_off(self, series_id: str, now: datetime) -> None:
+        """Push the next background retry of ``series_id`` out exponentially. Caller holds the lock."""
+        entry = self._cache[series_id]
+        entry.failures += 1
+        backoff = self._min_request_interval * 2 ** min(entry.failures - 1, 16)
+        entry.retry_at = now + min(backoff, self._max_retry_backoff)
+
+    def _observe_fetch(self, series_ids: Sequence[str], seconds: float, ok: bool) -> None:
+        pairs = [self._pairs_by_series[series_id] for series_id in series_ids]
+        for callback in self._fetch_observers:
+            try:
+                callback(pairs, seconds, ok)
+            except Exception:  # pragma: no cover - defensive
+                logger.exception("Banxico fetch observer failed")
+
+    def _record(self, pair: str, quote_: BanxicoFixQuote) -> bool:
+        previous = self._history.latest(pair)
+        if previous and previous[0] == quote_.ts and previous[1] == quote_.value:
+            return False
+        self._history.append(pair, quote_.ts, quote_.value)
+        return True
+
+    def _fetch_series(self, series_ids: Sequence[str]) -> Dict[str, BanxicoFixQuote]:
         if not self._token:
             raise BanxicoFixError("BANXICO token is not configured")
 
-        base_url = (
-            "https://www.banxico.org.mx/SieAPIRest/service/v1/series/"
-            f"{self.SERIES_ID}/datos/oportuno"
-        )
+        ids = ",".join(series_ids)
         params = urlencode({"token": self._token})
-        url = f"{base_url}?{params}"
+        url = f"{self.BASE_URL}{quote(ids, safe=',')}/datos/oportuno?{params}"
         request = Request(url, method="GET")
 
         try:
@@ -92,24 +354,49 @@ class BanxicoFixClient:
         except (HTTPError, URLError, TimeoutError) as exc:
             raise BanxicoFixError("Error reaching Banxico FIX endpoint") from exc
 
-        series = payload.get("bmx", {}).get("series", [])
+        return self._parse_series(payload, series_ids)
+
+    @staticmethod
+    def _parse_series(payload: Mapping[str, object], series_ids: Sequence[str]) -> Dict[str, BanxicoFixQuote]:
+        series = payload.get("bmx", {}).get("series", [])  # type: ignore[union-attr]
         if not series:
             raise BanxicoFixError("Malformed Banxico response: missing series")
 
-        data_points = series[0].get("datos", [])
-        if not data_points:
-            raise BanxicoFixError("Banxico response missing data points")
+        quotes: Dict[str, BanxicoFixQuote] = {}
+        for position, entry in enumerate(series):
+            series_id = entry.get("idSerie") or (series_ids[position] if position < len(series_ids) else None)
+            data_points = entry.get("datos", [])
+            if not series_id or not data_points:
+                continue
 
-        latest = data_points[-1]
-        raw_value = latest.get("dato")
-        raw_date = latest.get("fecha")
-        if not raw_value or not raw_date:
+            latest = data_points[-1]
+            raw_value = latest.get("dato")
+            raw_date = latest.get("fecha")
+            if not raw_value or not raw_date:
+                continue
+
+            try:
+                value = float(str(raw_value).replace(",", ""))
+            except ValueError:  # pragma: no cover - defensive, e.g. "N/E"
+                continue
+
+            try:
+                ts = _parse_fecha(str(raw_date))
+            except BanxicoFixError as exc:
+                # One malformed series must not discard the others in the same response.
+                logger.warning("Skipping Banxico series %s: %s", series_id, exc)
+                continue
+            quotes[series_id] = BanxicoFixQuote(value=value, ts=ts)
+
+        if not quotes:
             raise BanxicoFixError("Banxico response missing fix values")
+        return quotes
 
-        try:
-            value = float(str(raw_value).replace(",", ""))
-        except ValueError as exc:  # pragma: no cover - defensive
-            raise BanxicoFixError("Unable to parse Banxico FIX value") from exc
 
-        ts = datetime.strptime(raw_date, "%Y-%m-%d").replace(tzinfo=timezone.utc)
-        return BanxicoFixQuote(value=value, ts=ts)
+def _parse_fecha(raw_date: str) -> datetime:
+    for fmt in ("%Y-%m-%d", "%d/%m/%Y"):
+        try:
+            return datetime.strptime(raw_date, fmt).replace(tzinfo=timezone.utc)
+        except ValueError:
+            continue
+    raise BanxicoFixError(f"Unable to parse Banxico FIX date {raw_date!r}")
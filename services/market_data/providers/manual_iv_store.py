@@ -1,10 +1,20 @@
 """Manual implied volatility storage provider."""
 from __future__ import annotations
 
+import logging
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from threading import Lock
-from typing import Dict, Optional, Tuple
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ..persistence import IV_ATM, IV_SMILE
+from ..surface import ATM_DELTA, VolSurface, tenor_to_years
+from ..timeseries import TimeSeriesStore
+
+if TYPE_CHECKING:  # pragma: no cover - typing only
+    from ..persistence import MarketDataPersistence
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
@@ -19,16 +29,49 @@ class ManualIVEntry:
 
 
 class ManualIVStore:
-    """Simple in-memory key-value store for ATM implied vols.
+    """Simple in-memory store for ATM implied vols with bounded history.
 
     The store is thread-safe and intended for use as an escape hatch when the
     authoritative CME settlement data is not available. Quotes are keyed by the
-    currency pair and tenor.
+    currency pair and tenor, and each key keeps a time series so callers can
+    look up the sigma that was in force at a given time. :meth:`get_sigma`
+    serves the last sigma written, even if it was back-dated as a correction.
+
+    Off-ATM smile points can be added per delta with :meth:`set_smile`;
+    :meth:`surface` combines the latest points for a pair into a
+    :class:`~services.market_data.surface.VolSurface`, rebuilt only after a
+    point for that pair changes. Surface listeners hear about every such
+    change, ATM or smile.
     """
 
-    def __init__(self) -> None:
-        self._lock = Lock()
-        self._entries: Dict[Tuple[str, str], ManualIVEntry] = {}
+    def __init__(self, *, capacity: int = 10_000, retention: Optional[timedelta] = None) -> None:
+        self._series: TimeSeriesStore[Tuple[str, str]] = TimeSeriesStore(capacity=capacity, retention=retention)
+        self._smile: TimeSeriesStore[Tuple[str, str, float]] = TimeSeriesStore(
+            capacity=capacity, retention=retention
+        )
+        self._listeners: List[Callable[[str, str, Optional[ManualIVEntry]], None]] = []
+        self._surface_listeners: List[Callable[[str], None]] = []
+        self._journal: Optional["MarketDataPersistence"] = None
+        self._surface_lock = Lock()
+        self._versions: Dict[str, int] = {}
+        self._surfaces: Dict[str, Tuple[int, Optional[VolSurface]]] = {}
+
+    def add_listener(self, callback: Callable[[str, str, Optional[ManualIVEntry]], None]) -> None:
+        """Call ``callback(pair, tenor, latest_entry)`` after every :meth:`set_sigma`.
+
+        :meth:`clear` reports every removed pair/tenor with ``None``.
+        """
+
+        self._listeners.append(callback)
+
+    def add_surface_listener(self, callback: Callable[[str], None]) -> None:
+        """Call ``callback(pair)`` whenever any ATM or smile point of ``pair`` changes.
+
+        ATM listeners only hear about :meth:`set_sigma`; anything derived from
+        the whole surface (interpolated vols, cached responses) should use this.
+        """
+
+        self._surface_listeners.append(callback)
 
     def set_sigma(
         self, pair: str, tenor: str, sigma: float, *, ts: Optional[datetime] = None
@@ -40,18 +83,172 @@ class ManualIVStore:
 
         key = (pair.upper(), tenor.upper())
         timestamp = ts or datetime.now(tz=timezone.utc)
-        with self._lock:
-            self._entries[key] = ManualIVEntry(sigma=sigma, ts=timestamp)
+        if self._journal is not None:
+            self._journal.apply(IV_ATM, key, timestamp, sigma, lambda: self._series.append(key, timestamp, sigma))
+        else:
+            self._series.append(key, timestamp, sigma)
+        self._touch(key[0])
+        if self._listeners:
+            self._notify(key[0], key[1], self.get_sigma(*key))
+        self._notify_surface(key[0])
+
+    def set_smile(
+        self, pair: str, tenor: str, delta: float, sigma: float, *, ts: Optional[datetime] = None
+    ) -> None:
+        """Record the sigma at call ``delta`` (``0.5`` is ATM) for pair/tenor."""
+
+        if sigma <= 0:
+            raise ValueError("sigma must be positive")
+        if not 0 < delta < 1:
+            raise ValueError("delta must be between 0 and 1")
+        if delta == ATM_DELTA:
+            self.set_sigma(pair, tenor, sigma, ts=ts)
+            return
+
+        pair = pair.upper()
+        key = (pair, tenor.upper(), float(delta))
+        timestamp = ts or datetime.now(tz=timezone.utc)
+        if self._journal is not None:
+            journal_key = (pair, key[1], repr(key[2]))
+            self._journal.apply(
+                IV_SMILE, journal_key, timestamp, sigma, lambda: self._smile.append(key, timestamp, sigma)
+            )
+        else:
+            self._smile.append(key, timestamp, sigma)
+        self._touch(pair)
+        self._notify_surface(pair)
+
+    def surface(self, pair: str) -> Optional[VolSurface]:
+        """Return the vol surface for ``pair`` or ``None`` without usable points."""
+
+        pair = pair.upper()
+        with self._surface_lock:
+            version = self._versions.get(pair, 0)
+            cached = self._surfaces.get(pair)
+            if cached is not None and cached[0] == version:
+                return cached[1]
+
+        built = self._build_surface(pair)
+        with self._surface_lock:
+            # Only cache if nothing changed while we were building.
+            if self._versions.get(pair, 0) == version:
+                self._surfaces[pair] = (version, built)
+        return built
 
     def get_sigma(self, pair: str, tenor: str) -> Optional[ManualIVEntry]:
-        """Return the stored manual sigma if present."""
+        """Return the last manual sigma written if present."""
 
-        key = (pair.upper(), tenor.upper())
-        with self._lock:
-            return self._entries.get(key)
+        point = self._series.last_written((pair.upper(), tenor.upper()))
+        return ManualIVEntry(sigma=point[1], ts=point[0]) if point else None
+
+    def get_sigma_as_of(self, pair: str, tenor: str, ts: datetime) -> Optional[ManualIVEntry]:
+        """Return the manual sigma that was in force at ``ts``."""
+
+        point = self._series.as_of((pair.upper(), tenor.upper()), ts)
+        return ManualIVEntry(sigma=point[1], ts=point[0]) if point else None
+
+    def history(
+        self, pair: str, tenor: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[ManualIVEntry]:
+        """Return the sigmas recorded for pair/tenor within ``[start, end]``."""
+
+        points = self._series.range((pair.upper(), tenor.upper()), start, end)
+        return [ManualIVEntry(sigma=value, ts=ts) for ts, value in points]
+
+    def keys(self) -> List[Tuple[str, str]]:
+        """Return every (pair, tenor) with at least one stored sigma."""
+
+        return self._series.keys()
+
+    def attach_journal(self, journal: "MarketDataPersistence") -> None:
+        """Journal every subsequent update through ``journal``."""
+
+        self._journal = journal
+
+    def export_points(self) -> Iterator[Tuple[int, Tuple[str, ...], datetime, float]]:
+        """Yield every retained ATM and smile point for snapshotting."""
+
+        for pair, tenor in self._series.keys():
+            for ts, sigma in self._series.export((pair, tenor)):
+                yield IV_ATM, (pair, tenor), ts, sigma
+        for pair, tenor, delta in self._smile.keys():
+            for ts, sigma in self._smile.export((pair, tenor, delta)):
+                yield IV_SMILE, (pair, tenor, repr(delta)), ts, sigma
+
+    def restore_points(
+        self, kind: int, key: Tuple[str, ...], micros: Sequence[int], sigmas: Sequence[float]
+    ) -> None:
+        """Load persisted points without journaling them or notifying listeners."""
+
+        if kind == IV_SMILE:
+            self._smile.extend_micros((key[0], key[1], float(key[2])), micros, sigmas)
+        else:
+            self._series.extend_micros((key[0], key[1]), micros, sigmas)
+        self._touch(key[0])
 
     def clear(self) -> None:
         """Remove every manual entry from the store."""
 
-        with self._lock:
-            self._entries.clear()
+        keys: List[Tuple[str, str]] = []
+
+        def wipe() -> None:
+            keys.extend(self._series.keys())
+            self._series.clear()
+            self._smile.clear()
+
+        if self._journal is not None:
+            self._journal.reset(wipe)
+        else:
+            wipe()
+        for pair, tenor in keys:
+            self._notify(pair, tenor, None)
+        with self._surface_lock:
+            for pair in self._versions:
+                self._versions[pair] += 1
+            self._surfaces.clear()
+            pairs = list(self._versions)
+        for pair in pairs:
+            self._notify_surface(pair)
+
+    def _touch(self, pair: str) -> None:
+        with self._surface_lock:
+            self._versions[pair] = self._versions.get(pair, 0) + 1
+
+    def _notify(self, pair: str, tenor: str, entry: Optional[ManualIVEntry]) -> None:
+        # The sigma is already stored; a failing listener must not skip the others.
+        for callback in self._listeners:
+            try:
+                callback(pair, tenor, entry)
+            except Exception:  # pragma: no cover - defensive
+                logger.exception("Manual IV listener failed for %s %s", pair, tenor)
+
+    def _notify_surface(self, pair: str) -> None:
+        for callback in self._surface_listeners:
+            try:
+                callback(pair)
+            except Exception:  # pragma: no cover - defensive
+                logger.exception("Manual IV surface listener failed for %s", pair)
+
+    def _build_surface(self, pair: str) -> Optional[VolSurface]:
+        points: Dict[Tuple[float, float], float] = {}
+        latest_ts: Optional[datetime] = None
+        quotes = [
+            (tenor, ATM_DELTA, self._series.last_written((key_pair, tenor)))
+            for key_pair, tenor in self._series.keys()
+            if key_pair == pair
+        ]
+        quotes += [
+            (tenor, delta, self._smile.last_written((key_pair, tenor, delta)))
+            for key_pair, tenor, delta in self._smile.keys()
+            if key_pair == pair
+        ]
+        for tenor, delta, point in quotes:
+            if point is None:
+                continue
+            try:
+                years = tenor_to_years(tenor)
+            except ValueError:
+                continue
+            points[(years, delta)] = point[1]
+            latest_ts = point[0] if latest_ts is None else max(latest_ts, point[0])
+        return VolSurface(pair, points, ts=latest_ts) if points else None
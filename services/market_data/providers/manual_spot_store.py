@@ -1,10 +1,18 @@
 """Manual FX spot storage provider."""
 from __future__ import annotations
 
+import logging
 from dataclasses import dataclass
-from datetime import datetime, timezone
-from threading import Lock
-from typing import Dict, Optional
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from ..persistence import SPOT
+from ..timeseries import TimeSeriesStore
+
+if TYPE_CHECKING:  # pragma: no cover - typing only
+    from ..persistence import MarketDataPersistence
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass(frozen=True)
@@ -17,24 +25,86 @@ class ManualSpotEntry:
 
 
 class ManualSpotStore:
-    """Thread-safe in-memory store for manually supplied FX spot fixes."""
+    """Thread-safe store for manually supplied FX spot fixes.
+
+    Every fix is kept in a bounded per-pair time series, so callers can ask for
+    the latest value, the value as of a point in time, or a historical range.
+    The latest value is the last fix written: a correction posted with an
+    earlier ``ts`` replaces it, while :meth:`get_fix_as_of` goes by timestamp.
+    """
 
-    def __init__(self) -> None:
-        self._lock = Lock()
-        self._entries: Dict[str, ManualSpotEntry] = {}
+    def __init__(self, *, capacity: int = 10_000, retention: Optional[timedelta] = None) -> None:
+        self._series: TimeSeriesStore[str] = TimeSeriesStore(capacity=capacity, retention=retention)
+        self._listeners: List[Callable[[str, Optional[ManualSpotEntry]], None]] = []
+        self._journal: Optional["MarketDataPersistence"] = None
+
+    def add_listener(self, callback: Callable[[str, Optional[ManualSpotEntry]], None]) -> None:
+        """Call ``callback(pair, latest_entry)`` after every :meth:`set_fix`.
+
+        :meth:`clear` reports every removed pair with ``None``.
+        """
+        self._listeners.append(callback)
 
     def set_fix(self, pair: str, value: float, *, ts: Optional[datetime] = None) -> None:
         if value <= 0:
             raise ValueError("value must be positive")
 
         timestamp = ts or datetime.now(tz=timezone.utc)
-        with self._lock:
-            self._entries[pair.upper()] = ManualSpotEntry(value=value, ts=timestamp)
+        pair = pair.upper()
+        if self._journal is not None:
+            self._journal.apply(SPOT, (pair,), timestamp, value, lambda: self._series.append(pair, timestamp, value))
+        else:
+            self._series.append(pair, timestamp, value)
+        if self._listeners:
+            self._notify(pair, self.get_fix(pair))
 
     def get_fix(self, pair: str) -> Optional[ManualSpotEntry]:
-        with self._lock:
-            return self._entries.get(pair.upper())
+        point = self._series.last_written(pair.upper())
+        return ManualSpotEntry(value=point[1], ts=point[0]) if point else None
+
+    def get_fix_as_of(self, pair: str, ts: datetime) -> Optional[ManualSpotEntry]:
+        point = self._series.as_of(pair.upper(), ts)
+        return ManualSpotEntry(value=point[1], ts=point[0]) if point else None
+
+    def history(
+        self, pair: str, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[ManualSpotEntry]:
+        return [ManualSpotEntry(value=value, ts=ts) for ts, value in self._series.range(pair.upper(), start, end)]
+
+    def pairs(self) -> List[str]:
+        return self._series.keys()
+
+    def attach_journal(self, journal: "MarketDataPersistence") -> None:
+        """Journal every subsequent :meth:`set_fix` through ``journal``."""
+        self._journal = journal
+
+    def export_points(self) -> Iterator[Tuple[int, Tuple[str, ...], datetime, float]]:
+        for pair in self._series.keys():
+            for ts, value in self._series.export(pair):
+                yield SPOT, (pair,), ts, value
+
+    def restore_points(self, key: Tuple[str, ...], micros: Sequence[int], values: Sequence[float]) -> None:
+        """Load persisted points without journaling them or notifying listeners."""
+        self._series.extend_micros(key[0], micros, values)
 
     def clear(self) -> None:
-        with self._lock:
-            self._entries.clear()
+        pairs: List[str] = []
+
+        def wipe() -> None:
+            pairs.extend(self._series.keys())
+            self._series.clear()
+
+        if self._journal is not None:
+            self._journal.reset(wipe)
+        else:
+            wipe()
+        for pair in pairs:
+            self._notify(pair, None)
+
+    def _notify(self, pair: str, entry: Optional[ManualSpotEntry]) -> None:
+        # The fix is already stored; a failing listener must not skip the others (e.g. cache invalidation).
+        for callback in self._listeners:
+            try:
+                callback(pair, entry)
+            except Exception:  # pragma: no cover - defensive
+                logger.exception("Manual spot listener failed for %s", pair)
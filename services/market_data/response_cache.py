@@ -0,0 +1,118 @@
+"""Cache of fully encoded responses for the hot single-key routes."""
+from __future__ import annotations
+
+import json
+from dataclasses import dataclass
+from threading import Lock
+from typing import Dict, List, Mapping, Optional, Set, Tuple
+
+CacheKey = Tuple[str, str, Optional[str]]
+
+CACHEABLE_SOURCES = frozenset({"manual", "banxico_fix"})
+
+
+@dataclass(frozen=True)
+class EncodedResponse:
+    """Status, headers and body already encoded for WSGI and ASGI servers.
+
+    ``age_pair`` marks Banxico responses whose ``Age`` header is computed per
+    request; it is deliberately not part of the cached headers.
+    """
+
+    status: int
+    status_line: str
+    headers: Tuple[Tuple[str, str], ...]
+    raw_headers: Tuple[Tuple[bytes, bytes], ...]
+    body: bytes
+    age_pair: Optional[str] = None
+    source: Optional[str] = None
+
+
+def encode_response(
+    status: int,
+    status_line: str,
+    body: Mapping[str, object],
+    headers: Tuple[Tuple[str, str], ...],
+    *,
+    age_pair: Optional[str] = None,
+    source: Optional[str] = None,
+) -> EncodedResponse:
+    payload = json.dumps(body, separators=(",", ":")).encode("utf-8")
+    full_headers = tuple(headers) + (("Content-Length", str(len(payload))),)
+    return EncodedResponse(
+        status=status,
+        status_line=status_line,
+        headers=full_headers,
+        raw_headers=tuple((name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in full_headers),
+        body=payload,
+        age_pair=age_pair,
+        source=source,
+    )
+
+
+def cache_key(path: str, query: Mapping[str, str]) -> Optional[CacheKey]:
+    """Key for a cacheable request, or ``None`` when it must be computed."""
+    if path == "/fx/spot" and set(query) == {"pair"} and query["pair"]:
+        return (path, query["pair"].upper(), None)
+    if path == "/iv/atm" and set(query) == {"pair", "tenor"} and query["pair"] and query["tenor"]:
+        return (path, query["pair"].upper(), query["tenor"].upper())
+    return None
+
+
+class ResponseCache:
+    """Encoded responses per ``(path, pair, tenor)``, invalidated per pair.
+
+    Each pair carries a generation number (plus a global epoch bumped by
+    :meth:`clear`). Callers read it before computing a response and pass it to
+    :meth:`store`, so a response computed from data that was replaced in the
+    meantime is never cached.
+    """
+
+    def __init__(self) -> None:
+        self._lock = Lock()
+        self._entries: Dict[CacheKey, EncodedResponse] = {}
+        self._by_pair: Dict[str, Set[CacheKey]] = {}
+        self._generations: Dict[str, int] = {}
+        self._epoch = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: CacheKey) -> Optional[EncodedResponse]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+
+    def generation(self, pair: str) -> Tuple[int, int]:
+        return (self._epoch, self._generations.get(pair.upper(), 0))
+
+    def store(self, key: CacheKey, generation: Tuple[int, int], response: EncodedResponse) -> None:
+        pair = key[1]
+        with self._lock:
+            if (self._epoch, self._generations.get(pair, 0)) != generation:
+                return
+            self._entries[key] = response
+            self._by_pair.setdefault(pair, set()).add(key)
+
+    def invalidate(self, pair: str) -> None:
+        pair = pair.upper()
+        with self._lock:
+            self._generations[pair] = self._generations.get(pair, 0) + 1
+            for key in self._by_pair.pop(pair, ()):
+                self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._epoch += 1
+            self._entries.clear()
+            self._by_pair.clear()
+
+    def keys(self) -> List[CacheKey]:
+        with self._lock:
+            return list(self._entries)
+
+
+__all__ = ["CacheKey", "EncodedResponse", "ResponseCache", "cache_key", "encode_response"]
@@ -0,0 +1,183 @@
+"""Push channel for market data updates.
+
+Stores and the Banxico client notify a :class:`MarketDataBroker`, which fans
+each update out to subscribers. Every subscriber owns a bounded buffer keyed by
+``(kind, pair, tenor)``: a newer update for a key that is still pending
+replaces the queued one (conflation), so a slow consumer only ever sees the
+latest value per key, and when the buffer is full of distinct keys the oldest
+pending update is dropped.
+"""
+from __future__ import annotations
+
+import itertools
+import json
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from threading import Condition, Lock
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Tuple
+
+_Key = Tuple[str, str, Optional[str]]
+
+
+@dataclass(frozen=True)
+class MarketDataEvent:
+    """A single spot or IV update."""
+
+    seq: int
+    kind: str  # "spot" or "iv"
+    pair: str
+    tenor: Optional[str]
+    value: float
+    ts: datetime
+    source: str
+
+    @property
+    def key(self) -> _Key:
+        return (self.kind, self.pair, self.tenor)
+
+    def as_dict(self) -> Dict[str, object]:
+        ts = self.ts if self.ts.tzinfo else self.ts.replace(tzinfo=timezone.utc)
+        payload: Dict[str, object] = {
+            "pair": self.pair,
+            "ts": ts.astimezone(timezone.utc).isoformat().replace("+00:00", "Z"),
+            "source": self.source,
+        }
+        if self.kind == "iv":
+            payload["tenor"] = self.tenor
+            payload["sigma"] = self.value
+        else:
+            payload["value"] = self.value
+        return payload
+
+    def to_sse(self) -> bytes:
+        data = json.dumps(self.as_dict(), separators=(",", ":"))
+        return f"id: {self.seq}\nevent: {self.kind}\ndata: {data}\n\n".encode("utf-8")
+
+
+class Subscription:
+    """Bounded, conflating buffer of events for one subscriber."""
+
+    def __init__(self, broker: "MarketDataBroker", pairs: Optional[Iterable[str]], max_pending: int) -> None:
+        if max_pending < 1:
+            raise ValueError("max_pending must be positive")
+        self._broker = broker
+        self.pairs: Optional[FrozenSet[str]] = frozenset(p.upper() for p in pairs) if pairs else None
+        self._max_pending = max_pending
+        self._pending: "OrderedDict[_Key, MarketDataEvent]" = OrderedDict()
+        self._cond = Condition()
+        self._closed = False
+        self.conflated = 0
+        self.dropped = 0
+        # Optional wake-up hook for consumers that cannot block on get(), e.g. an event loop.
+        self.on_ready: Optional[Callable[[], None]] = None
+
+    @property
+    def closed(self) -> bool:
+        return self._closed
+
+    def wants(self, event: MarketDataEvent) -> bool:
+        return self.pairs is None or event.pair in self.pairs
+
+    def offer(self, event: MarketDataEvent) -> None:
+        with self._cond:
+            if self._closed:
+                return
+            if event.key in self._pending:
+                # Keep the original queue position so a hot key cannot starve others.
+                self._pending[event.key] = event
+                self.conflated += 1
+            else:
+                if len(self._pending) >= self._max_pending:
+                    self._pending.popitem(last=False)
+                    self.dropped += 1
+                self._pending[event.key] = event
+            self._cond.notify()
+        if self.on_ready is not None:
+            self.on_ready()
+
+    def get(self, timeout: Optional[float] = None) -> Optional[MarketDataEvent]:
+        """Pop the next event, or return ``None`` on timeout or close."""
+        with self._cond:
+            if not self._pending and not self._closed:
+                self._cond.wait(timeout)
+            if not self._pending:
+                return None
+            return self._pending.popitem(last=False)[1]
+
+    def drain(self) -> List[MarketDataEvent]:
+        with self._cond:
+            events = list(self._pending.values())
+            self._pending.clear()
+            return events
+
+    def close(self) -> None:
+        self._broker.unsubscribe(self)
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def __enter__(self) -> "Subscription":
+        return self
+
+    def __exit__(self, *exc_info: object) -> None:
+        self.close()
+
+
+class MarketDataBroker:
+    """Fan market data updates out to every interested :class:`Subscription`."""
+
+    def __init__(self, *, max_pending: int = 256) -> None:
+        self._lock = Lock()
+        self._subscribers: List[Subscription] = []
+        self._seq = itertools.count(1)
+        self._max_pending = max_pending
+
+    def subscribe(self, pairs: Optional[Iterable[str]] = None, *, max_pending: Optional[int] = None) -> Subscription:
+        subscription = Subscription(self, pairs, max_pending or self._max_pending)
+        with self._lock:
+            self._subscribers.append(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        with self._lock:
+            if subscription in self._subscribers:
+                self._subscribers.remove(subscription)
+
+    @property
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
+
+    def event(
+        self, kind: str, pair: str, value: float, ts: datetime, source: str, tenor: Optional[str] = None
+    ) -> MarketDataEvent:
+        """Build a sequenced event without publishing it (e.g. for snapshots)."""
+        return MarketDataEvent(next(self._seq), kind, pair.upper(), tenor, value, ts, source)
+
+    def publish(
+        self, kind: str, pair: str, value: float, ts: datetime, source: str, tenor: Optional[str] = None
+    ) -> MarketDataEvent:
+        event = self.event(kind, pair, value, ts, source, tenor)
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for subscription in subscribers:
+            if subscription.wants(event):
+                subscription.offer(event)
+        return event
+
+    # Listener adapters for the stores and the Banxico client.
+
+    def on_manual_spot(self, pair: str, entry) -> None:
+        if entry is not None:
+            self.publish("spot", pair, entry.value, entry.ts, "manual")
+
+    def on_manual_iv(self, pair: str, tenor: str, entry) -> None:
+        if entry is not None:
+            self.publish("iv", pair, entry.sigma, entry.ts, "manual", tenor=tenor)
+
+    def on_banxico_fix(self, pair: str, quote) -> None:
+        self.publish("spot", pair, quote.value, quote.ts, "banxico_fix")
+
+
+__all__ = ["MarketDataBroker", "MarketDataEvent", "Subscription"]
@@ -0,0 +1,143 @@
+"""Implied volatility surfaces built from discrete tenor/delta quotes."""
+from __future__ import annotations
+
+import math
+import re
+from array import array
+from bisect import bisect_right
+from datetime import datetime
+from typing import Dict, Iterable, List, Mapping, Optional, Sequence, Tuple, Union
+
+ATM_DELTA = 0.5
+
+_TENOR = re.compile(r"^(\d+(?:\.\d+)?)([DWMY])$")
+_TENOR_DAYS = {"D": 1.0, "W": 7.0, "M": 365.0 / 12.0, "Y": 365.0}
+_NAMED_TENORS = {"ON": 1.0, "O/N": 1.0, "TN": 2.0, "SW": 7.0}
+
+TenorLike = Union[str, float, int]
+
+
+def tenor_to_years(tenor: TenorLike) -> float:
+    """Convert ``"45D"``, ``"3M"``, ``"1Y"`` (or a year fraction) to years."""
+    if isinstance(tenor, (int, float)):
+        years = float(tenor)
+    else:
+        label = tenor.strip().upper()
+        if label in _NAMED_TENORS:
+            years = _NAMED_TENORS[label] / 365.0
+        else:
+            match = _TENOR.match(label)
+            if match is None:
+                raise ValueError(f"unrecognised tenor {tenor!r}")
+            years = float(match.group(1)) * _TENOR_DAYS[match.group(2)] / 365.0
+    if years <= 0:
+        raise ValueError("tenor must be positive")
+    return years
+
+
+def _interp(xs: Sequence[float], ys: Sequence[float], x: float) -> float:
+    """Piecewise-linear interpolation with flat extrapolation."""
+    if x <= xs[0]:
+        return ys[0]
+    if x >= xs[-1]:
+        return ys[-1]
+    i = bisect_right(xs, x) - 1
+    weight = (x - xs[i]) / (xs[i + 1] - xs[i])
+    return ys[i] + (ys[i + 1] - ys[i]) * weight
+
+
+class VolSurface:
+    """Immutable vol surface for one pair on a tenor x delta grid.
+
+    Each tenor row is completed across the delta grid by linear smile
+    interpolation (flat beyond the quoted wings); between tenors the surface is
+    linear in total variance ``sigma**2 * T`` and flat in vol outside the
+    quoted tenor range. Deltas are call deltas, so ATM is ``0.5``.
+    """
+
+    __slots__ = ("pair", "ts", "_tenors", "_deltas", "_vols")
+
+    def __init__(
+        self,
+        pair: str,
+        points: Mapping[Tuple[TenorLike, float], float],
+        *,
+        ts: Optional[datetime] = None,
+    ) -> None:
+        if not points:
+            raise ValueError("a surface needs at least one point")
+        rows: Dict[float, Dict[float, float]] = {}
+        for (tenor, delta), sigma in points.items():
+            if sigma <= 0:
+                raise ValueError("sigma must be positive")
+            if not 0 < delta < 1:
+                raise ValueError("delta must be between 0 and 1")
+            rows.setdefault(tenor_to_years(tenor), {})[float(delta)] = float(sigma)
+
+        self.pair = pair.upper()
+        self.ts = ts
+        self._tenors = array("d", sorted(rows))
+        self._deltas = array("d", sorted({delta for row in rows.values() for delta in row}))
+        # Vol grid, row-major by tenor, with each smile filled across every delta.
+        self._vols: List[array] = []
+        for years in self._tenors:
+            row = rows[years]
+            quoted = sorted(row)
+            vols = [row[delta] for delta in quoted]
+            self._vols.append(array("d", (_interp(quoted, vols, delta) for delta in self._deltas)))
+
+    @property
+    def tenors(self) -> List[float]:
+        return list(self._tenors)
+
+    @property
+    def deltas(self) -> List[float]:
+        return list(self._deltas)
+
+    def sigma(
+        self, tenors: Iterable[TenorLike], deltas: Union[float, Iterable[float]] = ATM_DELTA
+    ) -> List[float]:
+        """Vols for each ``(tenor, delta)``; a scalar ``deltas`` is broadcast.
+
+        Deltas are call deltas in ``(0, 1)``, not strikes.
+        """
+        years = [tenor_to_years(tenor) for tenor in tenors]
+        if isinstance(deltas, (int, float)):
+            points = [float(deltas)] * len(years)
+        else:
+            points = [float(delta) for delta in deltas]
+            if len(points) == 1:
+                points *= len(years)
+            if len(points) != len(years):
+                raise ValueError("tenors and deltas must have the same length")
+        if not all(0 < delta < 1 for delta in points):
+            raise ValueError("delta must be between 0 and 1")
+
+        tenor_grid = self._tenors
+        last = len(tenor_grid) - 1
+        result: List[float] = []
+        for t, delta in zip(years, points):
+            if t <= tenor_grid[0]:
+                result.append(math.sqrt(self._row_variance(0, delta) / tenor_grid[0]))
+            elif t >= tenor_grid[last]:
+                result.append(math.sqrt(self._row_variance(last, delta) / tenor_grid[last]))
+            else:
+                i = bisect_right(tenor_grid, t) - 1
+                w0 = self._row_variance(i, delta)
+                w1 = self._row_variance(i + 1, delta)
+                weight = (t - tenor_grid[i]) / (tenor_grid[i + 1] - tenor_grid[i])
+                result.append(math.sqrt((w0 + (w1 - w0) * weight) / t))
+        return result
+
+    def atm(self, tenor: TenorLike) -> float:
+        return self.sigma([tenor])[0]
+
+    def covers(self, tenor: TenorLike) -> bool:
+        """Whether ``tenor`` lies within the quoted tenors, i.e. needs no flat extrapolation."""
+        return self._tenors[0] <= tenor_to_years(tenor) <= self._tenors[-1]
+
+    def _row_variance(self, row: int, delta: float) -> float:
+        return _interp(self._deltas, self._vols[row], delta) ** 2 * self._tenors[row]
+
+
+__all__ = ["ATM_DELTA", "VolSurface", "tenor_to_years"]
@@ -0,0 +1,198 @@
+"""Append-only time-series storage for market data observations."""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timedelta, timezone
+from threading import Lock
+from typing import Dict, Generic, Hashable, Iterator, List, Optional, Sequence, Tuple, TypeVar
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+K = TypeVar("K", bound=Hashable)
+
+
+def to_micros(value: datetime) -> int:
+    """Convert a datetime to integer microseconds since the epoch (naive means UTC)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    delta = value - _EPOCH
+    return (delta.days * 86_400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_micros(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value)
+
+
+class TimeSeries:
+    """Columnar ``(ts, value)`` arrays for a single key, sorted by timestamp.
+
+    Appends in timestamp order are O(1); late points are inserted in place.
+    Lookups use binary search over the timestamp column. Once the series holds
+    more than ``capacity`` points the oldest are evicted in one slice so the
+    amortised cost per append stays constant.
+
+    The series also remembers the last point written, which :meth:`last_written`
+    returns even when a later-timestamped point exists (a back-dated correction).
+    """
+
+    __slots__ = ("_ts", "_values", "_capacity", "_retention", "_last")
+
+    def __init__(self, capacity: int = 10_000, retention: Optional[timedelta] = None) -> None:
+        if capacity < 1:
+            raise ValueError("capacity must be positive")
+        self._ts = array("q")
+        self._values = array("d")
+        self._capacity = capacity
+        self._retention = retention
+        self._last: Optional[Tuple[int, float]] = None
+
+    def __len__(self) -> int:
+        return len(self._ts)
+
+    def append(self, ts: datetime, value: float) -> None:
+        micros = to_micros(ts)
+        self._append_micros(micros, value)
+        self._last = (micros, value)
+        self._evict()
+
+    def extend_micros(self, micros: Sequence[int], values: Sequence[float]) -> None:
+        """Bulk-append points given as epoch microseconds (used for warm starts).
+
+        The final point given becomes the last written one.
+        """
+        in_order = all(micros[i] <= micros[i + 1] for i in range(len(micros) - 1))
+        if in_order and micros and (not self._ts or micros[0] >= self._ts[-1]):
+            self._ts.extend(micros)
+            self._values.extend(values)
+        else:
+            for stamp, value in zip(micros, values):
+                self._append_micros(stamp, value)
+        if micros:
+            self._last = (micros[-1], values[-1])
+        self._evict()
+
+    def _append_micros(self, micros: int, value: float) -> None:
+        if not self._ts or micros >= self._ts[-1]:
+            self._ts.append(micros)
+            self._values.append(value)
+        else:
+            position = bisect_right(self._ts, micros)
+            self._ts.insert(position, micros)
+            self._values.insert(position, value)
+
+    def latest(self) -> Optional[Tuple[datetime, float]]:
+        if not self._ts:
+            return None
+        return from_micros(self._ts[-1]), self._values[-1]
+
+    def last_written(self) -> Optional[Tuple[datetime, float]]:
+        """Return the most recently written point, falling back to :meth:`latest` once it is evicted."""
+        if self._last is None:
+            return self.latest()
+        return from_micros(self._last[0]), self._last[1]
+
+    def as_of(self, ts: datetime) -> Optional[Tuple[datetime, float]]:
+        """Return the last point at or before ``ts``."""
+        position = bisect_right(self._ts, to_micros(ts))
+        if position == 0:
+            return None
+        return from_micros(self._ts[position - 1]), self._values[position - 1]
+
+    def range(self, start: Optional[datetime] = None, end: Optional[datetime] = None) -> List[Tuple[datetime, float]]:
+        """Return points with ``start <= ts <= end`` (either bound optional)."""
+        lo = bisect_left(self._ts, to_micros(start)) if start is not None else 0
+        hi = bisect_right(self._ts, to_micros(end)) if end is not None else len(self._ts)
+        return [(from_micros(self._ts[i]), self._values[i]) for i in range(lo, hi)]
+
+    def export(self) -> List[Tuple[datetime, float]]:
+        """Return every point in timestamp order, except that the last written one comes last.
+
+        Feeding the result back through :meth:`extend_micros` restores :meth:`last_written`.
+        """
+        points = self.range()
+        last = self.last_written() if self._last is not None else None
+        if last is not None and last in points:
+            points.remove(last)
+            points.append(last)
+        return points
+
+    def _evict(self) -> None:
+        drop = 0
+        overflow = len(self._ts) - self._capacity
+        if overflow > 0:
+            # Evict a little extra so we do not shift the arrays on every append.
+            drop = min(len(self._ts) - 1, overflow + self._capacity // 8)
+        if self._retention is not None and self._ts:
+            cutoff = self._ts[-1] - int(self._retention / timedelta(microseconds=1))
+            drop = max(drop, bisect_left(self._ts, cutoff))
+        if drop:
+            if self._last is not None and self._last[0] < self._ts[drop]:
+                self._last = None
+            del self._ts[:drop]
+            del self._values[:drop]
+
+
+class TimeSeriesStore(Generic[K]):
+    """Thread-safe collection of :class:`TimeSeries` keyed by pair (or pair/tenor)."""
+
+    def __init__(self, *, capacity: int = 10_000, retention: Optional[timedelta] = None) -> None:
+        self._lock = Lock()
+        self._series: Dict[K, TimeSeries] = {}
+        self._capacity = capacity
+        self._retention = retention
+
+    def append(self, key: K, ts: datetime, value: float) -> None:
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = TimeSeries(self._capacity, self._retention)
+            series.append(ts, value)
+
+    def extend_micros(self, key: K, micros: Sequence[int], values: Sequence[float]) -> None:
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = TimeSeries(self._capacity, self._retention)
+            series.extend_micros(micros, values)
+
+    def latest(self, key: K) -> Optional[Tuple[datetime, float]]:
+        with self._lock:
+            series = self._series.get(key)
+            return series.latest() if series is not None else None
+
+    def last_written(self, key: K) -> Optional[Tuple[datetime, float]]:
+        with self._lock:
+            series = self._series.get(key)
+            return series.last_written() if series is not None else None
+
+    def as_of(self, key: K, ts: datetime) -> Optional[Tuple[datetime, float]]:
+        with self._lock:
+            series = self._series.get(key)
+            return series.as_of(ts) if series is not None else None
+
+    def range(
+        self, key: K, start: Optional[datetime] = None, end: Optional[datetime] = None
+    ) -> List[Tuple[datetime, float]]:
+        with self._lock:
+            series = self._series.get(key)
+            return series.range(start, end) if series is not None else []
+
+    def export(self, key: K) -> List[Tuple[datetime, float]]:
+        with self._lock:
+            series = self._series.get(key)
+            return series.export() if series is not None else []
+
+    def keys(self) -> List[K]:
+        with self._lock:
+            return list(self._series)
+
+    def __iter__(self) -> Iterator[K]:
+        return iter(self.keys())
+
+    def clear(self) -> None:
+        with self._lock:
+            self._series.clear()
+
+
+__all__ = ["TimeSeries", "TimeSeriesStore", "from_micros", "to_micros"]
@@ -0,0 +1,115 @@
+"""Read model of payment, payout and fee totals.
+
+``payment_totals``, ``payout_totals`` and ``fee_totals`` hold a count and an
+amount in integer ``AMOUNT_SCALE`` units per group. Triggers added in schema
+version 5 update them in the same transaction as every insert, status change
+or delete on the source tables. Since version 8 they add the integer
+``amount_units`` column writers store next to each amount, so the sums are
+exact and a dashboard query reads a few dozen rows instead of every payment.
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from decimal import Decimal
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from .database import db_transaction
+from .utils import AMOUNT_SCALE
+
+# Read model table -> the columns it can be grouped and filtered by.
+DIMENSIONS: Dict[str, Tuple[str, ...]] = {
+    "payment_totals": ("provider", "currency", "status"),
+    "payout_totals": ("currency", "status"),
+    "fee_totals": ("provider", "currency"),
+}
+
+# Source query that recomputes each read model table from scratch.
+_REBUILD: Dict[str, str] = {
+    "payment_totals": (
+        "SELECT provider, currency, status, COUNT(*), SUM(amount_units) "
+        "FROM payments GROUP BY provider, currency, status"
+    ),
+    "payout_totals": (
+        "SELECT currency, status, COUNT(*), SUM(amount_units) FROM payouts GROUP BY currency, status"
+    ),
+    "fee_totals": (
+        "SELECT p.provider, p.currency, COUNT(*), SUM(f.amount_units) "
+        "FROM fee_breakdown f JOIN payments p ON p.id = f.payment_id GROUP BY p.provider, p.currency"
+    ),
+}
+
+
+@dataclass(frozen=True)
+class Total:
+    group: Dict[str, str]
+    count: int
+    amount_units: int
+
+    @property
+    def amount(self) -> Decimal:
+        return Decimal(self.amount_units) / AMOUNT_SCALE
+
+    def as_dict(self) -> Dict[str, object]:
+        return {**self.group, "count": self.count, "amount": format(self.amount, "f")}
+
+
+def _totals(table: str, group_by: Optional[Sequence[str]], filters: Dict[str, Optional[str]]) -> List[Total]:
+    dimensions = DIMENSIONS[table]
+    group_by = tuple(dimensions if group_by is None else group_by)
+    unknown = [column for column in (*group_by, *filters) if column not in dimensions]
+    if unknown:
+        raise ValueError(f"{table} cannot be grouped or filtered by {', '.join(unknown)}")
+
+    where = ["count != 0"]
+    params: List[str] = []
+    for column, value in filters.items():
+        if value is not None:
+            where.append(f"{column} = ?")
+            params.append(value.upper() if column == "currency" else value)
+    columns = ", ".join(group_by)
+    select = f"{columns}, " if group_by else ""
+    grouping = f" GROUP BY {columns} ORDER BY {columns}" if group_by else ""
+    sql = f"SELECT {select}SUM(count), SUM(amount_units) FROM {table} WHERE {' AND '.join(where)}{grouping}"
+
+    with db_transaction() as conn:
+        rows = conn.execute(sql, params).fetchall()
+    return [
+        Total(group=dict(zip(group_by, row[: len(group_by)])), count=row[-2], amount_units=row[-1])
+        for row in rows
+        if row[-2]
+    ]
+
+
+def payment_totals(
+    *,
+    group_by: Optional[Sequence[str]] = None,
+    provider: Optional[str] = None,
+    currency: Optional[str] = None,
+    status: Optional[str] = None,
+) -> List[Total]:
+    """Payment counts and amounts, grouped by any of provider, currency and status (default: all three)."""
+    return _totals("payment_totals", group_by, {"provider": provider, "currency": currency, "status": status})
+
+
+def payout_totals(
+    *, group_by: Optional[Sequence[str]] = None, currency: Optional[str] = None, status: Optional[str] = None
+) -> List[Total]:
+    return _totals("payout_totals", group_by, {"currency": currency, "status": status})
+
+
+def fee_totals(
+    *, group_by: Optional[Sequence[str]] = None, provider: Optional[str] = None, currency: Optional[str] = None
+) -> List[Total]:
+    """Totals of ``fee_breakdown`` amounts by the owning payment's provider and currency."""
+    return _totals("fee_totals", group_by, {"provider": provider, "currency": currency})
+
+
+def rebuild() -> None:
+    """Recompute every read model table from the source rows, e.g. after a manual data fix."""
+    with db_transaction() as conn:
+        for table, source in _REBUILD.items():
+            conn.execute(f"DELETE FROM {table}")
+            conn.execute(f"INSERT INTO {table} {source}")
+
+
+__all__ = ["DIMENSIONS", "Total", "fee_totals", "payment_totals", "payout_totals", "rebuild"]
@@ -3,34 +3,56 @@ from __future__ import annotations
 
 import json
 from dataclasses import asdict
-from decimal import Decimal
-from typing import Dict, Optional, Tuple
+from decimal import Decimal, InvalidOperation
+from typing import Dict, List, Optional, Tuple
 
+from . import aggregates
+from .async_service import AsyncPaymentsService
 from .database import initialize_schema
+from .outbox import outbox_relay
 from .queue import event_queue
 from .schemas import CollectRequest, CollectResponse, PayoutRequest, PayoutResponse
-from .service import create_collect, create_payout
+from .service import IdempotencyConflict, create_collect, create_payout
+from .utils import to_units
+from .webhook_pipeline import WebhookIngestor, settlement_worker
 from .webhooks import handle_dlocal_webhook, handle_stripe_webhook, handle_wise_webhook, WebhookError
 
 
 class PaymentsAPI:
     """Minimal HTTP-agnostic interface for the payments service."""
 
-    def __init__(self) -> None:
+    def __init__(self, *, background: bool = True) -> None:
         initialize_schema()
+        self.webhook_ingestor = WebhookIngestor()
+        if background:
+            self.start()
+
+    def start(self) -> None:
+        """Start the background workers: the outbox relay and the webhook settlement worker."""
+        outbox_relay.start()
+        settlement_worker.start()
+
+    def close(self) -> None:
+        """Stop the background workers; they are shared by every API instance."""
+        settlement_worker.stop()
+        outbox_relay.stop()
 
     @staticmethod
     def _parse_collect_request(body: Dict[str, object]) -> CollectRequest:
+        amount = Decimal(str(body["amount"]))
+        to_units(amount)
         return CollectRequest(
-            amount=Decimal(str(body["amount"])),
+            amount=amount,
             currency=str(body["currency"]),
             customer_meta=dict(body.get("customer_meta", {})),
         )
 
     @staticmethod
     def _parse_payout_request(body: Dict[str, object]) -> PayoutRequest:
+        amount = Decimal(str(body["amount"]))
+        to_units(amount)
         return PayoutRequest(
-            amount=Decimal(str(body["amount"])),
+            amount=amount,
             currency=str(body["currency"]),
             beneficiary_meta=dict(body.get("beneficiary_meta", {})),
         )
@@ -38,7 +60,10 @@ class PaymentsAPI:
     def post_collect_create(self, body: Dict[str, object], headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, object]]:
         headers = headers or {}
         request = self._parse_collect_request(body)
-        response = create_collect(request, headers.get("Idempotency-Key"))
+        try:
+            response = create_collect(request, headers.get("Idempotency-Key"))
+        except IdempotencyConflict as exc:
+            return 409, {"error": str(exc)}
         payload = asdict(response)
         payload["status"] = response.status.value
         return 200, payload
@@ -46,7 +71,10 @@ class PaymentsAPI:
     def post_payout_create(self, body: Dict[str, object], headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, object]]:
         headers = headers or {}
         request = self._parse_payout_request(body)
-        response = create_payout(request, headers.get("Idempotency-Key"))
+        try:
+            response = create_payout(request, headers.get("Idempotency-Key"))
+        except IdempotencyConflict as exc:
+            return 409, {"error": str(exc)}
         payload = asdict(response)
         payload["status"] = response.status.value
         return 200, payload
@@ -75,7 +103,38 @@ class PaymentsAPI:
             return 200, {"payout_id": payout_id}
         return 404, {"error": "Unknown provider"}
 
+    def post_webhook_ingest(
+        self, provider: str, body: bytes, headers: Dict[str, str]
+    ) -> Tuple[int, Dict[str, object]]:
+        """Verify, dedupe and enqueue a webhook; ``settlement_worker`` applies it later.
+
+        Returns 202 for a newly accepted event and 200 for a replay.
+        """
+        return self.webhook_ingestor.ingest(provider, body, headers)
+
+    def get_totals(self, kind: str, query: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, object]]:
+        """Serve the ``payments``, ``payouts`` or ``fees`` totals read model.
+
+        ``query`` may filter on any grouping column and pass ``group_by`` as a
+        comma-separated list (an empty string gives one grand total).
+        """
+        reader = _TOTALS.get(kind)
+        if reader is None:
+            return 404, {"error": "Unknown totals"}
+        filters = dict(query or {})
+        group_by = filters.pop("group_by", None)
+        try:
+            totals = reader(
+                group_by=None if group_by is None else [column for column in group_by.split(",") if column],
+                **filters,
+            )
+        except (TypeError, ValueError) as exc:
+            return 400, {"error": str(exc)}
+        return 200, {"totals": [total.as_dict() for total in totals]}
+
     def get_events(self) -> Tuple[int, Dict[str, object]]:
+        # Flush committed outbox rows first so callers read their own settlements.
+        outbox_relay.relay_all()
         events = []
         for event in event_queue.drain():
             payload = event.payload.__dict__ if hasattr(event.payload, "__dict__") else str(event.payload)
@@ -83,6 +142,112 @@ class PaymentsAPI:
         return 200, {"events": events}
 
 
-app = PaymentsAPI()
+_TOTALS = {
+    "payments": aggregates.payment_totals,
+    "payouts": aggregates.payout_totals,
+    "fees": aggregates.fee_totals,
+}
+
+
+def _payload(response) -> Dict[str, object]:
+    payload = asdict(response)
+    payload["status"] = response.status.value
+    return payload
+
+
+class AsyncPaymentsAPI:
+    """Asyncio counterpart of :class:`PaymentsAPI` with bulk payouts."""
+
+    def __init__(self, service: Optional[AsyncPaymentsService] = None, *, background: bool = True) -> None:
+        self._sync = PaymentsAPI(background=background)
+        self.service = service or AsyncPaymentsService()
+
+    async def post_collect_create(
+        self, body: Dict[str, object], headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Dict[str, object]]:
+        headers = headers or {}
+        request = PaymentsAPI._parse_collect_request(body)
+        try:
+            response = await self.service.create_collect(request, headers.get("Idempotency-Key"))
+        except IdempotencyConflict as exc:
+            return 409, {"error": str(exc)}
+        return 200, _payload(response)
+
+    async def post_payout_create(
+        self, body: Dict[str, object], headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Dict[str, object]]:
+        headers = headers or {}
+        request = PaymentsAPI._parse_payout_request(body)
+        try:
+            response = await self.service.create_payout(request, headers.get("Idempotency-Key"))
+        except IdempotencyConflict as exc:
+            return 409, {"error": str(exc)}
+        return 200, _payload(response)
+
+    async def post_payout_batch(
+        self, body: Dict[str, object], headers: Optional[Dict[str, str]] = None
+    ) -> Tuple[int, Dict[str, object]]:
+        """Fan out ``body["payouts"]`` concurrently and report one result per item.
+
+        Each item may carry its own ``idempotency_key``; otherwise a batch-level
+        ``Idempotency-Key`` header yields ``"<key>:<index>"`` so a retried batch
+        only creates the payouts that are still missing. Each result carries the
+        item's ``index`` and an ``http_status`` (200, 400, 409 or 502).
+        """
+        headers = headers or {}
+        items = body.get("payouts")
+        if not isinstance(items, list):
+            return 400, {"error": "payouts must be a list"}
+        batch_key = headers.get("Idempotency-Key")
+
+        results: List[Optional[Dict[str, object]]] = [None] * len(items)
+        pending: List[Tuple[int, PayoutRequest, Optional[str]]] = []
+        seen_keys = set()
+        for index, item in enumerate(items):
+            try:
+                request = PaymentsAPI._parse_payout_request(item)
+            except (KeyError, TypeError, ValueError, InvalidOperation) as exc:
+                results[index] = {"index": index, "http_status": 400, "error": f"invalid payout: {exc!r}"}
+                continue
+            key = item.get("idempotency_key") or (f"{batch_key}:{index}" if batch_key else None)
+            if key is not None and key in seen_keys:
+                results[index] = {"index": index, "http_status": 400, "error": "duplicate idempotency key in batch"}
+                continue
+            seen_keys.add(key)
+            pending.append((index, request, key))
+
+        outcomes = await self.service.create_payouts([(request, key) for _, request, key in pending])
+        for (index, _, _), outcome in zip(pending, outcomes):
+            if isinstance(outcome, IdempotencyConflict):
+                results[index] = {"index": index, "http_status": 409, "error": str(outcome)}
+            elif isinstance(outcome, Exception):
+                results[index] = {"index": index, "http_status": 502, "error": str(outcome)}
+            else:
+                results[index] = {"index": index, "http_status": 200, **_payload(outcome)}
+
+        succeeded = sum(1 for result in results if result and result["http_status"] == 200)
+        return 200, {"results": results, "succeeded": succeeded, "failed": len(results) - succeeded}
+
+    async def post_webhook(self, provider: str, body: bytes, headers: Dict[str, str]) -> Tuple[int, Dict[str, object]]:
+        return await self.service.run_db(self._sync.post_webhook, provider, body, headers)
+
+    async def post_webhook_ingest(
+        self, provider: str, body: bytes, headers: Dict[str, str]
+    ) -> Tuple[int, Dict[str, object]]:
+        return await self.service.run_db(self._sync.post_webhook_ingest, provider, body, headers)
+
+    async def get_totals(self, kind: str, query: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, object]]:
+        return await self.service.run_db(self._sync.get_totals, kind, query)
+
+    async def get_events(self) -> Tuple[int, Dict[str, object]]:
+        return self._sync.get_events()
+
+    def close(self) -> None:
+        self._sync.close()
+        self.service.close()
+
+
+# Importing the module must not start threads; servers call ``app.start()`` on startup.
+app = PaymentsAPI(background=False)
 
-__all__ = ["PaymentsAPI", "app"]
+__all__ = ["AsyncPaymentsAPI", "PaymentsAPI", "app"]
@@ -0,0 +1,175 @@
+"""Asyncio front end for the payments service layer.
+
+Provider calls are awaited under a per-provider concurrency limit; the
+reserve and finalize transactions from :mod:`.service` run on a small pool of
+database threads, each reusing its pooled SQLite connection, so the event loop
+never blocks on SQLite or on a provider round trip.
+"""
+from __future__ import annotations
+
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Mapping, Optional, Sequence, Tuple, TypeVar, Union
+
+from . import queries, service
+from .config import get_settings
+from .providers.base import ProviderRejected
+from .providers.registry import get_collect_provider, get_payout_provider
+from .schemas import CollectRequest, CollectResponse, PayoutRequest, PayoutResponse
+from .service import (
+    _abandon_collect,
+    _abandon_payout,
+    _collect_outcome_unknown,
+    _finalize_collect,
+    _finalize_payout,
+    _heartbeat,
+    _POLL_INTERVAL,
+    _payout_outcome_unknown,
+    _reserve_collect,
+    _reserve_payout,
+    _still_in_progress,
+)
+
+T = TypeVar("T")
+
+
+class ProviderLimits:
+    """Per-provider concurrency limits and the worker pools behind them.
+
+    ``limits`` overrides the default (``Settings.provider_concurrency``) for
+    named providers. Each provider gets a semaphore bounding in-flight calls and
+    a thread pool of the same size that blocking clients run on, so one slow
+    provider cannot starve the others.
+    """
+
+    def __init__(self, limits: Optional[Mapping[str, int]] = None, *, default: Optional[int] = None) -> None:
+        self.default = default or get_settings().provider_concurrency
+        self._limits = dict(limits or {})
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._executors: Dict[str, ThreadPoolExecutor] = {}
+
+    def limit(self, provider: str) -> int:
+        return self._limits.get(provider, self.default)
+
+    def semaphore(self, provider: str) -> asyncio.Semaphore:
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = self._semaphores[provider] = asyncio.Semaphore(self.limit(provider))
+        return semaphore
+
+    def executor(self, provider: str) -> ThreadPoolExecutor:
+        executor = self._executors.get(provider)
+        if executor is None:
+            executor = self._executors[provider] = ThreadPoolExecutor(
+                max_workers=self.limit(provider), thread_name_prefix=f"payments-{provider}"
+            )
+        return executor
+
+    def shutdown(self) -> None:
+        for executor in self._executors.values():
+            executor.shutdown(wait=False)
+        self._executors.clear()
+        self._semaphores.clear()
+
+
+class AsyncPaymentsService:
+    """Async ``create_collect`` / ``create_payout`` with bounded provider fan-out.
+
+    An instance binds its semaphores to the event loop it first runs on.
+    """
+
+    def __init__(self, *, limits: Optional[ProviderLimits] = None, db_workers: Optional[int] = None) -> None:
+        self.limits = limits or ProviderLimits()
+        self._db = ThreadPoolExecutor(
+            max_workers=db_workers or get_settings().db_workers, thread_name_prefix="payments-db"
+        )
+
+    async def run_db(self, func: Callable[..., T], *args: object) -> T:
+        """Run a blocking database call on the database thread pool."""
+        return await asyncio.get_running_loop().run_in_executor(self._db, func, *args)
+
+    async def _reserve(self, reserve: Callable[..., Optional[T]], idempotency_key: Optional[str], *args: object) -> T:
+        """Reserve ``idempotency_key``, waiting for an in-flight duplicate on the event loop.
+
+        Each attempt is a short non-blocking ``run_db`` call, so a waiting
+        duplicate never holds one of the database threads while it sleeps.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + service.RESERVATION_WAIT_SECONDS
+        attempt = functools.partial(reserve, *args, wait=False)
+        while True:
+            reserved = await self.run_db(attempt)
+            if reserved is not None:
+                return reserved
+            if loop.time() >= deadline:
+                raise _still_in_progress(idempotency_key)
+            await asyncio.sleep(_POLL_INTERVAL)
+
+    async def create_collect(self, request: CollectRequest, idempotency_key: Optional[str]) -> CollectResponse:
+        provider = get_collect_provider(request.currency)
+        payment_id, existing = await self._reserve(
+            _reserve_collect, idempotency_key, request, idempotency_key, provider.name
+        )
+        if existing is not None:
+            return existing
+        try:
+            async with self.limits.semaphore(provider.name):
+                with _heartbeat.hold(queries.TOUCH_PAYMENT, payment_id):
+                    result = await provider.acreate_collect(
+                        request.amount,
+                        request.currency,
+                        request.customer_meta,
+                        idempotency_key=payment_id,
+                        executor=self.limits.executor(provider.name),
+                    )
+        except ProviderRejected:
+            await self.run_db(_abandon_collect, payment_id)
+            raise
+        except BaseException:
+            # Cancelled or failed mid-call: the provider may have the collect.
+            await self.run_db(_collect_outcome_unknown, payment_id)
+            raise
+        return await self.run_db(_finalize_collect, payment_id, result)
+
+    async def create_payout(self, request: PayoutRequest, idempotency_key: Optional[str]) -> PayoutResponse:
+        provider = get_payout_provider(request.currency)
+        payout_id, existing = await self._reserve(_reserve_payout, idempotency_key, request, idempotency_key)
+        if existing is not None:
+            return existing
+        try:
+            async with self.limits.semaphore(provider.name):
+                with _heartbeat.hold(queries.TOUCH_PAYOUT, payout_id):
+                    result = await provider.acreate_payout(
+                        request.amount,
+                        request.currency,
+                        request.beneficiary_meta,
+                        idempotency_key=payout_id,
+                        executor=self.limits.executor(provider.name),
+                    )
+        except ProviderRejected:
+            await self.run_db(_abandon_payout, payout_id)
+            raise
+        except BaseException:
+            await self.run_db(_payout_outcome_unknown, payout_id)
+            raise
+        return await self.run_db(_finalize_payout, payout_id, result)
+
+    async def create_payouts(
+        self, items: Sequence[Tuple[PayoutRequest, Optional[str]]]
+    ) -> List[Union[PayoutResponse, Exception]]:
+        """Create many payouts concurrently; failures are returned in place, not raised."""
+        results = await asyncio.gather(
+            *(self.create_payout(request, key) for request, key in items), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException) and not isinstance(result, Exception):
+                raise result
+        return list(results)
+
+    def close(self) -> None:
+        self.limits.shutdown()
+        self._db.shutdown(wait=True)
+
+
+__all__ = ["AsyncPaymentsService", "ProviderLimits"]
@@ -16,6 +16,11 @@ class Settings:
     wise_webhook_secret: str = os.getenv("PAYMENTS_WISE_WEBHOOK_SECRET", "whsec_wise")
     wise_api_key: str = os.getenv("PAYMENTS_WISE_API_KEY", "wise_sandbox")
     queue_name: str = os.getenv("PAYMENTS_QUEUE_NAME", "payments-events")
+    # Empty means "<database stem>-events.db" next to the payments database.
+    event_queue_path: str = os.getenv("PAYMENTS_EVENT_QUEUE_PATH", "")
+    event_retention_days: float = float(os.getenv("PAYMENTS_EVENT_RETENTION_DAYS", "7"))
+    provider_concurrency: int = int(os.getenv("PAYMENTS_PROVIDER_CONCURRENCY", "32"))
+    db_workers: int = int(os.getenv("PAYMENTS_DB_WORKERS", "4"))
 
 
 @lru_cache()
@@ -1,10 +1,13 @@
 """SQLite helpers for the payments service."""
 from __future__ import annotations
 
+import os
 import sqlite3
+import threading
+import weakref
 from contextlib import contextmanager
 from pathlib import Path
-from typing import Iterator
+from typing import Callable, Iterator, Optional
 
 from .config import get_settings
 
@@ -14,18 +17,154 @@ def _ensure_directory(path: Path) -> None:
         path.parent.mkdir(parents=True, exist_ok=True)
 
 
-def _get_connection() -> sqlite3.Connection:
-    settings = get_settings()
-    db_path = Path(settings.database_path)
-    _ensure_directory(db_path)
-    conn = sqlite3.connect(str(db_path))
+def _configure(conn: sqlite3.Connection, busy_timeout_ms: int) -> None:
     conn.row_factory = sqlite3.Row
-    return conn
+    conn.execute(f"PRAGMA busy_timeout = {int(busy_timeout_ms)}")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+
+
+def _close_quietly(conn: sqlite3.Connection) -> None:
+    try:
+        conn.close()
+    except sqlite3.Error:  # pragma: no cover - defensive
+        pass
+
+
+class _Checkout:
+    """A thread's pooled connection; closing it when the thread-local is freed."""
+
+    __slots__ = ("conn", "path", "inode", "close", "__weakref__")
+
+    def __init__(self, conn: sqlite3.Connection, path: Path, inode: Optional[int]) -> None:
+        self.conn = conn
+        self.path = path
+        self.inode = inode
+        # Runs when the owning thread exits (its thread-local is dropped) or on close_all.
+        self.close = weakref.finalize(self, _close_quietly, conn)
+
+
+class ConnectionPool:
+    """Thread-local SQLite connections reused across transactions.
+
+    Each thread keeps one connection per database path, opened in WAL mode
+    with ``synchronous=NORMAL`` and a busy timeout, so a transaction costs a
+    ``BEGIN``/``COMMIT`` rather than a connect and a journal fsync. ``path``
+    returns the database file (default: ``Settings.database_path``). The
+    database file's inode is checked on checkout; if the file was replaced or
+    removed the stale connection is dropped and a new one opened.
+    ``on_connect`` runs once on every newly opened connection, e.g. to bring
+    its schema up to date. A connection is closed when its thread exits; the
+    pool itself only holds weak references to them.
+    """
+
+    def __init__(
+        self,
+        *,
+        busy_timeout_ms: int = 5000,
+        reuse: bool = True,
+        path: Optional[Callable[[], str]] = None,
+        on_connect: Optional[Callable[[sqlite3.Connection], object]] = None,
+    ) -> None:
+        self.busy_timeout_ms = busy_timeout_ms
+        self.reuse = reuse
+        self._path = path or (lambda: get_settings().database_path)
+        self._on_connect = on_connect
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._checkouts: "weakref.WeakSet[_Checkout]" = weakref.WeakSet()
+
+    def acquire(self) -> sqlite3.Connection:
+        db_path = Path(self._path())
+        _ensure_directory(db_path)
+        if not self.reuse:
+            return self._open(db_path)
+
+        cached: Optional[_Checkout] = getattr(self._local, "entry", None)
+        inode = _inode(db_path)
+        if cached is not None:
+            if cached.path == db_path and inode is not None and inode == cached.inode:
+                return cached.conn
+            self._discard(cached)
+
+        checkout = _Checkout(self._open(db_path), db_path, _inode(db_path))
+        self._local.entry = checkout
+        with self._lock:
+            self._checkouts.add(checkout)
+        return checkout.conn
+
+    def _open(self, db_path: Path) -> sqlite3.Connection:
+        conn = sqlite3.connect(str(db_path), check_same_thread=False)
+        _configure(conn, self.busy_timeout_ms)
+        if self._on_connect is not None:
+            try:
+                self._on_connect(conn)
+            except Exception:
+                conn.close()
+                raise
+        return conn
+
+    def release(self, conn: sqlite3.Connection) -> None:
+        if not self.reuse:
+            conn.close()
+
+    def close_all(self) -> None:
+        """Close every pooled connection (all threads must be idle)."""
+        with self._lock:
+            checkouts, self._checkouts = list(self._checkouts), weakref.WeakSet()
+        for checkout in checkouts:
+            checkout.close()
+        self._local = threading.local()
+
+    def _discard(self, checkout: _Checkout) -> None:
+        with self._lock:
+            self._checkouts.discard(checkout)
+        checkout.close()
+        self._local.entry = None
+
+
+def _inode(path: Path) -> Optional[int]:
+    try:
+        return os.stat(path).st_ino
+    except FileNotFoundError:
+        return None
+
+
+pool = ConnectionPool()
+_depth = threading.local()
 
 
 @contextmanager
 def db_transaction() -> Iterator[sqlite3.Connection]:
-    conn = _get_connection()
+    """Run a transaction on this thread's pooled connection.
+
+    Nested calls on the same thread use a savepoint instead of committing the
+    outer transaction early.
+    """
+    depth = getattr(_depth, "value", 0)
+    if depth:
+        conn = _depth.conn
+        if not conn.in_transaction:
+            # A SAVEPOINT outside a transaction would start (and RELEASE commit)
+            # its own; open the outer transaction so a later rollback covers it.
+            conn.execute("BEGIN IMMEDIATE")
+        savepoint = f"sp_{depth}"
+        conn.execute(f"SAVEPOINT {savepoint}")
+        _depth.value = depth + 1
+        try:
+            yield conn
+            conn.execute(f"RELEASE {savepoint}")
+        except Exception:
+            conn.execute(f"ROLLBACK TO {savepoint}")
+            conn.execute(f"RELEASE {savepoint}")
+            raise
+        finally:
+            _depth.value = depth
+        return
+
+    conn = pool.acquire()
+    _depth.value, _depth.conn = 1, conn
     try:
         yield conn
         conn.commit()
@@ -33,71 +172,19 @@ def db_transaction() -> Iterator[sqlite3.Connection]:
         conn.rollback()
         raise
     finally:
-        conn.close()
+        _depth.value, _depth.conn = 0, None
+        pool.release(conn)
+
+
+def initialize_schema() -> int:
+    """Bring the configured database up to the latest schema version."""
+    from .migrations import migrate
+
+    conn = pool.acquire()
+    try:
+        return migrate(conn)
+    finally:
+        pool.release(conn)
 
 
-def initialize_schema() -> None:
-    with db_transaction() as conn:
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS payments (
-                id TEXT PRIMARY KEY,
-                provider TEXT NOT NULL,
-                amount TEXT NOT NULL,
-                currency TEXT NOT NULL,
-                status TEXT NOT NULL,
-                customer_meta TEXT,
-                checkout_link TEXT,
-                bank_debit_intent TEXT,
-                idempotency_key TEXT UNIQUE,
-                external_reference TEXT UNIQUE,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS beneficiaries (
-                id TEXT PRIMARY KEY,
-                currency TEXT NOT NULL,
-                meta TEXT NOT NULL,
-                idempotency_key TEXT UNIQUE,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS payouts (
-                id TEXT PRIMARY KEY,
-                amount TEXT NOT NULL,
-                currency TEXT NOT NULL,
-                status TEXT NOT NULL,
-                beneficiary_id TEXT NOT NULL,
-                idempotency_key TEXT UNIQUE,
-                external_reference TEXT UNIQUE,
-                created_at TEXT NOT NULL,
-                updated_at TEXT NOT NULL,
-                FOREIGN KEY (beneficiary_id) REFERENCES beneficiaries(id)
-            )
-            """
-        )
-        conn.execute(
-            """
-            CREATE TABLE IF NOT EXISTS fee_breakdown (
-                id TEXT PRIMARY KEY,
-                payment_id TEXT NOT NULL,
-                description TEXT NOT NULL,
-                amount TEXT NOT NULL,
-                FOREIGN KEY (payment_id) REFERENCES payments(id)
-            )
-            """
-        )
-
-
-initialize_schema()
-
-
-__all__ = ["db_transaction", "initialize_schema"]
+__all__ = ["ConnectionPool", "db_transaction", "initialize_schema", "pool"]
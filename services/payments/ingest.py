@@ -0,0 +1,349 @@
+"""Bulk ingestion of payout files (CSV or JSONL).
+
+Rows are streamed and validated, then written in chunks. Each chunk costs one
+indexed ``idempotency_key IN (...)`` lookup and two ``executemany`` inserts in
+a single transaction. Ingested payouts are stored as ``queued``.
+:func:`submit_queued_payouts` later hands them to the payout provider.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import json
+import sqlite3
+import sys
+import uuid
+from dataclasses import asdict, dataclass, field
+from decimal import Decimal, InvalidOperation
+from pathlib import Path
+from typing import IO, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+from . import queries
+from .database import db_transaction, initialize_schema
+from .models import PayoutStatus
+from .providers.base import ProviderRejected
+from .providers.registry import get_payout_provider
+from .schemas import PayoutRequest, PayoutResponse
+from .service import _finalize_payout, _heartbeat, _now, _payout_outcome_unknown, _serialize_amount
+from .utils import to_units
+
+DEFAULT_CHUNK_SIZE = 500
+# Chunk writes that keep hitting a unique key fall back to one row at a time.
+MAX_CHUNK_ATTEMPTS = 3
+
+Source = Union[str, Path, IO[str]]
+
+
+@dataclass
+class RowOutcome:
+    line: int
+    status: str  # "created", "duplicate" or "invalid"
+    idempotency_key: Optional[str] = None
+    payout_id: Optional[str] = None
+    beneficiary_id: Optional[str] = None
+    error: Optional[str] = None
+
+
+@dataclass
+class IngestReport:
+    outcomes: List[RowOutcome] = field(default_factory=list)
+
+    def count(self, status: str) -> int:
+        return sum(1 for outcome in self.outcomes if outcome.status == status)
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "created": self.count("created"),
+            "duplicate": self.count("duplicate"),
+            "invalid": self.count("invalid"),
+            "rows": [asdict(outcome) for outcome in self.outcomes],
+        }
+
+
+@dataclass
+class _ParsedRow:
+    line: int
+    key: str
+    request: PayoutRequest
+
+
+def _detect_format(source: Source, format: Optional[str]) -> str:
+    if format:
+        return format.lower()
+    name = str(source) if isinstance(source, (str, Path)) else getattr(source, "name", "")
+    suffix = Path(name).suffix.lower()
+    if suffix == ".csv":
+        return "csv"
+    if suffix in (".jsonl", ".ndjson"):
+        return "jsonl"
+    raise ValueError(f"cannot infer payout file format from {name!r}; pass format='csv' or 'jsonl'")
+
+
+def _iter_records(handle: IO[str], format: str) -> Iterator[Tuple[int, object]]:
+    if format == "csv":
+        reader = csv.DictReader(handle)
+        for record in reader:
+            yield reader.line_num, record
+    elif format == "jsonl":
+        for line, text in enumerate(handle, start=1):
+            if not text.strip():
+                continue
+            try:
+                yield line, json.loads(text)
+            except json.JSONDecodeError as exc:
+                yield line, exc
+    else:
+        raise ValueError(f"unsupported payout file format {format!r}")
+
+
+def _parse(line: int, record: object) -> Union[_ParsedRow, RowOutcome]:
+    if isinstance(record, json.JSONDecodeError):
+        return RowOutcome(line=line, status="invalid", error=f"invalid JSON: {record.msg}")
+    if not isinstance(record, dict):
+        return RowOutcome(line=line, status="invalid", error="row must be an object")
+
+    key = str(record.get("idempotency_key") or "").strip() or None
+    if key is None:
+        return RowOutcome(line=line, status="invalid", error="idempotency_key is required")
+    try:
+        amount = Decimal(str(record.get("amount", "")).strip())
+    except InvalidOperation:
+        return RowOutcome(line=line, status="invalid", idempotency_key=key, error="amount is not a number")
+    if not amount.is_finite() or amount <= 0:
+        return RowOutcome(line=line, status="invalid", idempotency_key=key, error="amount must be positive")
+    try:
+        to_units(amount)
+    except ValueError as exc:
+        return RowOutcome(line=line, status="invalid", idempotency_key=key, error=str(exc))
+    currency = str(record.get("currency") or "").strip().upper()
+    if len(currency) != 3 or not currency.isalpha():
+        return RowOutcome(line=line, status="invalid", idempotency_key=key, error="currency must be an ISO code")
+
+    meta = record.get("beneficiary_meta") or {}
+    if isinstance(meta, str):
+        try:
+            meta = json.loads(meta)
+        except json.JSONDecodeError:
+            return RowOutcome(line=line, status="invalid", idempotency_key=key, error="beneficiary_meta is not JSON")
+    if not isinstance(meta, dict):
+        return RowOutcome(line=line, status="invalid", idempotency_key=key, error="beneficiary_meta must be an object")
+    # Flat CSV columns such as ``beneficiary_iban`` become ``meta["iban"]``.
+    for column, value in record.items():
+        if column and column.startswith("beneficiary_") and column != "beneficiary_meta" and value not in (None, ""):
+            meta.setdefault(column[len("beneficiary_"):], value)
+
+    request = PayoutRequest(amount=amount, currency=currency, beneficiary_meta=meta)
+    return _ParsedRow(line=line, key=key, request=request)
+
+
+def _write_chunk(rows: List[_ParsedRow]) -> List[RowOutcome]:
+    """Insert one chunk, skipping keys that already exist.
+
+    A concurrent ``create_payout`` can claim a key after our lookup, so the
+    chunk is retried up to ``MAX_CHUNK_ATTEMPTS`` times. After that each row is
+    written alone, and a row that still violates a constraint is reported as
+    ``invalid`` instead of failing the rest of the chunk.
+    """
+    for _ in range(MAX_CHUNK_ATTEMPTS):
+        try:
+            return _insert_chunk(rows)
+        except sqlite3.IntegrityError:
+            continue
+    outcomes: List[RowOutcome] = []
+    for row in rows:
+        try:
+            outcomes.extend(_insert_chunk([row]))
+        except sqlite3.IntegrityError as exc:
+            outcomes.append(RowOutcome(row.line, "invalid", row.key, error=f"could not be stored: {exc}"))
+    return outcomes
+
+
+def _insert_chunk(rows: List[_ParsedRow]) -> List[RowOutcome]:
+    keys = [row.key for row in rows]
+    with db_transaction() as conn:
+        placeholders = ",".join("?" * len(keys))
+        existing = {
+            record["idempotency_key"]: record
+            for record in conn.execute(
+                f"SELECT id, beneficiary_id, idempotency_key FROM payouts WHERE idempotency_key IN ({placeholders})",
+                keys,
+            )
+        }
+        now = _now().isoformat()
+        outcomes: List[RowOutcome] = []
+        beneficiaries: List[Tuple[object, ...]] = []
+        payouts: List[Tuple[object, ...]] = []
+        for row in rows:
+            found = existing.get(row.key)
+            if found is not None:
+                outcomes.append(
+                    RowOutcome(row.line, "duplicate", row.key, found["id"], found["beneficiary_id"])
+                )
+                continue
+            payout_id, beneficiary_id = str(uuid.uuid4()), str(uuid.uuid4())
+            request = row.request
+            beneficiaries.append(
+                (beneficiary_id, request.currency, json.dumps(request.beneficiary_meta), row.key, now, now)
+            )
+            payouts.append(
+                (
+                    payout_id,
+                    *_serialize_amount(request.amount),
+                    request.currency,
+                    PayoutStatus.queued.value,
+                    beneficiary_id,
+                    row.key,
+                    now,
+                    now,
+                )
+            )
+            outcomes.append(RowOutcome(row.line, "created", row.key, payout_id, beneficiary_id))
+        if payouts:
+            conn.executemany(
+                """
+                INSERT INTO beneficiaries (id, currency, meta, idempotency_key, created_at, updated_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                beneficiaries,
+            )
+            conn.executemany(
+                """
+                INSERT INTO payouts (
+                    id, amount, amount_units, currency, status, beneficiary_id, idempotency_key,
+                    created_at, updated_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                """,
+                payouts,
+            )
+        return outcomes
+
+
+def ingest_records(records: Iterable[Tuple[int, object]], *, chunk_size: int = DEFAULT_CHUNK_SIZE) -> IngestReport:
+    """Validate and store ``(line, record)`` pairs in chunks of ``chunk_size``."""
+    report = IngestReport()
+    by_line: Dict[int, RowOutcome] = {}
+    lines: List[int] = []
+    seen: Dict[str, int] = {}
+    chunk: List[_ParsedRow] = []
+
+    def flush() -> None:
+        for outcome in _write_chunk(chunk):
+            by_line[outcome.line] = outcome
+        chunk.clear()
+
+    for line, record in records:
+        lines.append(line)
+        parsed = _parse(line, record)
+        if isinstance(parsed, RowOutcome):
+            by_line[line] = parsed
+            continue
+        if parsed.key in seen:
+            by_line[line] = RowOutcome(
+                line, "duplicate", parsed.key, error=f"idempotency_key repeats line {seen[parsed.key]}"
+            )
+            continue
+        seen[parsed.key] = line
+        chunk.append(parsed)
+        if len(chunk) >= chunk_size:
+            flush()
+    if chunk:
+        flush()
+
+    report.outcomes = [by_line[line] for line in lines]
+    return report
+
+
+def ingest_payout_file(
+    source: Source, *, format: Optional[str] = None, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> IngestReport:
+    """Stream a CSV or JSONL payout file into ``queued`` payouts.
+
+    CSV files need ``amount``, ``currency`` and ``idempotency_key`` columns.
+    Beneficiary details go in a ``beneficiary_meta`` JSON column or in
+    ``beneficiary_<field>`` columns. JSONL rows are objects with the same keys.
+    Rows whose key already exists, in the database or earlier in the file,
+    are reported as ``duplicate`` and not written again.
+    """
+    format = _detect_format(source, format)
+    if isinstance(source, (str, Path)):
+        with open(source, newline="", encoding="utf-8") as handle:
+            return ingest_records(_iter_records(handle, format), chunk_size=chunk_size)
+    return ingest_records(_iter_records(source, format), chunk_size=chunk_size)
+
+
+def ingest_payout_text(text: str, format: str, *, chunk_size: int = DEFAULT_CHUNK_SIZE) -> IngestReport:
+    return ingest_payout_file(io.StringIO(text, newline=""), format=format, chunk_size=chunk_size)
+
+
+def submit_queued_payouts(limit: int = 100) -> List[PayoutResponse]:
+    """Send up to ``limit`` queued payouts to their provider, oldest first.
+
+    Each payout is claimed by moving it to ``created`` (the in-flight status
+    used by :func:`.service.create_payout`) and sent with its id as the
+    provider idempotency key. A provider refusal marks the payout ``failed``;
+    any other error marks it ``unknown``. If the process dies after the claim,
+    the payout stays ``created`` until :func:`.service.expire_stale_reservations`
+    marks it ``unknown``, and :func:`.service.resolve_unknown_payouts` then
+    replays it with the same key, so it is neither lost nor paid twice.
+    """
+    with db_transaction() as conn:
+        rows = conn.execute(queries.PAYOUTS_OLDEST_BY_STATUS, (PayoutStatus.queued.value, int(limit))).fetchall()
+    submitted: List[PayoutResponse] = []
+    for row in rows:
+        with db_transaction() as conn:
+            claimed = conn.execute(
+                queries.CLAIM_PAYOUT,
+                (PayoutStatus.created.value, _now().isoformat(), row["id"], PayoutStatus.queued.value),
+            ).rowcount
+            beneficiary = conn.execute(queries.BENEFICIARY_BY_ID, (row["beneficiary_id"],)).fetchone()
+        if not claimed:
+            continue
+        meta = json.loads(beneficiary["meta"]) if beneficiary else {}
+        provider = get_payout_provider(row["currency"])
+        try:
+            with _heartbeat.hold(queries.TOUCH_PAYOUT, row["id"]):
+                result = provider.create_payout(
+                    Decimal(row["amount"]), row["currency"], meta, idempotency_key=row["id"]
+                )
+        except ProviderRejected:
+            with db_transaction() as conn:
+                conn.execute(
+                    queries.UPDATE_PAYOUT_STATUS, (PayoutStatus.failed.value, _now().isoformat(), row["id"])
+                )
+            continue
+        except Exception:
+            _payout_outcome_unknown(row["id"])
+            continue
+        submitted.append(_finalize_payout(row["id"], result))
+    return submitted
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Ingest a CSV or JSONL payout file")
+    parser.add_argument("path", help="Payout file (.csv, .jsonl or .ndjson)")
+    parser.add_argument("--format", choices=("csv", "jsonl"), help="Override format detection")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    args = parser.parse_args(argv)
+
+    initialize_schema()
+    report = ingest_payout_file(args.path, format=args.format, chunk_size=args.chunk_size)
+    json.dump(report.as_dict(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 1 if report.count("invalid") else 0
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI passthrough
+    sys.exit(main())
+
+
+__all__ = [
+    "DEFAULT_CHUNK_SIZE",
+    "IngestReport",
+    "MAX_CHUNK_ATTEMPTS",
+    "RowOutcome",
+    "ingest_payout_file",
+    "ingest_payout_text",
+    "ingest_records",
+    "submit_queued_payouts",
+]
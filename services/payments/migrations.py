@@ -0,0 +1,781 @@
+"""Versioned schema migrations for the payments database.
+
+The applied version is stored in ``PRAGMA user_version``. Each migration runs
+in its own ``BEGIN IMMEDIATE`` transaction, so concurrent processes starting
+up at the same time apply it exactly once.
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import sys
+from dataclasses import dataclass
+from typing import List, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: int
+    description: str
+    statements: Tuple[str, ...]
+
+
+# Migrations are frozen: their SQL is spelled out here rather than built from
+# helpers elsewhere in the package, so changing those helpers never changes
+# what an already-published version does.
+_TOTALS_TRIGGERS = tuple(
+    f"{totals}_{event}"
+    for totals in ("payment_totals", "payout_totals", "fee_totals")
+    for event in ("insert", "delete", "update")
+)
+
+
+MIGRATIONS: Tuple[Migration, ...] = (
+    Migration(
+        1,
+        "baseline tables",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS payments (
+                id TEXT PRIMARY KEY,
+                provider TEXT NOT NULL,
+                amount TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                status TEXT NOT NULL,
+                customer_meta TEXT,
+                checkout_link TEXT,
+                bank_debit_intent TEXT,
+                idempotency_key TEXT UNIQUE,
+                external_reference TEXT UNIQUE,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS beneficiaries (
+                id TEXT PRIMARY KEY,
+                currency TEXT NOT NULL,
+                meta TEXT NOT NULL,
+                idempotency_key TEXT UNIQUE,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS payouts (
+                id TEXT PRIMARY KEY,
+                amount TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                status TEXT NOT NULL,
+                beneficiary_id TEXT NOT NULL,
+                idempotency_key TEXT UNIQUE,
+                external_reference TEXT UNIQUE,
+                created_at TEXT NOT NULL,
+                updated_at TEXT NOT NULL,
+                FOREIGN KEY (beneficiary_id) REFERENCES beneficiaries(id)
+            )
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS fee_breakdown (
+                id TEXT PRIMARY KEY,
+                payment_id TEXT NOT NULL,
+                description TEXT NOT NULL,
+                amount TEXT NOT NULL,
+                FOREIGN KEY (payment_id) REFERENCES payments(id)
+            )
+            """,
+        ),
+    ),
+    Migration(
+        2,
+        "lookup indexes for fees, status sweeps and payout beneficiaries",
+        (
+            "CREATE INDEX IF NOT EXISTS idx_fee_breakdown_payment_id ON fee_breakdown (payment_id)",
+            "CREATE INDEX IF NOT EXISTS idx_payments_status ON payments (status, updated_at)",
+            "CREATE INDEX IF NOT EXISTS idx_payouts_status ON payouts (status, updated_at)",
+            "CREATE INDEX IF NOT EXISTS idx_payouts_beneficiary_id ON payouts (beneficiary_id)",
+        ),
+    ),
+    Migration(
+        3,
+        "transactional outbox for domain events",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS outbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                event_id TEXT NOT NULL UNIQUE,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                created_at TEXT NOT NULL
+            )
+            """,
+        ),
+    ),
+    Migration(
+        4,
+        "webhook inbox for deduplicated, batched settlement",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS webhook_inbox (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                provider TEXT NOT NULL,
+                event_id TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                received_at TEXT NOT NULL,
+                processed_at TEXT,
+                result TEXT,
+                UNIQUE (provider, event_id)
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_webhook_inbox_pending ON webhook_inbox (processed_at, id)",
+        ),
+    ),
+    Migration(
+        5,
+        "status and fee totals maintained by triggers",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS payment_totals (
+                provider TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                amount_units INTEGER NOT NULL,
+                PRIMARY KEY (provider, currency, status)
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS payout_totals (
+                currency TEXT NOT NULL,
+                status TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                amount_units INTEGER NOT NULL,
+                PRIMARY KEY (currency, status)
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE TABLE IF NOT EXISTS fee_totals (
+                provider TEXT NOT NULL,
+                currency TEXT NOT NULL,
+                count INTEGER NOT NULL,
+                amount_units INTEGER NOT NULL,
+                PRIMARY KEY (provider, currency)
+            ) WITHOUT ROWID
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_insert AFTER INSERT ON payments BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (
+                    NEW.provider, NEW.currency, NEW.status, 1,
+                    CAST(ROUND(CAST(NEW.amount AS REAL) * 10000) AS INTEGER)
+                )
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_delete AFTER DELETE ON payments BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (
+                    OLD.provider, OLD.currency, OLD.status, -1,
+                    -CAST(ROUND(CAST(OLD.amount AS REAL) * 10000) AS INTEGER)
+                )
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_update
+            AFTER UPDATE OF provider, currency, status, amount ON payments
+            WHEN OLD.provider IS NOT NEW.provider
+              OR OLD.currency IS NOT NEW.currency
+              OR OLD.status IS NOT NEW.status
+              OR OLD.amount IS NOT NEW.amount
+            BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (
+                    OLD.provider, OLD.currency, OLD.status, -1,
+                    -CAST(ROUND(CAST(OLD.amount AS REAL) * 10000) AS INTEGER)
+                )
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (
+                    NEW.provider, NEW.currency, NEW.status, 1,
+                    CAST(ROUND(CAST(NEW.amount AS REAL) * 10000) AS INTEGER)
+                )
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+            SELECT provider, currency, status, COUNT(*), SUM(CAST(ROUND(CAST(amount AS REAL) * 10000) AS INTEGER))
+            FROM payments GROUP BY provider, currency, status
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_insert AFTER INSERT ON payouts BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (NEW.currency, NEW.status, 1, CAST(ROUND(CAST(NEW.amount AS REAL) * 10000) AS INTEGER))
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_delete AFTER DELETE ON payouts BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (OLD.currency, OLD.status, -1, -CAST(ROUND(CAST(OLD.amount AS REAL) * 10000) AS INTEGER))
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_update
+            AFTER UPDATE OF currency, status, amount ON payouts
+            WHEN OLD.currency IS NOT NEW.currency
+              OR OLD.status IS NOT NEW.status
+              OR OLD.amount IS NOT NEW.amount
+            BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (OLD.currency, OLD.status, -1, -CAST(ROUND(CAST(OLD.amount AS REAL) * 10000) AS INTEGER))
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (NEW.currency, NEW.status, 1, CAST(ROUND(CAST(NEW.amount AS REAL) * 10000) AS INTEGER))
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO payout_totals (currency, status, count, amount_units)
+            SELECT currency, status, COUNT(*), SUM(CAST(ROUND(CAST(amount AS REAL) * 10000) AS INTEGER))
+            FROM payouts GROUP BY currency, status
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS fee_totals_insert AFTER INSERT ON fee_breakdown BEGIN
+                INSERT INTO fee_totals (provider, currency, count, amount_units)
+                SELECT p.provider, p.currency, 1, CAST(ROUND(CAST(NEW.amount AS REAL) * 10000) AS INTEGER)
+                FROM payments p WHERE p.id = NEW.payment_id
+                ON CONFLICT (provider, currency) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS fee_totals_delete AFTER DELETE ON fee_breakdown BEGIN
+                INSERT INTO fee_totals (provider, currency, count, amount_units)
+                SELECT p.provider, p.currency, -1, -CAST(ROUND(CAST(OLD.amount AS REAL) * 10000) AS INTEGER)
+                FROM payments p WHERE p.id = OLD.payment_id
+                ON CONFLICT (provider, currency) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO fee_totals (provider, currency, count, amount_units)
+            SELECT p.provider, p.currency, COUNT(*), SUM(CAST(ROUND(CAST(f.amount AS REAL) * 10000) AS INTEGER))
+            FROM fee_breakdown f JOIN payments p ON p.id = f.payment_id
+            GROUP BY p.provider, p.currency
+            """,
+        ),
+    ),
+    Migration(
+        6,
+        "webhook inbox retry schedule",
+        (
+            "ALTER TABLE webhook_inbox ADD COLUMN attempts INTEGER NOT NULL DEFAULT 0",
+            "ALTER TABLE webhook_inbox ADD COLUMN next_attempt_at TEXT",
+            "UPDATE webhook_inbox SET next_attempt_at = received_at WHERE processed_at IS NULL",
+            "DROP INDEX IF EXISTS idx_webhook_inbox_pending",
+            """
+            CREATE INDEX IF NOT EXISTS idx_webhook_inbox_due
+            ON webhook_inbox (next_attempt_at, id) WHERE processed_at IS NULL
+            """,
+        ),
+    ),
+    Migration(
+        7,
+        "exact integer scaling for totals",
+        (
+            # Version 5 scaled amounts through a REAL; rebuild the triggers and totals exactly.
+            *(f"DROP TRIGGER IF EXISTS {trigger}" for trigger in _TOTALS_TRIGGERS),
+            "DELETE FROM payment_totals",
+            "DELETE FROM payout_totals",
+            "DELETE FROM fee_totals",
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_insert AFTER INSERT ON payments BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (
+                    NEW.provider, NEW.currency, NEW.status, 1,
+                    (CASE WHEN TRIM(NEW.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                        CAST(SUBSTR(
+                            LTRIM(TRIM(NEW.amount), '-') || '.', 1,
+                            INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') - 1
+                        ) AS INTEGER) * 10000
+                        + CAST(SUBSTR(
+                            REPLACE(SUBSTR(
+                                LTRIM(TRIM(NEW.amount), '-') || '.',
+                                INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') + 1
+                            ), '.', '') || '0000', 1, 4
+                        ) AS INTEGER)
+                    ))
+                )
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_delete AFTER DELETE ON payments BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (
+                    OLD.provider, OLD.currency, OLD.status, -1,
+                    -(CASE WHEN TRIM(OLD.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                        CAST(SUBSTR(
+                            LTRIM(TRIM(OLD.amount), '-') || '.', 1,
+                            INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') - 1
+                        ) AS INTEGER) * 10000
+                        + CAST(SUBSTR(
+                            REPLACE(SUBSTR(
+                                LTRIM(TRIM(OLD.amount), '-') || '.',
+                                INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') + 1
+                            ), '.', '') || '0000', 1, 4
+                        ) AS INTEGER)
+                    ))
+                )
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_update
+            AFTER UPDATE OF provider, currency, status, amount ON payments
+            WHEN OLD.provider IS NOT NEW.provider
+              OR OLD.currency IS NOT NEW.currency
+              OR OLD.status IS NOT NEW.status
+              OR OLD.amount IS NOT NEW.amount
+            BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (
+                    OLD.provider, OLD.currency, OLD.status, -1,
+                    -(CASE WHEN TRIM(OLD.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                        CAST(SUBSTR(
+                            LTRIM(TRIM(OLD.amount), '-') || '.', 1,
+                            INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') - 1
+                        ) AS INTEGER) * 10000
+                        + CAST(SUBSTR(
+                            REPLACE(SUBSTR(
+                                LTRIM(TRIM(OLD.amount), '-') || '.',
+                                INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') + 1
+                            ), '.', '') || '0000', 1, 4
+                        ) AS INTEGER)
+                    ))
+                )
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (
+                    NEW.provider, NEW.currency, NEW.status, 1,
+                    (CASE WHEN TRIM(NEW.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                        CAST(SUBSTR(
+                            LTRIM(TRIM(NEW.amount), '-') || '.', 1,
+                            INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') - 1
+                        ) AS INTEGER) * 10000
+                        + CAST(SUBSTR(
+                            REPLACE(SUBSTR(
+                                LTRIM(TRIM(NEW.amount), '-') || '.',
+                                INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') + 1
+                            ), '.', '') || '0000', 1, 4
+                        ) AS INTEGER)
+                    ))
+                )
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+            SELECT provider, currency, status, COUNT(*), SUM((CASE WHEN TRIM(amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                CAST(SUBSTR(
+                    LTRIM(TRIM(amount), '-') || '.', 1,
+                    INSTR(LTRIM(TRIM(amount), '-') || '.', '.') - 1
+                ) AS INTEGER) * 10000
+                + CAST(SUBSTR(
+                    REPLACE(SUBSTR(
+                        LTRIM(TRIM(amount), '-') || '.',
+                        INSTR(LTRIM(TRIM(amount), '-') || '.', '.') + 1
+                    ), '.', '') || '0000', 1, 4
+                ) AS INTEGER)
+            )))
+            FROM payments GROUP BY provider, currency, status
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_insert AFTER INSERT ON payouts BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (NEW.currency, NEW.status, 1, (CASE WHEN TRIM(NEW.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                    CAST(SUBSTR(
+                        LTRIM(TRIM(NEW.amount), '-') || '.', 1,
+                        INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') - 1
+                    ) AS INTEGER) * 10000
+                    + CAST(SUBSTR(
+                        REPLACE(SUBSTR(
+                            LTRIM(TRIM(NEW.amount), '-') || '.',
+                            INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') + 1
+                        ), '.', '') || '0000', 1, 4
+                    ) AS INTEGER)
+                )))
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_delete AFTER DELETE ON payouts BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (OLD.currency, OLD.status, -1, -(CASE WHEN TRIM(OLD.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                    CAST(SUBSTR(
+                        LTRIM(TRIM(OLD.amount), '-') || '.', 1,
+                        INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') - 1
+                    ) AS INTEGER) * 10000
+                    + CAST(SUBSTR(
+                        REPLACE(SUBSTR(
+                            LTRIM(TRIM(OLD.amount), '-') || '.',
+                            INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') + 1
+                        ), '.', '') || '0000', 1, 4
+                    ) AS INTEGER)
+                )))
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_update
+            AFTER UPDATE OF currency, status, amount ON payouts
+            WHEN OLD.currency IS NOT NEW.currency
+              OR OLD.status IS NOT NEW.status
+              OR OLD.amount IS NOT NEW.amount
+            BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (OLD.currency, OLD.status, -1, -(CASE WHEN TRIM(OLD.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                    CAST(SUBSTR(
+                        LTRIM(TRIM(OLD.amount), '-') || '.', 1,
+                        INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') - 1
+                    ) AS INTEGER) * 10000
+                    + CAST(SUBSTR(
+                        REPLACE(SUBSTR(
+                            LTRIM(TRIM(OLD.amount), '-') || '.',
+                            INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') + 1
+                        ), '.', '') || '0000', 1, 4
+                    ) AS INTEGER)
+                )))
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (NEW.currency, NEW.status, 1, (CASE WHEN TRIM(NEW.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                    CAST(SUBSTR(
+                        LTRIM(TRIM(NEW.amount), '-') || '.', 1,
+                        INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') - 1
+                    ) AS INTEGER) * 10000
+                    + CAST(SUBSTR(
+                        REPLACE(SUBSTR(
+                            LTRIM(TRIM(NEW.amount), '-') || '.',
+                            INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') + 1
+                        ), '.', '') || '0000', 1, 4
+                    ) AS INTEGER)
+                )))
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO payout_totals (currency, status, count, amount_units)
+            SELECT currency, status, COUNT(*), SUM((CASE WHEN TRIM(amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                CAST(SUBSTR(
+                    LTRIM(TRIM(amount), '-') || '.', 1,
+                    INSTR(LTRIM(TRIM(amount), '-') || '.', '.') - 1
+                ) AS INTEGER) * 10000
+                + CAST(SUBSTR(
+                    REPLACE(SUBSTR(
+                        LTRIM(TRIM(amount), '-') || '.',
+                        INSTR(LTRIM(TRIM(amount), '-') || '.', '.') + 1
+                    ), '.', '') || '0000', 1, 4
+                ) AS INTEGER)
+            )))
+            FROM payouts GROUP BY currency, status
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS fee_totals_insert AFTER INSERT ON fee_breakdown BEGIN
+                INSERT INTO fee_totals (provider, currency, count, amount_units)
+                SELECT p.provider, p.currency, 1, (CASE WHEN TRIM(NEW.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                    CAST(SUBSTR(
+                        LTRIM(TRIM(NEW.amount), '-') || '.', 1,
+                        INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') - 1
+                    ) AS INTEGER) * 10000
+                    + CAST(SUBSTR(
+                        REPLACE(SUBSTR(
+                            LTRIM(TRIM(NEW.amount), '-') || '.',
+                            INSTR(LTRIM(TRIM(NEW.amount), '-') || '.', '.') + 1
+                        ), '.', '') || '0000', 1, 4
+                    ) AS INTEGER)
+                ))
+                FROM payments p WHERE p.id = NEW.payment_id
+                ON CONFLICT (provider, currency) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS fee_totals_delete AFTER DELETE ON fee_breakdown BEGIN
+                INSERT INTO fee_totals (provider, currency, count, amount_units)
+                SELECT p.provider, p.currency, -1, -(CASE WHEN TRIM(OLD.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                    CAST(SUBSTR(
+                        LTRIM(TRIM(OLD.amount), '-') || '.', 1,
+                        INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') - 1
+                    ) AS INTEGER) * 10000
+                    + CAST(SUBSTR(
+                        REPLACE(SUBSTR(
+                            LTRIM(TRIM(OLD.amount), '-') || '.',
+                            INSTR(LTRIM(TRIM(OLD.amount), '-') || '.', '.') + 1
+                        ), '.', '') || '0000', 1, 4
+                    ) AS INTEGER)
+                ))
+                FROM payments p WHERE p.id = OLD.payment_id
+                ON CONFLICT (provider, currency) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO fee_totals (provider, currency, count, amount_units)
+            SELECT p.provider, p.currency, COUNT(*), SUM((CASE WHEN TRIM(f.amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                CAST(SUBSTR(
+                    LTRIM(TRIM(f.amount), '-') || '.', 1,
+                    INSTR(LTRIM(TRIM(f.amount), '-') || '.', '.') - 1
+                ) AS INTEGER) * 10000
+                + CAST(SUBSTR(
+                    REPLACE(SUBSTR(
+                        LTRIM(TRIM(f.amount), '-') || '.',
+                        INSTR(LTRIM(TRIM(f.amount), '-') || '.', '.') + 1
+                    ), '.', '') || '0000', 1, 4
+                ) AS INTEGER)
+            )))
+            FROM fee_breakdown f JOIN payments p ON p.id = f.payment_id
+            GROUP BY p.provider, p.currency
+            """,
+        ),
+    ),
+    Migration(
+        8,
+        "integer amount units stored alongside each amount",
+        (
+            # Writers fill amount_units with to_units(); triggers and reconciliation read it
+            # instead of parsing the text amount on every row.
+            "ALTER TABLE payments ADD COLUMN amount_units INTEGER",
+            "ALTER TABLE payouts ADD COLUMN amount_units INTEGER",
+            "ALTER TABLE fee_breakdown ADD COLUMN amount_units INTEGER",
+            """
+            UPDATE payments SET amount_units = (CASE WHEN TRIM(amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                CAST(SUBSTR(
+                    LTRIM(TRIM(amount), '-') || '.', 1,
+                    INSTR(LTRIM(TRIM(amount), '-') || '.', '.') - 1
+                ) AS INTEGER) * 10000
+                + CAST(SUBSTR(
+                    REPLACE(SUBSTR(
+                        LTRIM(TRIM(amount), '-') || '.',
+                        INSTR(LTRIM(TRIM(amount), '-') || '.', '.') + 1
+                    ), '.', '') || '0000', 1, 4
+                ) AS INTEGER)
+            ))
+            """,
+            """
+            UPDATE payouts SET amount_units = (CASE WHEN TRIM(amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                CAST(SUBSTR(
+                    LTRIM(TRIM(amount), '-') || '.', 1,
+                    INSTR(LTRIM(TRIM(amount), '-') || '.', '.') - 1
+                ) AS INTEGER) * 10000
+                + CAST(SUBSTR(
+                    REPLACE(SUBSTR(
+                        LTRIM(TRIM(amount), '-') || '.',
+                        INSTR(LTRIM(TRIM(amount), '-') || '.', '.') + 1
+                    ), '.', '') || '0000', 1, 4
+                ) AS INTEGER)
+            ))
+            """,
+            """
+            UPDATE fee_breakdown SET amount_units = (CASE WHEN TRIM(amount) LIKE '-%' THEN -1 ELSE 1 END * (
+                CAST(SUBSTR(
+                    LTRIM(TRIM(amount), '-') || '.', 1,
+                    INSTR(LTRIM(TRIM(amount), '-') || '.', '.') - 1
+                ) AS INTEGER) * 10000
+                + CAST(SUBSTR(
+                    REPLACE(SUBSTR(
+                        LTRIM(TRIM(amount), '-') || '.',
+                        INSTR(LTRIM(TRIM(amount), '-') || '.', '.') + 1
+                    ), '.', '') || '0000', 1, 4
+                ) AS INTEGER)
+            ))
+            """,
+            *(f"DROP TRIGGER IF EXISTS {trigger}" for trigger in _TOTALS_TRIGGERS),
+            "DELETE FROM payment_totals",
+            "DELETE FROM payout_totals",
+            "DELETE FROM fee_totals",
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_insert AFTER INSERT ON payments BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (NEW.provider, NEW.currency, NEW.status, 1, NEW.amount_units)
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_delete AFTER DELETE ON payments BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (OLD.provider, OLD.currency, OLD.status, -1, -OLD.amount_units)
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payment_totals_update
+            AFTER UPDATE OF provider, currency, status, amount_units ON payments
+            WHEN OLD.provider IS NOT NEW.provider
+              OR OLD.currency IS NOT NEW.currency
+              OR OLD.status IS NOT NEW.status
+              OR OLD.amount_units IS NOT NEW.amount_units
+            BEGIN
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (OLD.provider, OLD.currency, OLD.status, -1, -OLD.amount_units)
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+                INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+                VALUES (NEW.provider, NEW.currency, NEW.status, 1, NEW.amount_units)
+                ON CONFLICT (provider, currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO payment_totals (provider, currency, status, count, amount_units)
+            SELECT provider, currency, status, COUNT(*), SUM(amount_units)
+            FROM payments GROUP BY provider, currency, status
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_insert AFTER INSERT ON payouts BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (NEW.currency, NEW.status, 1, NEW.amount_units)
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_delete AFTER DELETE ON payouts BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (OLD.currency, OLD.status, -1, -OLD.amount_units)
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS payout_totals_update
+            AFTER UPDATE OF currency, status, amount_units ON payouts
+            WHEN OLD.currency IS NOT NEW.currency
+              OR OLD.status IS NOT NEW.status
+              OR OLD.amount_units IS NOT NEW.amount_units
+            BEGIN
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (OLD.currency, OLD.status, -1, -OLD.amount_units)
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+                INSERT INTO payout_totals (currency, status, count, amount_units)
+                VALUES (NEW.currency, NEW.status, 1, NEW.amount_units)
+                ON CONFLICT (currency, status) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO payout_totals (currency, status, count, amount_units)
+            SELECT currency, status, COUNT(*), SUM(amount_units)
+            FROM payouts GROUP BY currency, status
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS fee_totals_insert AFTER INSERT ON fee_breakdown BEGIN
+                INSERT INTO fee_totals (provider, currency, count, amount_units)
+                SELECT p.provider, p.currency, 1, NEW.amount_units
+                FROM payments p WHERE p.id = NEW.payment_id
+                ON CONFLICT (provider, currency) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS fee_totals_delete AFTER DELETE ON fee_breakdown BEGIN
+                INSERT INTO fee_totals (provider, currency, count, amount_units)
+                SELECT p.provider, p.currency, -1, -OLD.amount_units
+                FROM payments p WHERE p.id = OLD.payment_id
+                ON CONFLICT (provider, currency) DO UPDATE SET
+                    count = count + excluded.count, amount_units = amount_units + excluded.amount_units;
+            END
+            """,
+            """
+            INSERT INTO fee_totals (provider, currency, count, amount_units)
+            SELECT p.provider, p.currency, COUNT(*), SUM(f.amount_units)
+            FROM fee_breakdown f JOIN payments p ON p.id = f.payment_id
+            GROUP BY p.provider, p.currency
+            """,
+        ),
+    ),
+)
+
+LATEST_VERSION = MIGRATIONS[-1].version
+
+
+def current_version(conn: sqlite3.Connection) -> int:
+    return int(conn.execute("PRAGMA user_version").fetchone()[0])
+
+
+def pending(conn: sqlite3.Connection, migrations: Sequence[Migration] = MIGRATIONS) -> List[Migration]:
+    version = current_version(conn)
+    return [migration for migration in migrations if migration.version > version]
+
+
+def migrate(
+    conn: sqlite3.Connection, migrations: Sequence[Migration] = MIGRATIONS, *, target: Optional[int] = None
+) -> int:
+    """Apply pending migrations up to ``target`` (default: latest) and return the version."""
+    if conn.in_transaction:
+        raise RuntimeError("migrate() must not run inside an open transaction")
+    for migration in migrations:
+        if target is not None and migration.version > target:
+            break
+        if migration.version <= current_version(conn):
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Another process may have applied it while we waited for the lock.
+            if migration.version > current_version(conn):
+                for statement in migration.statements:
+                    conn.execute(statement)
+                conn.execute(f"PRAGMA user_version = {int(migration.version)}")
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    return current_version(conn)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Apply payments database migrations")
+    parser.add_argument("database", help="Path to the payments SQLite database")
+    parser.add_argument("--target", type=int, help="Stop at this schema version")
+    parser.add_argument("--status", action="store_true", help="Only print the current and pending versions")
+    args = parser.parse_args(argv)
+
+    conn = sqlite3.connect(args.database)
+    try:
+        if args.status:
+            waiting = ", ".join(str(migration.version) for migration in pending(conn)) or "none"
+            print(f"schema version {current_version(conn)}; pending: {waiting}")
+            return 0
+        print(f"schema version {migrate(conn, target=args.target)}")
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI passthrough
+    sys.exit(main())
+
+
+__all__ = ["LATEST_VERSION", "MIGRATIONS", "Migration", "current_version", "migrate", "pending"]
@@ -14,13 +14,18 @@ class PaymentStatus(str, enum.Enum):
     succeeded = "succeeded"
     settled = "settled"
     failed = "failed"
+    # The provider call failed in a way that may still have created the collect.
+    unknown = "unknown"
 
 
 class PayoutStatus(str, enum.Enum):
+    queued = "queued"
     created = "created"
     processing = "processing"
     paid = "paid"
     failed = "failed"
+    # The provider call failed in a way that may still have created the payout.
+    unknown = "unknown"
 
 
 @dataclass
@@ -0,0 +1,132 @@
+"""Transactional outbox for payments domain events.
+
+Service functions call :func:`write_outbox` on the connection of the
+transaction that changes the payment, so an event exists if and only if that
+transaction commits. :class:`OutboxRelay` later moves committed rows to the
+durable event queue in batches. Every row carries an ``event_id`` that the
+queue deduplicates on, so a relay that crashes between publishing and deleting
+a batch republishes it without creating duplicates.
+"""
+from __future__ import annotations
+
+import logging
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import UTC, datetime
+from typing import List, Optional
+
+from .database import db_transaction
+from .queue import DurableEventQueue, Event, decode_payload, encode_payload, event_queue
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def write_outbox(conn: sqlite3.Connection, name: str, payload: object) -> str:
+    """Record an event inside the caller's transaction and return its id."""
+    event_id = str(uuid.uuid4())
+    conn.execute(
+        "INSERT INTO outbox (event_id, name, payload, created_at) VALUES (?, ?, ?, ?)",
+        (event_id, name, encode_payload(payload), datetime.now(tz=UTC).isoformat()),
+    )
+    return event_id
+
+
+def pending_count() -> int:
+    with db_transaction() as conn:
+        return conn.execute("SELECT COUNT(*) FROM outbox").fetchone()[0]
+
+
+@dataclass
+class RelayStats:
+    batches: int = 0
+    events: int = 0
+    seconds: float = 0.0
+    failures: int = 0
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.seconds if self.seconds else 0.0
+
+
+class OutboxRelay:
+    """Moves committed outbox rows to a :class:`DurableEventQueue` in batches."""
+
+    def __init__(self, queue: Optional[DurableEventQueue] = None, *, batch_size: int = DEFAULT_BATCH_SIZE) -> None:
+        self.queue = queue or event_queue
+        self.batch_size = batch_size
+        self.stats = RelayStats()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def relay_once(self) -> int:
+        """Publish and delete one batch of outbox rows; returns how many were relayed."""
+        with self._lock:
+            started = time.perf_counter()
+            with db_transaction() as conn:
+                rows = conn.execute(
+                    "SELECT id, event_id, name, payload, created_at FROM outbox ORDER BY id LIMIT ?",
+                    (self.batch_size,),
+                ).fetchall()
+            if not rows:
+                return 0
+            events: List[Event] = [
+                Event(
+                    name=row["name"],
+                    payload=decode_payload(row["name"], row["payload"]),
+                    published_at=datetime.fromisoformat(row["created_at"]),
+                    event_id=row["event_id"],
+                )
+                for row in rows
+            ]
+            self.queue.publish_many(events)
+            with db_transaction() as conn:
+                conn.execute("DELETE FROM outbox WHERE id <= ?", (rows[-1]["id"],))
+            self.stats.batches += 1
+            self.stats.events += len(rows)
+            self.stats.seconds += time.perf_counter() - started
+            return len(rows)
+
+    def relay_all(self) -> int:
+        """Relay until the outbox is empty; returns the number of events relayed."""
+        total = 0
+        while True:
+            relayed = self.relay_once()
+            if not relayed:
+                return total
+            total += relayed
+
+    def start(self, interval: float = 0.5) -> None:
+        """Relay in a background thread, polling every ``interval`` seconds when idle."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="payments-outbox", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.is_set():
+            try:
+                relayed = self.relay_once()
+            except Exception:  # pragma: no cover - defensive
+                self.stats.failures += 1
+                logger.exception("Outbox relay batch failed")
+                relayed = 0
+            if relayed < self.batch_size:
+                self._stop.wait(interval)
+
+
+outbox_relay = OutboxRelay()
+
+__all__ = ["DEFAULT_BATCH_SIZE", "OutboxRelay", "RelayStats", "outbox_relay", "pending_count", "write_outbox"]
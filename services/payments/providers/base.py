@@ -1,12 +1,35 @@
 """Abstract base classes for payment providers."""
 from __future__ import annotations
 
-import random
+import asyncio
+import functools
 import random
 import string
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor
 from dataclasses import dataclass
+from datetime import timedelta
 from decimal import Decimal
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+# How long the sandbox providers remember an idempotency key. A key is replayed
+# once its reservation outlives ``service.RESERVATION_TTL`` and the row is
+# resolved from ``unknown``; a day leaves room for that sweep, as real providers do.
+IDEMPOTENCY_KEY_TTL = timedelta(hours=24)
+# Cap on remembered keys, so a burst inside the TTL cannot grow memory without bound.
+IDEMPOTENCY_KEY_LIMIT = 100_000
+
+
+class ProviderRejected(RuntimeError):
+    """The provider refused the request, so nothing was created and it is safe to release.
+
+    Any other exception from a provider call (timeouts, dropped connections)
+    leaves the outcome unknown: the provider may already have accepted it.
+    """
 
 
 @dataclass
@@ -29,14 +52,80 @@ def _random_reference(prefix: str) -> str:
     return prefix + "_" + "".join(random.choices(string.ascii_lowercase + string.digits, k=12))
 
 
+class _IdempotentCalls:
+    """Sandbox stand-in for provider-side idempotency: a repeated key returns the first result.
+
+    Results are kept for ``ttl`` and at most ``max_entries`` of them, oldest
+    first out, like a provider's idempotency key retention.
+    """
+
+    def __init__(
+        self,
+        ttl: timedelta = IDEMPOTENCY_KEY_TTL,
+        max_entries: int = IDEMPOTENCY_KEY_LIMIT,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        # key -> (expires_at, result), in insertion order, so expired entries sit at the front.
+        self._results: OrderedDict[str, Tuple[float, object]] = OrderedDict()
+        self._ttl = ttl.total_seconds()
+        self._max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def call(self, key: Optional[str], func: Callable[[], T]) -> T:
+        if key is None:
+            return func()
+        with self._lock:
+            self._expire(self._clock())
+            if key in self._results:
+                return self._results[key][1]  # type: ignore[return-value]
+        result = func()
+        with self._lock:
+            now = self._clock()
+            self._expire(now)
+            # Two concurrent first calls both get whichever result was stored first.
+            stored = self._results.setdefault(key, (now + self._ttl, result))[1]
+            while len(self._results) > self._max_entries:
+                self._results.popitem(last=False)
+            return stored  # type: ignore[return-value]
+
+    def _expire(self, now: float) -> None:
+        while self._results:
+            key, (expires_at, _) = next(iter(self._results.items()))
+            if expires_at > now:
+                return
+            del self._results[key]
+
+
 class CollectProvider:
     name = "base"
 
     def create_collect(
-        self, amount: Decimal, currency: str, customer_meta: Dict[str, object]
+        self,
+        amount: Decimal,
+        currency: str,
+        customer_meta: Dict[str, object],
+        *,
+        idempotency_key: Optional[str] = None,
     ) -> CollectResult:
+        """Create a collect; a repeated ``idempotency_key`` must return the original result."""
         raise NotImplementedError
 
+    async def acreate_collect(
+        self,
+        amount: Decimal,
+        currency: str,
+        customer_meta: Dict[str, object],
+        *,
+        idempotency_key: Optional[str] = None,
+        executor: Optional[Executor] = None,
+    ) -> CollectResult:
+        """Async variant; the default runs :meth:`create_collect` on ``executor``."""
+        call = functools.partial(
+            self.create_collect, amount, currency, customer_meta, idempotency_key=idempotency_key
+        )
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+
     def interpret_webhook(self, payload: Dict[str, object]) -> Optional[Dict[str, object]]:
         raise NotImplementedError
 
@@ -45,17 +134,41 @@ class PayoutProvider:
     name = "base"
 
     def create_payout(
-        self, amount: Decimal, currency: str, beneficiary_meta: Dict[str, object]
+        self,
+        amount: Decimal,
+        currency: str,
+        beneficiary_meta: Dict[str, object],
+        *,
+        idempotency_key: Optional[str] = None,
     ) -> PayoutResult:
+        """Create a payout; a repeated ``idempotency_key`` must return the original result."""
         raise NotImplementedError
 
+    async def acreate_payout(
+        self,
+        amount: Decimal,
+        currency: str,
+        beneficiary_meta: Dict[str, object],
+        *,
+        idempotency_key: Optional[str] = None,
+        executor: Optional[Executor] = None,
+    ) -> PayoutResult:
+        """Async variant; the default runs :meth:`create_payout` on ``executor``."""
+        call = functools.partial(
+            self.create_payout, amount, currency, beneficiary_meta, idempotency_key=idempotency_key
+        )
+        return await asyncio.get_running_loop().run_in_executor(executor, call)
+
     def interpret_webhook(self, payload: Dict[str, object]) -> Optional[str]:
         raise NotImplementedError
 
 
 __all__ = [
+    "IDEMPOTENCY_KEY_LIMIT",
+    "IDEMPOTENCY_KEY_TTL",
     "CollectProvider",
     "PayoutProvider",
+    "ProviderRejected",
     "CollectResult",
     "PayoutResult",
 ]
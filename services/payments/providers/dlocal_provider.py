@@ -7,7 +7,7 @@ from typing import Dict, Optional
 
 from ..config import get_settings
 from ..utils import retry_with_backoff
-from .base import CollectProvider, CollectResult, _random_reference
+from .base import CollectProvider, CollectResult, ProviderRejected, _IdempotentCalls, _random_reference
 
 
 class DLocalCollectProvider(CollectProvider):
@@ -15,13 +15,19 @@ class DLocalCollectProvider(CollectProvider):
 
     def __init__(self) -> None:
         self.settings = get_settings()
+        self._calls = _IdempotentCalls()
 
     def create_collect(
-        self, amount: Decimal, currency: str, customer_meta: Dict[str, object]
+        self,
+        amount: Decimal,
+        currency: str,
+        customer_meta: Dict[str, object],
+        *,
+        idempotency_key: Optional[str] = None,
     ) -> CollectResult:
         def _call() -> CollectResult:
             if not self.settings.dlocal_api_key:
-                raise RuntimeError("dLocal API key missing")
+                raise ProviderRejected("dLocal API key missing")
             reference = _random_reference("dl")
             mandate = {
                 "mandate_id": reference,
@@ -35,7 +41,7 @@ class DLocalCollectProvider(CollectProvider):
                 status="pending",
             )
 
-        return retry_with_backoff(_call)
+        return self._calls.call(idempotency_key, lambda: retry_with_backoff(_call))
 
     def interpret_webhook(self, payload: Dict[str, object]) -> Optional[Dict[str, object]]:
         if payload.get("event") == "payment_updated" and payload.get("status") == "PAID":
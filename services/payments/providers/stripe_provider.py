@@ -6,7 +6,7 @@ from typing import Dict, Optional
 
 from ..config import get_settings
 from ..utils import retry_with_backoff
-from .base import CollectProvider, CollectResult, _random_reference
+from .base import CollectProvider, CollectResult, ProviderRejected, _IdempotentCalls, _random_reference
 
 
 class StripeACHCollectProvider(CollectProvider):
@@ -14,15 +14,21 @@ class StripeACHCollectProvider(CollectProvider):
 
     def __init__(self) -> None:
         self.settings = get_settings()
+        self._calls = _IdempotentCalls()
 
     def create_collect(
-        self, amount: Decimal, currency: str, customer_meta: Dict[str, object]
+        self,
+        amount: Decimal,
+        currency: str,
+        customer_meta: Dict[str, object],
+        *,
+        idempotency_key: Optional[str] = None,
     ) -> CollectResult:
         def _call() -> CollectResult:
             # Leverage the configured sandbox API key to demonstrate dependency usage.
             api_key = self.settings.stripe_api_key
             if not api_key:
-                raise RuntimeError("Stripe API key is not configured")
+                raise ProviderRejected("Stripe API key is not configured")
             reference = _random_reference("pi")
             checkout_link = f"https://sandbox.stripe.com/pay/{reference}"
             return CollectResult(
@@ -33,7 +39,7 @@ class StripeACHCollectProvider(CollectProvider):
                 status="pending",
             )
 
-        return retry_with_backoff(_call)
+        return self._calls.call(idempotency_key, lambda: retry_with_backoff(_call))
 
     def interpret_webhook(self, payload: Dict[str, object]) -> Optional[Dict[str, object]]:
         event_type = payload.get("type")
@@ -6,7 +6,7 @@ from typing import Dict, Optional
 
 from ..config import get_settings
 from ..utils import retry_with_backoff
-from .base import PayoutProvider, PayoutResult, _random_reference
+from .base import PayoutProvider, PayoutResult, ProviderRejected, _IdempotentCalls, _random_reference
 
 
 class WisePayoutProvider(PayoutProvider):
@@ -14,13 +14,19 @@ class WisePayoutProvider(PayoutProvider):
 
     def __init__(self) -> None:
         self.settings = get_settings()
+        self._calls = _IdempotentCalls()
 
     def create_payout(
-        self, amount: Decimal, currency: str, beneficiary_meta: Dict[str, object]
+        self,
+        amount: Decimal,
+        currency: str,
+        beneficiary_meta: Dict[str, object],
+        *,
+        idempotency_key: Optional[str] = None,
     ) -> PayoutResult:
         def _call() -> PayoutResult:
             if not self.settings.wise_api_key:
-                raise RuntimeError("Wise API key missing")
+                raise ProviderRejected("Wise API key missing")
             reference = _random_reference("wise")
             return PayoutResult(
                 provider=self.name,
@@ -28,7 +34,7 @@ class WisePayoutProvider(PayoutProvider):
                 status="processing",
             )
 
-        return retry_with_backoff(_call)
+        return self._calls.call(idempotency_key, lambda: retry_with_backoff(_call))
 
     def interpret_webhook(self, payload: Dict[str, object]) -> Optional[str]:
         if payload.get("event_type") == "transfers#state-change" and payload.get("current_state") == "outgoing_payment_sent":
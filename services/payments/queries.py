@@ -0,0 +1,75 @@
+"""SQL for the payments hot paths.
+
+Keeping the statements as module constants means every caller sends the same
+text, so each pooled connection's statement cache reuses one prepared
+statement per query. ``HOT_QUERIES`` lists them with sample parameters for the
+EXPLAIN-based index guard in the tests.
+"""
+from __future__ import annotations
+
+from typing import Dict, Tuple
+
+PAYMENT_BY_ID = "SELECT * FROM payments WHERE id = ?"
+PAYMENT_BY_IDEMPOTENCY_KEY = "SELECT * FROM payments WHERE idempotency_key = ?"
+PAYMENT_BY_EXTERNAL_REFERENCE = "SELECT * FROM payments WHERE external_reference = ?"
+PAYMENTS_BY_STATUS = "SELECT * FROM payments WHERE status = ? AND updated_at < ? ORDER BY updated_at"
+UPDATE_PAYMENT_STATUS = "UPDATE payments SET status = ?, updated_at = ? WHERE id = ?"
+PAYMENTS_OLDEST_BY_STATUS = "SELECT * FROM payments WHERE status = ? ORDER BY updated_at LIMIT ?"
+TRANSITION_PAYMENT = "UPDATE payments SET status = ?, updated_at = ? WHERE id = ? AND status = ?"
+# Only an in-flight row ('created', or 'unknown' being resolved) takes the new status; a webhook
+# that settled the payment before we finalized keeps its status.
+FINALIZE_PAYMENT = (
+    "UPDATE payments SET provider = ?, status = CASE WHEN status IN ('created', 'unknown') THEN ? ELSE status END, "
+    "checkout_link = ?, bank_debit_intent = ?, external_reference = ?, updated_at = ? WHERE id = ?"
+)
+TOUCH_PAYMENT = "UPDATE payments SET updated_at = ? WHERE id = ?"
+DELETE_PAYMENT = "DELETE FROM payments WHERE id = ?"
+
+PAYOUT_BY_ID = "SELECT * FROM payouts WHERE id = ?"
+PAYOUT_BY_IDEMPOTENCY_KEY = "SELECT * FROM payouts WHERE idempotency_key = ?"
+PAYOUT_BY_EXTERNAL_REFERENCE = "SELECT * FROM payouts WHERE external_reference = ?"
+PAYOUTS_BY_STATUS = "SELECT * FROM payouts WHERE status = ? AND updated_at < ? ORDER BY updated_at"
+UPDATE_PAYOUT_STATUS = "UPDATE payouts SET status = ?, updated_at = ? WHERE id = ?"
+PAYOUTS_OLDEST_BY_STATUS = "SELECT * FROM payouts WHERE status = ? ORDER BY updated_at LIMIT ?"
+CLAIM_PAYOUT = "UPDATE payouts SET status = ?, updated_at = ? WHERE id = ? AND status = ?"
+FINALIZE_PAYOUT = (
+    "UPDATE payouts SET status = CASE WHEN status IN ('created', 'unknown') THEN ? ELSE status END, "
+    "external_reference = ?, updated_at = ? WHERE id = ?"
+)
+TOUCH_PAYOUT = "UPDATE payouts SET updated_at = ? WHERE id = ?"
+DELETE_PAYOUT = "DELETE FROM payouts WHERE id = ?"
+DELETE_BENEFICIARY = "DELETE FROM beneficiaries WHERE id = ?"
+
+BENEFICIARY_BY_ID = "SELECT * FROM beneficiaries WHERE id = ?"
+
+FEES_BY_PAYMENT = "SELECT * FROM fee_breakdown WHERE payment_id = ?"
+# Finalizing twice (a resolved 'unknown' row) must not charge the fee twice.
+INSERT_FEE_ONCE = (
+    "INSERT INTO fee_breakdown (id, payment_id, description, amount, amount_units) "
+    "SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM fee_breakdown WHERE payment_id = ?)"
+)
+
+HOT_QUERIES: Dict[str, Tuple[str, Tuple[object, ...]]] = {
+    "payment_by_id": (PAYMENT_BY_ID, ("p",)),
+    "payment_by_idempotency_key": (PAYMENT_BY_IDEMPOTENCY_KEY, ("k",)),
+    "payment_by_external_reference": (PAYMENT_BY_EXTERNAL_REFERENCE, ("r",)),
+    "payments_by_status": (PAYMENTS_BY_STATUS, ("pending", "2024-01-01")),
+    "update_payment_status": (UPDATE_PAYMENT_STATUS, ("settled", "2024-01-01", "p")),
+    "payments_oldest_by_status": (PAYMENTS_OLDEST_BY_STATUS, ("unknown", 100)),
+    "transition_payment": (TRANSITION_PAYMENT, ("unknown", "2024-01-01", "p", "created")),
+    "finalize_payment": (FINALIZE_PAYMENT, ("stripe_ach", "pending", None, None, "r", "2024-01-01", "p")),
+    "delete_payment": (DELETE_PAYMENT, ("p",)),
+    "payout_by_id": (PAYOUT_BY_ID, ("p",)),
+    "payout_by_idempotency_key": (PAYOUT_BY_IDEMPOTENCY_KEY, ("k",)),
+    "payout_by_external_reference": (PAYOUT_BY_EXTERNAL_REFERENCE, ("r",)),
+    "payouts_by_status": (PAYOUTS_BY_STATUS, ("processing", "2024-01-01")),
+    "update_payout_status": (UPDATE_PAYOUT_STATUS, ("paid", "2024-01-01", "p")),
+    "payouts_oldest_by_status": (PAYOUTS_OLDEST_BY_STATUS, ("queued", 100)),
+    "claim_payout": (CLAIM_PAYOUT, ("created", "2024-01-01", "p", "queued")),
+    "finalize_payout": (FINALIZE_PAYOUT, ("processing", "r", "2024-01-01", "p")),
+    "delete_payout": (DELETE_PAYOUT, ("p",)),
+    "beneficiary_by_id": (BENEFICIARY_BY_ID, ("b",)),
+    "fees_by_payment": (FEES_BY_PAYMENT, ("p",)),
+}
+
+__all__ = [name for name in dir() if name.isupper()]
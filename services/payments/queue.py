@@ -1,24 +1,80 @@
-"""Simple in-memory queue abstraction for publishing domain events."""
+"""Queue abstractions for publishing payments domain events.
+
+:class:`DurableEventQueue` is an append-only SQLite log with one committed
+offset per named consumer. Delivery is at-least-once: :meth:`poll` returns
+events after the consumer's committed offset and never advances it, and
+offsets are committed with :meth:`ack` (or in batches by :meth:`process`).
+Events are only pruned once every registered consumer has acknowledged them
+and they are older than the retention period.
+"""
 from __future__ import annotations
 
+import json
+import sqlite3
 import threading
 from collections import deque
-from dataclasses import dataclass
-from datetime import UTC, datetime
-from typing import Deque, Iterable, Optional
+from dataclasses import asdict, dataclass, fields, is_dataclass
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Sequence, Type
 
+from .config import get_settings
+from .database import ConnectionPool
+from .migrations import Migration, migrate
 from .schemas import PaymentSettledEvent
 
+DEFAULT_CONSUMER = "api"
+
+QUEUE_MIGRATIONS = (
+    Migration(
+        1,
+        "event log and consumer offsets",
+        (
+            """
+            CREATE TABLE IF NOT EXISTS event_log (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                name TEXT NOT NULL,
+                payload TEXT NOT NULL,
+                published_at TEXT NOT NULL
+            )
+            """,
+            "CREATE INDEX IF NOT EXISTS idx_event_log_published_at ON event_log (published_at)",
+            """
+            CREATE TABLE IF NOT EXISTS event_consumers (
+                consumer TEXT PRIMARY KEY,
+                committed_offset INTEGER NOT NULL,
+                updated_at TEXT NOT NULL
+            )
+            """,
+        ),
+    ),
+    Migration(
+        2,
+        "event ids for idempotent publishing",
+        (
+            "ALTER TABLE event_log ADD COLUMN event_id TEXT",
+            "CREATE UNIQUE INDEX IF NOT EXISTS idx_event_log_event_id ON event_log (event_id)",
+        ),
+    ),
+)
+
+# Payload types rebuilt from JSON by event name.
+PAYLOAD_TYPES: Dict[str, Type] = {"PaymentSettled": PaymentSettledEvent}
+
 
 @dataclass
 class Event:
     name: str
     payload: object
     published_at: datetime
+    offset: Optional[int] = None
+    # Set by producers that may publish twice (the outbox relay); duplicates are dropped.
+    event_id: Optional[str] = None
 
 
 class EventQueue:
-    """Thread-safe FIFO queue for domain events."""
+    """Thread-safe in-memory FIFO queue for domain events (tests and tooling)."""
 
     def __init__(self) -> None:
         self._events: Deque[Event] = deque()
@@ -38,11 +94,236 @@ class EventQueue:
             return self._events[-1] if self._events else None
 
 
-event_queue = EventQueue()
+def _json_default(value: object) -> object:
+    if isinstance(value, Decimal):
+        return format(value, "f")
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"cannot serialise {type(value).__name__}")
+
+
+def encode_payload(payload: object) -> str:
+    body = asdict(payload) if is_dataclass(payload) else payload
+    return json.dumps(body, default=_json_default, separators=(",", ":"))
+
+
+def decode_payload(name: str, raw: str) -> object:
+    body = json.loads(raw)
+    payload_type = PAYLOAD_TYPES.get(name)
+    if payload_type is None or not isinstance(body, dict):
+        return body
+    values = {}
+    for item in fields(payload_type):
+        value = body.get(item.name)
+        if value is not None and item.type in ("Decimal", Decimal):
+            value = Decimal(value)
+        elif value is not None and item.type in ("datetime", datetime):
+            value = datetime.fromisoformat(value)
+        values[item.name] = value
+    return payload_type(**values)
+
+
+def _default_queue_path() -> str:
+    settings = get_settings()
+    if settings.event_queue_path:
+        return settings.event_queue_path
+    database = Path(settings.database_path)
+    return str(database.with_name(f"{database.stem}-events{database.suffix or '.db'}"))
+
+
+class DurableEventQueue:
+    """Append-only SQLite event log with per-consumer offsets."""
+
+    def __init__(
+        self,
+        path: Optional[Callable[[], str]] = None,
+        *,
+        retention: Optional[timedelta] = None,
+        retention_check_every: int = 1000,
+    ) -> None:
+        self._pool = ConnectionPool(
+            path=path or _default_queue_path, on_connect=lambda conn: migrate(conn, QUEUE_MIGRATIONS)
+        )
+        self.retention = retention
+        self._retention_check_every = retention_check_every
+        self._published = 0
+
+    def _conn(self) -> sqlite3.Connection:
+        return self._pool.acquire()
+
+    def _retention(self) -> timedelta:
+        if self.retention is not None:
+            return self.retention
+        return timedelta(days=get_settings().event_retention_days)
+
+    def publish(self, event: Event) -> int:
+        return self.publish_many([event])[-1]
+
+    def publish_many(self, events: Sequence[Event]) -> List[int]:
+        """Append ``events`` in one transaction and return their offsets.
+
+        An event whose ``event_id`` is already in the log is not appended
+        again; its existing offset is returned instead.
+        """
+        conn = self._conn()
+        offsets = []
+        with conn:
+            for event in events:
+                cursor = conn.execute(
+                    "INSERT OR IGNORE INTO event_log (name, payload, published_at, event_id) VALUES (?, ?, ?, ?)",
+                    (event.name, encode_payload(event.payload), event.published_at.isoformat(), event.event_id),
+                )
+                if cursor.rowcount:
+                    event.offset = cursor.lastrowid
+                else:
+                    event.offset = conn.execute(
+                        "SELECT seq FROM event_log WHERE event_id = ?", (event.event_id,)
+                    ).fetchone()[0]
+                offsets.append(event.offset)
+        self._published += len(events)
+        if self._retention_check_every and self._published >= self._retention_check_every:
+            self._published = 0
+            self.apply_retention()
+        return offsets
+
+    def register(self, consumer: str, *, from_beginning: bool = True) -> int:
+        """Register ``consumer`` (idempotent) and return its committed offset.
+
+        A new consumer starts at the oldest retained event, or at the head of
+        the log when ``from_beginning`` is false. Registered consumers hold back
+        retention until they acknowledge.
+        """
+        conn = self._conn()
+        with conn:
+            start = 0
+            if not from_beginning:
+                start = conn.execute("SELECT COALESCE(MAX(seq), 0) FROM event_log").fetchone()[0]
+            conn.execute(
+                "INSERT OR IGNORE INTO event_consumers (consumer, committed_offset, updated_at) VALUES (?, ?, ?)",
+                (consumer, start, datetime.now(tz=UTC).isoformat()),
+            )
+            return conn.execute(
+                "SELECT committed_offset FROM event_consumers WHERE consumer = ?", (consumer,)
+            ).fetchone()[0]
+
+    def committed(self, consumer: str) -> int:
+        row = self._conn().execute(
+            "SELECT committed_offset FROM event_consumers WHERE consumer = ?", (consumer,)
+        ).fetchone()
+        return row[0] if row else self.register(consumer)
+
+    def poll(self, consumer: str, max_events: int = 100) -> List[Event]:
+        """Events after ``consumer``'s committed offset; redelivered until acked."""
+        committed = self.committed(consumer)
+        rows = self._conn().execute(
+            "SELECT seq, name, payload, published_at, event_id FROM event_log WHERE seq > ? ORDER BY seq LIMIT ?",
+            (committed, int(max_events)),
+        ).fetchall()
+        return [
+            Event(
+                name=row["name"],
+                payload=decode_payload(row["name"], row["payload"]),
+                published_at=datetime.fromisoformat(row["published_at"]),
+                offset=row["seq"],
+                event_id=row["event_id"],
+            )
+            for row in rows
+        ]
+
+    def ack(self, consumer: str, offset: int) -> None:
+        """Commit every event up to and including ``offset`` for ``consumer``."""
+        conn = self._conn()
+        with conn:
+            conn.execute(
+                """
+                INSERT INTO event_consumers (consumer, committed_offset, updated_at) VALUES (?, ?, ?)
+                ON CONFLICT (consumer) DO UPDATE SET
+                    committed_offset = MAX(committed_offset, excluded.committed_offset),
+                    updated_at = excluded.updated_at
+                """,
+                (consumer, int(offset), datetime.now(tz=UTC).isoformat()),
+            )
+
+    def process(self, consumer: str, handler: Callable[[Event], None], *, batch_size: int = 100) -> int:
+        """Deliver pending events to ``handler``, acking once per batch.
+
+        If ``handler`` raises, the events it already handled are acked and the
+        error propagates; the failed event is redelivered on the next call.
+        Returns the number of events handled.
+        """
+        handled = 0
+        while True:
+            batch = self.poll(consumer, batch_size)
+            if not batch:
+                return handled
+            last = None
+            try:
+                for event in batch:
+                    handler(event)
+                    last = event.offset
+                    handled += 1
+            finally:
+                if last is not None:
+                    self.ack(consumer, last)
+
+    def drain(self, consumer: str = DEFAULT_CONSUMER) -> Iterable[Event]:
+        """Yield and acknowledge every pending event for ``consumer``."""
+        while True:
+            batch = self.poll(consumer)
+            if not batch:
+                return
+            for event in batch:
+                yield event
+                self.ack(consumer, event.offset)
+
+    def lag(self, consumer: str) -> int:
+        committed = self.committed(consumer)
+        return self._conn().execute("SELECT COUNT(*) FROM event_log WHERE seq > ?", (committed,)).fetchone()[0]
+
+    def consumers(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT consumer, committed_offset FROM event_consumers ORDER BY consumer")
+        return {row["consumer"]: row["committed_offset"] for row in rows}
+
+    def peek_latest(self) -> Optional[Event]:
+        row = self._conn().execute(
+            "SELECT seq, name, payload, published_at, event_id FROM event_log ORDER BY seq DESC LIMIT 1"
+        ).fetchone()
+        if row is None:
+            return None
+        return Event(
+            name=row["name"],
+            payload=decode_payload(row["name"], row["payload"]),
+            published_at=datetime.fromisoformat(row["published_at"]),
+            offset=row["seq"],
+            event_id=row["event_id"],
+        )
+
+    def apply_retention(self, now: Optional[datetime] = None) -> int:
+        """Delete events acknowledged by every consumer and older than the retention."""
+        cutoff = (now or datetime.now(tz=UTC)) - self._retention()
+        conn = self._conn()
+        with conn:
+            floor = conn.execute("SELECT MIN(committed_offset) FROM event_consumers").fetchone()[0]
+            if floor is None:
+                return 0
+            return conn.execute(
+                "DELETE FROM event_log WHERE seq <= ? AND published_at < ?", (floor, cutoff.isoformat())
+            ).rowcount
+
+    def close(self) -> None:
+        self._pool.close_all()
 
 
-def publish_payment_settled(event: PaymentSettledEvent) -> None:
-    event_queue.publish(Event(name="PaymentSettled", payload=event, published_at=datetime.now(tz=UTC)))
+event_queue = DurableEventQueue()
 
 
-__all__ = ["Event", "EventQueue", "event_queue", "publish_payment_settled"]
+__all__ = [
+    "DEFAULT_CONSUMER",
+    "DurableEventQueue",
+    "Event",
+    "EventQueue",
+    "PAYLOAD_TYPES",
+    "decode_payload",
+    "encode_payload",
+    "event_queue",
+]
@@ -0,0 +1,310 @@
+"""Reconcile payments and payouts against provider settlement exports.
+
+The export is streamed in chunks into a temporary table keyed by external
+reference, with amounts stored as integers scaled by ``AMOUNT_SCALE``. SQLite
+then merges it with ``payments``/``payouts`` (comparing against the
+``amount_units`` column writers store with every amount) through the unique
+``external_reference`` index and the ``(status, updated_at)`` index. Only the
+discrepancies come back to Python, so a million-row report reconciles in
+seconds.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import re
+import sys
+import time
+from dataclasses import dataclass, field
+from decimal import Decimal
+from pathlib import Path
+from typing import IO, Dict, Iterator, List, Optional, Tuple, Union
+
+from .database import db_transaction, initialize_schema
+from .utils import AMOUNT_DECIMALS, AMOUNT_SCALE
+
+DEFAULT_CHUNK_SIZE = 10_000
+DEFAULT_MAX_DETAILS = 1_000
+
+_TEMP_TABLE = "recon_report"
+
+
+@dataclass(frozen=True)
+class ReportFormat:
+    """Column layout of one provider's settlement export."""
+
+    provider: str
+    table: str
+    reference_column: str
+    amount_column: str
+    currency_column: str
+    status_column: str
+    # Provider status -> the status our row should have; other statuses are skipped.
+    statuses: Dict[str, str]
+
+
+FORMATS: Dict[str, ReportFormat] = {
+    "stripe": ReportFormat(
+        provider="stripe_ach",
+        table="payments",
+        reference_column="source_id",
+        amount_column="gross",
+        currency_column="currency",
+        status_column="reporting_category",
+        statuses={"charge": "settled", "payment_failure": "failed"},
+    ),
+    "dlocal": ReportFormat(
+        provider="dlocal_bank_debit",
+        table="payments",
+        reference_column="payment_id",
+        amount_column="amount",
+        currency_column="currency",
+        status_column="status",
+        statuses={"PAID": "settled", "REJECTED": "failed", "CANCELLED": "failed"},
+    ),
+    "wise": ReportFormat(
+        provider="wise",
+        table="payouts",
+        reference_column="transfer_id",
+        amount_column="amount",
+        currency_column="currency",
+        status_column="status",
+        statuses={"outgoing_payment_sent": "paid", "funds_refunded": "failed", "cancelled": "failed"},
+    ),
+}
+
+
+@dataclass
+class Discrepancy:
+    external_reference: str
+    kind: str  # "amount", "status", "missing_internal" or "missing_in_report"
+    row_id: Optional[str] = None
+    expected: Optional[str] = None
+    actual: Optional[str] = None
+
+
+@dataclass
+class ReconciliationReport:
+    provider: str
+    rows_read: int = 0
+    skipped: int = 0
+    invalid: int = 0
+    duplicate_references: int = 0
+    matched: int = 0
+    counts: Dict[str, int] = field(
+        default_factory=lambda: {"amount": 0, "status": 0, "missing_internal": 0, "missing_in_report": 0}
+    )
+    discrepancies: List[Discrepancy] = field(default_factory=list)
+    seconds: float = 0.0
+
+    @property
+    def clean(self) -> bool:
+        return not any(self.counts.values()) and not self.invalid
+
+    def as_dict(self) -> Dict[str, object]:
+        return {
+            "provider": self.provider,
+            "rows_read": self.rows_read,
+            "skipped": self.skipped,
+            "invalid": self.invalid,
+            "duplicate_references": self.duplicate_references,
+            "matched": self.matched,
+            "counts": dict(self.counts),
+            "discrepancies": [vars(item) for item in self.discrepancies],
+            "seconds": self.seconds,
+        }
+
+
+# Sign, whole part and at most AMOUNT_DECIMALS significant decimals, so scaling never rounds.
+_AMOUNT = re.compile(rf"\s*(-?)([0-9]+)(?:\.([0-9]{{0,{AMOUNT_DECIMALS}}})0*)?\s*")
+_INSERT = f"INSERT OR IGNORE INTO {_TEMP_TABLE} VALUES (?, ?, UPPER(TRIM(?)), ?)"
+
+
+def _iter_chunks(
+    handle: IO[str], fmt: ReportFormat, chunk_size: int, report: ReconciliationReport
+) -> Iterator[List[Tuple[str, str, str, str]]]:
+    reader = csv.reader(handle)
+    header = next(reader, None) or []
+    try:
+        columns = [
+            header.index(name)
+            for name in (fmt.reference_column, fmt.amount_column, fmt.currency_column, fmt.status_column)
+        ]
+    except ValueError as exc:
+        raise ValueError(f"{fmt.provider} export is missing a column: {exc}") from None
+    ref_at, amount_at, currency_at, status_at = columns
+    statuses = fmt.statuses
+    parse_amount = _AMOUNT.fullmatch
+
+    # Hot loop: counters stay local and amounts are scaled by string concatenation, not arithmetic.
+    read = skipped = invalid = 0
+    chunk: List[Tuple[str, str, str, str]] = []
+    for record in reader:
+        read += 1
+        try:
+            expected = statuses.get(record[status_at].strip())
+            if expected is None:
+                skipped += 1
+                continue
+            reference, amount = record[ref_at].strip(), parse_amount(record[amount_at])
+            if not reference or amount is None:
+                invalid += 1
+                continue
+            # Digits of the scaled amount; the INTEGER column converts them inside SQLite.
+            sign, whole, fraction = amount.groups()
+            units = sign + whole + (fraction or "").ljust(AMOUNT_DECIMALS, "0")
+            chunk.append((reference, units, record[currency_at], expected))
+        except IndexError:
+            invalid += 1
+            continue
+        if len(chunk) >= chunk_size:
+            report.rows_read, report.skipped, report.invalid = read, skipped, invalid
+            yield chunk
+            chunk = []
+    report.rows_read, report.skipped, report.invalid = read, skipped, invalid
+    if chunk:
+        yield chunk
+
+
+def reconcile(
+    provider: str,
+    source: Union[str, Path, IO[str]],
+    *,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    max_details: int = DEFAULT_MAX_DETAILS,
+) -> ReconciliationReport:
+    """Reconcile one provider export (a CSV path or text handle) against our rows.
+
+    ``since``/``until`` (ISO timestamps on ``updated_at``) limit which of our
+    rows are expected to appear in the export; rows outside the window are
+    never reported as ``missing_in_report``. At most ``max_details``
+    discrepancies are listed, but ``counts`` always covers all of them.
+    """
+    fmt = FORMATS[provider]
+    report = ReconciliationReport(provider=provider)
+    started = time.perf_counter()
+
+    with db_transaction() as conn:
+        conn.execute(f"DROP TABLE IF EXISTS temp.{_TEMP_TABLE}")
+        conn.execute(
+            f"""
+            CREATE TEMP TABLE {_TEMP_TABLE} (
+                ref TEXT PRIMARY KEY,
+                amount_units INTEGER NOT NULL,
+                currency TEXT NOT NULL,
+                expected_status TEXT NOT NULL
+            ) WITHOUT ROWID
+            """
+        )
+
+    def load(handle: IO[str]) -> None:
+        for chunk in _iter_chunks(handle, fmt, chunk_size, report):
+            with db_transaction() as conn:
+                before = conn.total_changes
+                conn.executemany(_INSERT, chunk)
+                report.duplicate_references += len(chunk) - (conn.total_changes - before)
+
+    try:
+        if isinstance(source, (str, Path)):
+            with open(source, newline="", encoding="utf-8") as handle:
+                load(handle)
+        else:
+            load(source)
+        _compare(fmt, report, since, until, max_details)
+    finally:
+        with db_transaction() as conn:
+            conn.execute(f"DROP TABLE IF EXISTS temp.{_TEMP_TABLE}")
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+def _compare(
+    fmt: ReportFormat, report: ReconciliationReport, since: Optional[str], until: Optional[str], max_details: int
+) -> None:
+    table = fmt.table
+    provider_filter, provider_args = ("AND t.provider = ?", [fmt.provider]) if table == "payments" else ("", [])
+    window, window_args = "", []
+    if since:
+        window += " AND t.updated_at >= ?"
+        window_args.append(since)
+    if until:
+        window += " AND t.updated_at < ?"
+        window_args.append(until)
+    expected_statuses = sorted(set(fmt.statuses.values()))
+    placeholders = ",".join("?" * len(expected_statuses))
+
+    def record(kind: str, reference: str, row_id: Optional[str], expected, actual) -> None:
+        report.counts[kind] += 1
+        if len(report.discrepancies) < max_details:
+            report.discrepancies.append(Discrepancy(reference, kind, row_id, expected, actual))
+
+    with db_transaction() as conn:
+        loaded = conn.execute(f"SELECT COUNT(*) FROM {_TEMP_TABLE}").fetchone()[0]
+        # One merge pass over the export; only rows with a discrepancy come back.
+        rows = conn.execute(
+            f"""
+            SELECT r.ref, r.amount_units, r.currency, r.expected_status,
+                   t.id, t.amount, UPPER(t.currency), t.status, t.amount_units
+            FROM {_TEMP_TABLE} r LEFT JOIN {table} t ON t.external_reference = r.ref
+            WHERE t.id IS NULL
+               OR t.amount_units != r.amount_units
+               OR UPPER(t.currency) != r.currency
+               OR t.status != r.expected_status
+            """
+        )
+        for ref, units, currency, expected_status, row_id, amount, our_currency, status, our_amount_units in rows:
+            if row_id is None:
+                record("missing_internal", ref, None, expected_status, None)
+                continue
+            if our_amount_units != units or our_currency != currency:
+                expected = f"{Decimal(units) / AMOUNT_SCALE} {currency}"
+                record("amount", ref, row_id, expected, f"{amount} {our_currency}")
+            if status != expected_status:
+                record("status", ref, row_id, expected_status, status)
+        report.matched = loaded - report.counts["missing_internal"]
+
+        rows = conn.execute(
+            f"""
+            SELECT t.external_reference, t.id, t.status
+            FROM {table} t
+            WHERE t.status IN ({placeholders}) {provider_filter} {window}
+              AND t.external_reference IS NOT NULL
+              AND NOT EXISTS (SELECT 1 FROM {_TEMP_TABLE} r WHERE r.ref = t.external_reference)
+            """,
+            [*expected_statuses, *provider_args, *window_args],
+        )
+        for ref, row_id, status in rows:
+            record("missing_in_report", ref, row_id, None, status)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Reconcile a provider settlement export")
+    parser.add_argument("provider", choices=sorted(FORMATS))
+    parser.add_argument("path", help="Settlement export (CSV)")
+    parser.add_argument("--since", help="Only expect our rows updated at or after this ISO timestamp")
+    parser.add_argument("--until", help="Only expect our rows updated before this ISO timestamp")
+    parser.add_argument("--max-details", type=int, default=DEFAULT_MAX_DETAILS)
+    args = parser.parse_args(argv)
+
+    initialize_schema()
+    report = reconcile(args.provider, args.path, since=args.since, until=args.until, max_details=args.max_details)
+    json.dump(report.as_dict(), sys.stdout, indent=2)
+    sys.stdout.write("\n")
+    return 0 if report.clean else 1
+
+
+if __name__ == "__main__":  # pragma: no cover - CLI passthrough
+    sys.exit(main())
+
+
+__all__ = [
+    "AMOUNT_SCALE",
+    "FORMATS",
+    "Discrepancy",
+    "ReconciliationReport",
+    "ReportFormat",
+    "reconcile",
+]
@@ -2,24 +2,35 @@
 from __future__ import annotations
 
 import json
+import logging
+import sqlite3
+import threading
+import time
 import uuid
-from datetime import UTC, datetime
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
 from decimal import Decimal
-from typing import Optional
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
 
+from . import queries
 from .database import db_transaction
 from .models import Payment, PaymentStatus, Payout, PayoutStatus
+from .providers.base import CollectResult, PayoutResult, ProviderRejected
 from .providers.registry import get_collect_provider, get_payout_provider
-from .queue import publish_payment_settled
+from .outbox import write_outbox
 from .schemas import CollectRequest, CollectResponse, PaymentSettledEvent, PayoutRequest, PayoutResponse
+from .utils import to_units
+
+logger = logging.getLogger(__name__)
 
 
 def _now() -> datetime:
     return datetime.now(tz=UTC)
 
 
-def _serialize_amount(amount: Decimal) -> str:
-    return format(amount, "f")
+def _serialize_amount(amount: Decimal) -> Tuple[str, int]:
+    """Text and ``AMOUNT_SCALE`` units stored for ``amount``; rejects amounts the units cannot hold exactly."""
+    return format(amount, "f"), to_units(amount)
 
 
 def _deserialize_amount(value: str) -> Decimal:
@@ -59,86 +70,255 @@ def _row_to_payout(row) -> Payout:
 
 def _insert_fee_breakdown(conn, payment_id: str, provider: str) -> None:
     conn.execute(
-        "INSERT INTO fee_breakdown (id, payment_id, description, amount) VALUES (?, ?, ?, ?)",
-        (str(uuid.uuid4()), payment_id, f"{provider} fee", _serialize_amount(Decimal("0.30"))),
+        queries.INSERT_FEE_ONCE,
+        (str(uuid.uuid4()), payment_id, f"{provider} fee", *_serialize_amount(Decimal("0.30")), payment_id),
     )
 
 
-def create_collect(request: CollectRequest, idempotency_key: Optional[str]) -> CollectResponse:
+class IdempotencyConflict(RuntimeError):
+    """Another request with the same idempotency key is still calling the provider."""
+
+
+# How long a duplicate request waits for an in-flight original to finish.
+RESERVATION_WAIT_SECONDS = 10.0
+# A reservation untouched for this long belongs to a worker that died mid-call.
+RESERVATION_TTL = timedelta(minutes=5)
+_POLL_INTERVAL = 0.05
+_RESERVED = "created"
+
+
+def _try_reserve(
+    select_sql: str,
+    touch_sql: str,
+    idempotency_key: Optional[str],
+    insert: Callable[[sqlite3.Connection, str], str],
+) -> Optional[Tuple[str, Optional[sqlite3.Row]]]:
+    """One non-blocking reservation attempt; ``None`` while the original is in flight."""
+    while True:
+        try:
+            with db_transaction() as conn:
+                now = _now()
+                row = conn.execute(select_sql, (idempotency_key,)).fetchone() if idempotency_key else None
+                if row is None:
+                    return insert(conn, now.isoformat()), None
+                if row["status"] != _RESERVED:
+                    return row["id"], row
+                if now - datetime.fromisoformat(row["updated_at"]) > RESERVATION_TTL:
+                    conn.execute(touch_sql, (now.isoformat(), row["id"]))
+                    return row["id"], None
+                return None
+        except sqlite3.IntegrityError:
+            # A concurrent request reserved the same key first; re-read it.
+            continue
+
+
+def _still_in_progress(idempotency_key: Optional[str]) -> IdempotencyConflict:
+    return IdempotencyConflict(f"request with idempotency key {idempotency_key!r} is still in progress")
+
+
+def _reserve(
+    select_sql: str,
+    touch_sql: str,
+    idempotency_key: Optional[str],
+    insert: Callable[[sqlite3.Connection, str], str],
+    *,
+    wait: bool = True,
+) -> Optional[Tuple[str, Optional[sqlite3.Row]]]:
+    """Claim ``idempotency_key`` with a ``created`` row, outside any provider call.
+
+    Returns ``(row_id, None)`` when the caller owns the reservation and must call
+    the provider, or ``(row_id, row)`` when an earlier request already finished.
+    Duplicates of an in-flight request poll until it resolves, for at most
+    ``RESERVATION_WAIT_SECONDS``; with ``wait=False`` they get ``None`` at once
+    and the caller does its own waiting.
+    """
+    deadline = time.monotonic() + RESERVATION_WAIT_SECONDS
+    while True:
+        reserved = _try_reserve(select_sql, touch_sql, idempotency_key, insert)
+        if reserved is not None or not wait:
+            return reserved
+        if time.monotonic() >= deadline:
+            raise _still_in_progress(idempotency_key)
+        time.sleep(_POLL_INTERVAL)
+
+
+class _ReservationHeartbeat:
+    """Keeps ``updated_at`` fresh on reservations whose provider call is still running.
+
+    One daemon thread touches every held reservation each third of
+    ``RESERVATION_TTL``, so only a reservation whose worker died goes stale and
+    can be taken over.
+    """
+
+    def __init__(self) -> None:
+        self._held: Dict[Tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @contextmanager
+    def hold(self, touch_sql: str, row_id: str) -> Iterator[None]:
+        key = (touch_sql, row_id)
+        with self._lock:
+            self._held[key] = self._held.get(key, 0) + 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="payments-heartbeat", daemon=True)
+                self._thread.start()
+        self._wake.set()
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._held[key] -= 1
+                if not self._held[key]:
+                    del self._held[key]
+
+    def _run(self) -> None:
+        last = time.monotonic()
+        while True:
+            # A new hold wakes the thread only to pick up the current TTL.
+            remaining = last + RESERVATION_TTL.total_seconds() / 3 - time.monotonic()
+            if remaining > 0 and self._wake.wait(remaining):
+                self._wake.clear()
+                continue
+            last = time.monotonic()
+            with self._lock:
+                held = list(self._held)
+            if not held:
+                continue
+            try:
+                with db_transaction() as conn:
+                    now = _now().isoformat()
+                    for touch_sql, row_id in held:
+                        conn.execute(touch_sql, (now, row_id))
+            except Exception:  # pragma: no cover - defensive
+                logger.exception("Reservation heartbeat failed")
+
+
+_heartbeat = _ReservationHeartbeat()
+
+
+def _release(*statements: Tuple[str, str]) -> None:
     with db_transaction() as conn:
-        if idempotency_key:
-            row = conn.execute(
-                "SELECT * FROM payments WHERE idempotency_key = ?", (idempotency_key,)
-            ).fetchone()
-            if row:
-                payment = _row_to_payment(row)
-                return CollectResponse(
-                    payment_id=payment.id,
-                    provider=payment.provider,
-                    status=payment.status,
-                    checkout_link=payment.checkout_link,
-                    bank_debit_intent=payment.bank_debit_intent,
-                )
+        for sql, row_id in statements:
+            conn.execute(sql, (row_id,))
 
-        provider = get_collect_provider(request.currency)
-        result = provider.create_collect(request.amount, request.currency, request.customer_meta)
 
+def _collect_response(payment: Payment) -> CollectResponse:
+    return CollectResponse(
+        payment_id=payment.id,
+        provider=payment.provider,
+        status=payment.status,
+        checkout_link=payment.checkout_link,
+        bank_debit_intent=payment.bank_debit_intent,
+    )
+
+
+def _reserve_collect(
+    request: CollectRequest, idempotency_key: Optional[str], provider_name: str, *, wait: bool = True
+) -> Optional[Tuple[str, Optional[CollectResponse]]]:
+    def insert(conn: sqlite3.Connection, now: str) -> str:
         payment_id = str(uuid.uuid4())
-        now = _now().isoformat()
         conn.execute(
             """
             INSERT INTO payments (
-                id, provider, amount, currency, status, customer_meta, checkout_link,
-                bank_debit_intent, idempotency_key, external_reference, created_at, updated_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                id, provider, amount, amount_units, currency, status, customer_meta, idempotency_key,
+                created_at, updated_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 payment_id,
-                result.provider,
-                _serialize_amount(request.amount),
+                provider_name,
+                *_serialize_amount(request.amount),
                 request.currency.upper(),
-                PaymentStatus.pending.value,
+                PaymentStatus.created.value,
                 json.dumps(request.customer_meta),
-                result.checkout_link,
-                result.bank_debit_intent,
                 idempotency_key,
-                result.external_reference,
                 now,
                 now,
             ),
         )
-        _insert_fee_breakdown(conn, payment_id, result.provider)
+        return payment_id
 
-        return CollectResponse(
-            payment_id=payment_id,
-            provider=result.provider,
-            status=PaymentStatus.pending,
-            checkout_link=result.checkout_link,
-            bank_debit_intent=result.bank_debit_intent,
+    reserved = _reserve(queries.PAYMENT_BY_IDEMPOTENCY_KEY, queries.TOUCH_PAYMENT, idempotency_key, insert, wait=wait)
+    if reserved is None:
+        return None
+    payment_id, existing = reserved
+    return payment_id, _collect_response(_row_to_payment(existing)) if existing is not None else None
+
+
+def _finalize_collect(payment_id: str, result: CollectResult) -> CollectResponse:
+    with db_transaction() as conn:
+        conn.execute(
+            queries.FINALIZE_PAYMENT,
+            (
+                result.provider,
+                PaymentStatus.pending.value,
+                result.checkout_link,
+                result.bank_debit_intent,
+                result.external_reference,
+                _now().isoformat(),
+                payment_id,
+            ),
         )
+        _insert_fee_breakdown(conn, payment_id, result.provider)
+        row = conn.execute(queries.PAYMENT_BY_ID, (payment_id,)).fetchone()
+    return _collect_response(_row_to_payment(row))
 
 
-def create_payout(request: PayoutRequest, idempotency_key: Optional[str]) -> PayoutResponse:
+def _abandon_collect(payment_id: str) -> None:
+    _release((queries.DELETE_PAYMENT, payment_id))
+
+
+def _collect_outcome_unknown(payment_id: str) -> None:
     with db_transaction() as conn:
-        if idempotency_key:
-            row = conn.execute(
-                "SELECT * FROM payouts WHERE idempotency_key = ?", (idempotency_key,)
-            ).fetchone()
-            if row:
-                payout = _row_to_payout(row)
-                return PayoutResponse(
-                    payout_id=payout.id,
-                    beneficiary_id=payout.beneficiary_id,
-                    status=payout.status,
-                )
+        conn.execute(
+            queries.TRANSITION_PAYMENT,
+            (PaymentStatus.unknown.value, _now().isoformat(), payment_id, PaymentStatus.created.value),
+        )
+
+
+def _call_collect_provider(provider, request: CollectRequest, payment_id: str) -> CollectResult:
+    """Call the provider keyed by ``payment_id`` and settle what a failure means for the row.
 
-        provider = get_payout_provider(request.currency)
-        result = provider.create_payout(request.amount, request.currency, request.beneficiary_meta)
+    A :class:`ProviderRejected` error releases the reservation so the client
+    can retry. Any other error may have reached the provider, so the row is
+    marked ``unknown`` and kept; :func:`resolve_unknown_collects` finds out
+    what happened by replaying the call with the same provider idempotency key.
+    """
+    try:
+        with _heartbeat.hold(queries.TOUCH_PAYMENT, payment_id):
+            return provider.create_collect(
+                request.amount, request.currency, request.customer_meta, idempotency_key=payment_id
+            )
+    except ProviderRejected:
+        _abandon_collect(payment_id)
+        raise
+    except BaseException:
+        _collect_outcome_unknown(payment_id)
+        raise
 
-        beneficiary_id = str(uuid.uuid4())
-        payout_id = str(uuid.uuid4())
-        now = _now().isoformat()
 
+def create_collect(request: CollectRequest, idempotency_key: Optional[str]) -> CollectResponse:
+    """Create a collect in three steps so the provider call holds no database lock.
+
+    A ``created`` row reserves the idempotency key, the provider is called with
+    no transaction open (keyed by the row id, so a repeated call cannot charge
+    twice), and a second short transaction finalizes the row.
+    """
+    provider = get_collect_provider(request.currency)
+    payment_id, existing = _reserve_collect(request, idempotency_key, provider.name)
+    if existing is not None:
+        return existing
+    result = _call_collect_provider(provider, request, payment_id)
+    return _finalize_collect(payment_id, result)
+
+
+def _reserve_payout(
+    request: PayoutRequest, idempotency_key: Optional[str], *, wait: bool = True
+) -> Optional[Tuple[str, Optional[PayoutResponse]]]:
+    def insert(conn: sqlite3.Connection, now: str) -> str:
+        payout_id, beneficiary_id = str(uuid.uuid4()), str(uuid.uuid4())
         conn.execute(
             """
             INSERT INTO beneficiaries (id, currency, meta, idempotency_key, created_at, updated_at)
@@ -153,32 +333,170 @@ def create_payout(request: PayoutRequest, idempotency_key: Optional[str]) -> Pay
                 now,
             ),
         )
-
         conn.execute(
             """
             INSERT INTO payouts (
-                id, amount, currency, status, beneficiary_id, idempotency_key, external_reference,
-                created_at, updated_at
+                id, amount, amount_units, currency, status, beneficiary_id, idempotency_key, created_at, updated_at
             ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
             """,
             (
                 payout_id,
-                _serialize_amount(request.amount),
+                *_serialize_amount(request.amount),
                 request.currency.upper(),
-                PayoutStatus.processing.value,
+                PayoutStatus.created.value,
                 beneficiary_id,
                 idempotency_key,
-                result.external_reference,
                 now,
                 now,
             ),
         )
+        return payout_id
+
+    reserved = _reserve(queries.PAYOUT_BY_IDEMPOTENCY_KEY, queries.TOUCH_PAYOUT, idempotency_key, insert, wait=wait)
+    if reserved is None:
+        return None
+    payout_id, existing = reserved
+    if existing is None:
+        return payout_id, None
+    payout = _row_to_payout(existing)
+    return payout_id, PayoutResponse(payout_id=payout.id, beneficiary_id=payout.beneficiary_id, status=payout.status)
+
 
-        return PayoutResponse(
-            payout_id=payout_id,
-            beneficiary_id=beneficiary_id,
-            status=PayoutStatus.processing,
+def _finalize_payout(payout_id: str, result: PayoutResult) -> PayoutResponse:
+    with db_transaction() as conn:
+        conn.execute(
+            queries.FINALIZE_PAYOUT,
+            (PayoutStatus.processing.value, result.external_reference, _now().isoformat(), payout_id),
         )
+        row = conn.execute(queries.PAYOUT_BY_ID, (payout_id,)).fetchone()
+
+    return PayoutResponse(
+        payout_id=payout_id,
+        beneficiary_id=row["beneficiary_id"],
+        status=PayoutStatus(row["status"]),
+    )
+
+
+def _abandon_payout(payout_id: str) -> None:
+    with db_transaction() as conn:
+        row = conn.execute(queries.PAYOUT_BY_ID, (payout_id,)).fetchone()
+        conn.execute(queries.DELETE_PAYOUT, (payout_id,))
+        if row is not None:
+            conn.execute(queries.DELETE_BENEFICIARY, (row["beneficiary_id"],))
+
+
+def _payout_outcome_unknown(payout_id: str) -> None:
+    with db_transaction() as conn:
+        conn.execute(
+            queries.CLAIM_PAYOUT,
+            (PayoutStatus.unknown.value, _now().isoformat(), payout_id, PayoutStatus.created.value),
+        )
+
+
+def _call_payout_provider(
+    provider, amount: Decimal, currency: str, beneficiary_meta: Dict[str, object], payout_id: str
+) -> PayoutResult:
+    """Payout counterpart of :func:`_call_collect_provider`."""
+    try:
+        with _heartbeat.hold(queries.TOUCH_PAYOUT, payout_id):
+            return provider.create_payout(amount, currency, beneficiary_meta, idempotency_key=payout_id)
+    except ProviderRejected:
+        _abandon_payout(payout_id)
+        raise
+    except BaseException:
+        _payout_outcome_unknown(payout_id)
+        raise
+
+
+def create_payout(request: PayoutRequest, idempotency_key: Optional[str]) -> PayoutResponse:
+    """Create a payout with the same reserve / call / finalize flow as :func:`create_collect`."""
+    provider = get_payout_provider(request.currency)
+    payout_id, existing = _reserve_payout(request, idempotency_key)
+    if existing is not None:
+        return existing
+    result = _call_payout_provider(provider, request.amount, request.currency, request.beneficiary_meta, payout_id)
+    return _finalize_payout(payout_id, result)
+
+
+def resolve_unknown_collects(limit: int = 100) -> List[CollectResponse]:
+    """Replay collects left ``unknown`` with their original provider idempotency key.
+
+    The provider returns the collect it already created (or creates it now if
+    the first call never arrived), and the row is finalized. A rejection marks
+    the row ``failed``; any other error leaves it ``unknown`` for the next run.
+    """
+    with db_transaction() as conn:
+        rows = conn.execute(queries.PAYMENTS_OLDEST_BY_STATUS, (PaymentStatus.unknown.value, int(limit))).fetchall()
+    resolved: List[CollectResponse] = []
+    for row in rows:
+        provider = get_collect_provider(row["currency"])
+        meta = json.loads(row["customer_meta"]) if row["customer_meta"] else {}
+        try:
+            result = provider.create_collect(
+                _deserialize_amount(row["amount"]), row["currency"], meta, idempotency_key=row["id"]
+            )
+        except ProviderRejected:
+            with db_transaction() as conn:
+                conn.execute(
+                    queries.TRANSITION_PAYMENT,
+                    (PaymentStatus.failed.value, _now().isoformat(), row["id"], PaymentStatus.unknown.value),
+                )
+            continue
+        except Exception:
+            logger.warning("Collect %s is still unresolved", row["id"], exc_info=True)
+            continue
+        resolved.append(_finalize_collect(row["id"], result))
+    return resolved
+
+
+def resolve_unknown_payouts(limit: int = 100) -> List[PayoutResponse]:
+    """Payout counterpart of :func:`resolve_unknown_collects`."""
+    with db_transaction() as conn:
+        rows = conn.execute(queries.PAYOUTS_OLDEST_BY_STATUS, (PayoutStatus.unknown.value, int(limit))).fetchall()
+    resolved: List[PayoutResponse] = []
+    for row in rows:
+        with db_transaction() as conn:
+            beneficiary = conn.execute(queries.BENEFICIARY_BY_ID, (row["beneficiary_id"],)).fetchone()
+        meta = json.loads(beneficiary["meta"]) if beneficiary else {}
+        try:
+            result = get_payout_provider(row["currency"]).create_payout(
+                _deserialize_amount(row["amount"]), row["currency"], meta, idempotency_key=row["id"]
+            )
+        except ProviderRejected:
+            with db_transaction() as conn:
+                conn.execute(
+                    queries.CLAIM_PAYOUT,
+                    (PayoutStatus.failed.value, _now().isoformat(), row["id"], PayoutStatus.unknown.value),
+                )
+            continue
+        except Exception:
+            logger.warning("Payout %s is still unresolved", row["id"], exc_info=True)
+            continue
+        resolved.append(_finalize_payout(row["id"], result))
+    return resolved
+
+
+def expire_stale_reservations() -> int:
+    """Mark ``created`` rows whose worker died mid-call as ``unknown``.
+
+    A live provider call keeps its row fresh through the heartbeat, so a row
+    untouched for ``RESERVATION_TTL`` was abandoned somewhere between the claim
+    and the finalize. Its outcome is unknown, and :func:`resolve_unknown_collects`
+    / :func:`resolve_unknown_payouts` settle it with the original provider key.
+    """
+    now = _now()
+    cutoff = (now - RESERVATION_TTL).isoformat()
+    expired = 0
+    with db_transaction() as conn:
+        for select_sql, transition_sql, unknown in (
+            (queries.PAYMENTS_BY_STATUS, queries.TRANSITION_PAYMENT, PaymentStatus.unknown.value),
+            (queries.PAYOUTS_BY_STATUS, queries.CLAIM_PAYOUT, PayoutStatus.unknown.value),
+        ):
+            for row in conn.execute(select_sql, (_RESERVED, cutoff)).fetchall():
+                expired += conn.execute(
+                    transition_sql, (unknown, now.isoformat(), row["id"], _RESERVED)
+                ).rowcount
+    return expired
 
 
 def mark_payment_succeeded(
@@ -186,17 +504,16 @@ def mark_payment_succeeded(
 ) -> Optional[PaymentSettledEvent]:
     with db_transaction() as conn:
         if payment_id:
-            row = conn.execute("SELECT * FROM payments WHERE id = ?", (payment_id,)).fetchone()
+            row = conn.execute(queries.PAYMENT_BY_ID, (payment_id,)).fetchone()
         else:
             row = conn.execute(
-                "SELECT * FROM payments WHERE external_reference = ?",
-                (payment_external_reference,),
+                queries.PAYMENT_BY_EXTERNAL_REFERENCE, (payment_external_reference,)
             ).fetchone()
         if not row:
             return None
 
         conn.execute(
-            "UPDATE payments SET status = ?, updated_at = ? WHERE id = ?",
+            queries.UPDATE_PAYMENT_STATUS,
             (PaymentStatus.succeeded.value, _now().isoformat(), row["id"]),
         )
 
@@ -206,9 +523,9 @@ def mark_payment_succeeded(
             currency=currency.upper(),
             occurred_at=_now(),
         )
-        publish_payment_settled(event)
+        write_outbox(conn, "PaymentSettled", event)
         conn.execute(
-            "UPDATE payments SET status = ?, updated_at = ? WHERE id = ?",
+            queries.UPDATE_PAYMENT_STATUS,
             (PaymentStatus.settled.value, _now().isoformat(), row["id"]),
         )
         return event
@@ -216,11 +533,11 @@ def mark_payment_succeeded(
 
 def settle_payment_by_id(payment_id: str, amount: Decimal, currency: str) -> Optional[PaymentSettledEvent]:
     with db_transaction() as conn:
-        row = conn.execute("SELECT * FROM payments WHERE id = ?", (payment_id,)).fetchone()
+        row = conn.execute(queries.PAYMENT_BY_ID, (payment_id,)).fetchone()
         if not row:
             return None
         conn.execute(
-            "UPDATE payments SET status = ?, updated_at = ? WHERE id = ?",
+            queries.UPDATE_PAYMENT_STATUS,
             (PaymentStatus.settled.value, _now().isoformat(), payment_id),
         )
         event = PaymentSettledEvent(
@@ -229,20 +546,18 @@ def settle_payment_by_id(payment_id: str, amount: Decimal, currency: str) -> Opt
             currency=currency.upper(),
             occurred_at=_now(),
         )
-        publish_payment_settled(event)
+        write_outbox(conn, "PaymentSettled", event)
         return event
 
 
 def mark_payout_paid(external_reference: str) -> Optional[Payout]:
     with db_transaction() as conn:
-        row = conn.execute(
-            "SELECT * FROM payouts WHERE external_reference = ?", (external_reference,)
-        ).fetchone()
+        row = conn.execute(queries.PAYOUT_BY_EXTERNAL_REFERENCE, (external_reference,)).fetchone()
         if not row:
             return None
         updated_at = _now()
         conn.execute(
-            "UPDATE payouts SET status = ?, updated_at = ? WHERE id = ?",
+            queries.UPDATE_PAYOUT_STATUS,
             (PayoutStatus.paid.value, updated_at.isoformat(), row["id"]),
         )
         payout = _row_to_payout(row)
@@ -252,9 +567,13 @@ def mark_payout_paid(external_reference: str) -> Optional[Payout]:
 
 
 __all__ = [
+    "IdempotencyConflict",
     "create_collect",
     "create_payout",
+    "expire_stale_reservations",
     "mark_payment_succeeded",
     "settle_payment_by_id",
     "mark_payout_paid",
+    "resolve_unknown_collects",
+    "resolve_unknown_payouts",
 ]
@@ -1,38 +1,105 @@
+import asyncio
+import io
 import json
 import os
+import time
+import sqlite3
+import subprocess
 import sys
+import threading
+from datetime import UTC, datetime, timedelta
+from decimal import Decimal
 from pathlib import Path
 
 import pytest
 
 ROOT_DIR = Path(__file__).resolve().parents[3]
+FIXTURES = Path(__file__).resolve().parent / "fixtures"
 if str(ROOT_DIR) not in sys.path:
     sys.path.insert(0, str(ROOT_DIR))
 
 os.environ.setdefault("PAYMENTS_DATABASE_PATH", "test_payments.db")
 
-from services.payments.app import PaymentsAPI
+from services.payments.app import AsyncPaymentsAPI, PaymentsAPI
+from services.payments.async_service import AsyncPaymentsService, ProviderLimits
 from services.payments.config import get_settings
-from services.payments.database import initialize_schema, db_transaction
-from services.payments.queue import event_queue
-from services.payments.utils import compute_signature
+from services.payments.database import initialize_schema, db_transaction, pool
+from services.payments.migrations import LATEST_VERSION, MIGRATIONS, current_version, migrate
+from services.payments.queries import HOT_QUERIES
+from services.payments.queue import DurableEventQueue, Event, _default_queue_path, event_queue
+from services.payments import aggregates, ingest, service, webhooks
+from services.payments.ingest import ingest_payout_file, ingest_payout_text, submit_queued_payouts
+from services.payments.outbox import OutboxRelay, outbox_relay, pending_count
+from services.payments.providers.base import IDEMPOTENCY_KEY_TTL, ProviderRejected, _IdempotentCalls
+from services.payments.providers.stripe_provider import stripe_collect_provider
+from services.payments.providers.wise_provider import wise_payout_provider
+from services.payments.reconciliation import reconcile
+from services.payments.schemas import CollectRequest, PaymentSettledEvent
+from services.payments.service import settle_payment_by_id
+from services.payments.utils import compute_signature, to_units
+from services.payments.webhook_pipeline import WebhookIngestor, WebhookSettlementWorker, settlement_worker
+
+
+def _remove_database(db_path: Path) -> None:
+    # Tests that run the API start the shared workers; stop them before the database goes away.
+    settlement_worker.stop()
+    outbox_relay.stop()
+    pool.close_all()
+    event_queue.close()
+    for base in (db_path, Path(_default_queue_path())):
+        for path in (base, Path(f"{base}-wal"), Path(f"{base}-shm")):
+            if path.exists():
+                path.unlink()
 
 
 @pytest.fixture(autouse=True)
 def clean_database():
     db_path = Path(get_settings().database_path)
-    if db_path.exists():
-        db_path.unlink()
+    _remove_database(db_path)
     initialize_schema()
-    list(event_queue.drain())
     yield
-    if db_path.exists():
-        db_path.unlink()
+    _remove_database(db_path)
 
 
 @pytest.fixture
 def api():
-    return PaymentsAPI()
+    api = PaymentsAPI(background=False)
+    yield api
+    api.close()
+
+
+@pytest.fixture
+def create_payment(api):
+    def create(amount="40.00"):
+        _, body = api.post_collect_create({"amount": amount, "currency": "USD", "customer_meta": {}})
+        return body["payment_id"]
+
+    return create
+
+
+@pytest.fixture
+def settled_event():
+    def make(n):
+        payload = PaymentSettledEvent(
+            payment_id=f"p{n}", amount=Decimal("1.50"), currency="USD", occurred_at=datetime.now(UTC)
+        )
+        return Event(name="PaymentSettled", payload=payload, published_at=datetime.now(UTC))
+
+    return make
+
+
+@pytest.fixture
+def stripe_succeeded():
+    def make(payment_id, event_id):
+        return {
+            "id": event_id,
+            "type": "payment_intent.succeeded",
+            "data": {
+                "object": {"id": "pi_x", "amount": 4000, "currency": "usd", "metadata": {"payment_id": payment_id}}
+            },
+        }
+
+    return make
 
 
 def _stripe_signature(body: dict) -> str:
@@ -125,3 +192,825 @@ def test_payout_and_wise_webhook(api):
     with db_transaction() as conn:
         row = conn.execute("SELECT status FROM payouts WHERE id = ?", (payout_id,)).fetchone()
         assert row["status"] == "paid"
+
+
+def test_transactions_reuse_thread_local_wal_connection():
+    with db_transaction() as first:
+        mode = first.execute("PRAGMA journal_mode").fetchone()[0]
+        synchronous = first.execute("PRAGMA synchronous").fetchone()[0]
+    with db_transaction() as second:
+        pass
+    assert first is second
+    assert mode == "wal"
+    assert synchronous == 1  # NORMAL
+
+    seen = []
+    thread = threading.Thread(target=lambda: seen.append(pool.acquire()))
+    thread.start()
+    thread.join()
+    assert seen[0] is not first
+
+
+def test_connection_is_closed_when_its_thread_exits():
+    opened = []
+
+    def transact():
+        with db_transaction() as conn:
+            conn.execute("SELECT 1")
+        opened.append(conn)
+
+    threads = [threading.Thread(target=transact) for _ in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(opened) == 20
+    for conn in opened:
+        with pytest.raises(sqlite3.ProgrammingError):
+            conn.execute("SELECT 1")
+
+
+def test_nested_transaction_rolls_back_to_savepoint(api):
+    status, body = api.post_collect_create({"amount": "10.00", "currency": "USD", "customer_meta": {}})
+    with db_transaction() as conn:
+        conn.execute("UPDATE payments SET status = 'failed' WHERE id = ?", (body["payment_id"],))
+        with pytest.raises(RuntimeError):
+            with db_transaction() as inner:
+                inner.execute("DELETE FROM payments")
+                raise RuntimeError("boom")
+    with db_transaction() as conn:
+        row = conn.execute("SELECT status FROM payments WHERE id = ?", (body["payment_id"],)).fetchone()
+    assert row["status"] == "failed"
+
+
+def test_outer_rollback_undoes_a_released_nested_transaction(api):
+    status, body = api.post_collect_create({"amount": "10.00", "currency": "USD", "customer_meta": {}})
+    with pytest.raises(RuntimeError):
+        with db_transaction():
+            with db_transaction() as inner:
+                inner.execute("UPDATE payments SET status = 'failed' WHERE id = ?", (body["payment_id"],))
+            raise RuntimeError("outer failed")
+    with db_transaction() as conn:
+        row = conn.execute("SELECT status FROM payments WHERE id = ?", (body["payment_id"],)).fetchone()
+    assert row["status"] == "pending"
+
+
+def test_concurrent_collects_share_the_pool(api):
+    errors = []
+
+    def worker(offset):
+        try:
+            for i in range(10):
+                payload = {"amount": "5.00", "currency": "USD", "customer_meta": {}}
+                api.post_collect_create(payload, headers={"Idempotency-Key": f"c-{offset}-{i}"})
+        except Exception as exc:  # pragma: no cover - surfaced below
+            errors.append(exc)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert not errors
+    with db_transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM payments").fetchone()[0] == 40
+
+
+def test_schema_is_versioned_and_migrations_are_idempotent(tmp_path):
+    with db_transaction() as conn:
+        assert current_version(conn) == LATEST_VERSION
+
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    try:
+        assert migrate(conn, target=1) == 1
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_payments_status'").fetchone() is None
+        assert migrate(conn) == LATEST_VERSION
+        assert migrate(conn) == LATEST_VERSION
+        assert conn.execute("SELECT name FROM sqlite_master WHERE name = 'idx_payments_status'").fetchone()
+        assert [m.version for m in MIGRATIONS] == list(range(1, LATEST_VERSION + 1))
+    finally:
+        conn.close()
+
+
+@pytest.mark.parametrize("name", sorted(HOT_QUERIES))
+def test_hot_queries_use_an_index(name):
+    sql, params = HOT_QUERIES[name]
+    with db_transaction() as conn:
+        plan = conn.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+    details = [row["detail"] for row in plan]
+    assert details
+    assert not [detail for detail in details if detail.startswith("SCAN")], details
+
+
+def test_provider_call_runs_without_holding_the_write_lock(api, monkeypatch):
+    original = stripe_collect_provider.create_collect
+    observed = {}
+
+    def create_collect(amount, currency, customer_meta, **kwargs):
+        other = sqlite3.connect(get_settings().database_path, timeout=0)
+        try:
+            other.execute("BEGIN IMMEDIATE")
+            observed["status"] = other.execute("SELECT status FROM payments").fetchone()[0]
+            other.rollback()
+        finally:
+            other.close()
+        return original(amount, currency, customer_meta, **kwargs)
+
+    monkeypatch.setattr(stripe_collect_provider, "create_collect", create_collect)
+    status, body = api.post_collect_create({"amount": "12.00", "currency": "USD", "customer_meta": {}})
+    assert status == 200
+    assert observed["status"] == "created"
+    with db_transaction() as conn:
+        row = conn.execute("SELECT status, external_reference FROM payments").fetchone()
+        fees = conn.execute("SELECT COUNT(*) FROM fee_breakdown").fetchone()[0]
+    assert row["status"] == "pending" and row["external_reference"]
+    assert fees == 1
+
+
+def test_in_flight_duplicate_waits_for_the_original(api, monkeypatch):
+    original = stripe_collect_provider.create_collect
+    entered, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_create_collect(amount, currency, customer_meta, **kwargs):
+        calls.append(amount)
+        entered.set()
+        assert release.wait(5)
+        return original(amount, currency, customer_meta, **kwargs)
+
+    monkeypatch.setattr(stripe_collect_provider, "create_collect", slow_create_collect)
+    payload = {"amount": "20.00", "currency": "USD", "customer_meta": {}}
+    headers = {"Idempotency-Key": "in-flight"}
+    results = {}
+    first = threading.Thread(target=lambda: results.setdefault("first", api.post_collect_create(payload, headers)))
+    first.start()
+    assert entered.wait(5)
+
+    monkeypatch.setattr(service, "RESERVATION_WAIT_SECONDS", 0.0)
+    assert api.post_collect_create(payload, headers)[0] == 409
+
+    monkeypatch.setattr(service, "RESERVATION_WAIT_SECONDS", 5.0)
+    second = threading.Thread(target=lambda: results.setdefault("second", api.post_collect_create(payload, headers)))
+    second.start()
+    release.set()
+    first.join()
+    second.join()
+    assert len(calls) == 1
+    assert results["first"][1]["payment_id"] == results["second"][1]["payment_id"]
+    assert results["second"][1]["status"] == "pending"
+
+
+def test_rejected_provider_call_releases_the_reservation(api, monkeypatch):
+    original = wise_payout_provider.create_payout
+
+    def rejecting_create_payout(amount, currency, beneficiary_meta, **kwargs):
+        raise ProviderRejected("beneficiary rejected")
+
+    payload = {"amount": "30.00", "currency": "EUR", "beneficiary_meta": {"iban": "X"}}
+    headers = {"Idempotency-Key": "payout-retry"}
+    monkeypatch.setattr(wise_payout_provider, "create_payout", rejecting_create_payout)
+    with pytest.raises(ProviderRejected):
+        api.post_payout_create(payload, headers)
+    with db_transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM payouts").fetchone()[0] == 0
+        assert conn.execute("SELECT COUNT(*) FROM beneficiaries").fetchone()[0] == 0
+
+    monkeypatch.setattr(wise_payout_provider, "create_payout", original)
+    status, body = api.post_payout_create(payload, headers)
+    assert status == 200 and body["status"] == "processing"
+
+
+def test_provider_timeout_keeps_the_reservation_until_resolved(api, monkeypatch):
+    original = stripe_collect_provider.create_collect
+    keys = []
+
+    def timing_out_create_collect(amount, currency, customer_meta, *, idempotency_key=None):
+        keys.append(idempotency_key)
+        original(amount, currency, customer_meta, idempotency_key=idempotency_key)
+        raise TimeoutError("response lost")
+
+    payload = {"amount": "25.00", "currency": "USD", "customer_meta": {}}
+    headers = {"Idempotency-Key": "timed-out"}
+    monkeypatch.setattr(stripe_collect_provider, "create_collect", timing_out_create_collect)
+    with pytest.raises(TimeoutError):
+        api.post_collect_create(payload, headers)
+    status, body = api.post_collect_create(payload, headers)
+    assert status == 200 and body["status"] == "unknown"
+    assert keys == [body["payment_id"]]
+
+    monkeypatch.setattr(stripe_collect_provider, "create_collect", original)
+    [resolved] = service.resolve_unknown_collects()
+    assert resolved.payment_id == body["payment_id"] and resolved.status.value == "pending"
+    with db_transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM fee_breakdown").fetchone()[0] == 1
+    assert service.resolve_unknown_collects() == []
+
+
+def test_finalize_does_not_undo_a_settlement_that_arrived_first(api, monkeypatch):
+    original = stripe_collect_provider.create_collect
+
+    def settled_before_return(amount, currency, customer_meta, *, idempotency_key=None):
+        result = original(amount, currency, customer_meta, idempotency_key=idempotency_key)
+        settle_payment_by_id(idempotency_key, amount, currency)
+        return result
+
+    monkeypatch.setattr(stripe_collect_provider, "create_collect", settled_before_return)
+    status, body = api.post_collect_create({"amount": "12.00", "currency": "USD", "customer_meta": {}})
+    assert status == 200 and body["status"] == "settled"
+    with db_transaction() as conn:
+        row = conn.execute("SELECT status, external_reference FROM payments").fetchone()
+    assert row["status"] == "settled" and row["external_reference"]
+
+
+def test_heartbeat_keeps_a_slow_provider_call_from_being_taken_over(api, monkeypatch):
+    original = stripe_collect_provider.create_collect
+    entered, release = threading.Event(), threading.Event()
+    calls = []
+
+    def slow_create_collect(amount, currency, customer_meta, **kwargs):
+        calls.append(amount)
+        entered.set()
+        assert release.wait(5)
+        return original(amount, currency, customer_meta, **kwargs)
+
+    monkeypatch.setattr(stripe_collect_provider, "create_collect", slow_create_collect)
+    monkeypatch.setattr(service, "RESERVATION_TTL", timedelta(milliseconds=150))
+    monkeypatch.setattr(service, "RESERVATION_WAIT_SECONDS", 0.0)
+    payload = {"amount": "20.00", "currency": "USD", "customer_meta": {}}
+    headers = {"Idempotency-Key": "slow"}
+    first = threading.Thread(target=lambda: api.post_collect_create(payload, headers))
+    first.start()
+    try:
+        assert entered.wait(5)
+        time.sleep(0.5)
+        assert api.post_collect_create(payload, headers)[0] == 409
+    finally:
+        release.set()
+        first.join()
+    assert len(calls) == 1
+
+
+def test_async_payout_batch_fans_out_under_the_provider_limit(monkeypatch):
+    original = wise_payout_provider.create_payout
+    active, peak = [0], [0]
+    lock = threading.Lock()
+
+    def slow_create_payout(amount, currency, beneficiary_meta, **kwargs):
+        with lock:
+            active[0] += 1
+            peak[0] = max(peak[0], active[0])
+        time.sleep(0.02)
+        with lock:
+            active[0] -= 1
+        if beneficiary_meta.get("reject"):
+            raise ProviderRejected("beneficiary rejected")
+        return original(amount, currency, beneficiary_meta, **kwargs)
+
+    monkeypatch.setattr(wise_payout_provider, "create_payout", slow_create_payout)
+    api = AsyncPaymentsAPI(AsyncPaymentsService(limits=ProviderLimits({"wise": 8})), background=False)
+    payouts = [{"amount": "10.00", "currency": "EUR", "beneficiary_meta": {"n": n}} for n in range(40)]
+    payouts.append({"amount": "10.00", "currency": "EUR", "beneficiary_meta": {"reject": True}})
+    payouts.append({"currency": "EUR"})
+    try:
+        started = time.perf_counter()
+        status, body = asyncio.run(api.post_payout_batch({"payouts": payouts}, {"Idempotency-Key": "month-end"}))
+        elapsed = time.perf_counter() - started
+        assert status == 200
+        assert body["succeeded"] == 40 and body["failed"] == 2
+        assert [result["http_status"] for result in body["results"][-2:]] == [502, 400]
+        assert peak[0] == 8
+        assert elapsed < 40 * 0.02
+
+        _, again = asyncio.run(api.post_payout_batch({"payouts": payouts[:40]}, {"Idempotency-Key": "month-end"}))
+        assert [r["payout_id"] for r in again["results"]] == [r["payout_id"] for r in body["results"][:40]]
+    finally:
+        api.close()
+    with db_transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM payouts").fetchone()[0] == 40
+
+
+def test_async_duplicate_waits_without_holding_a_database_thread(monkeypatch):
+    original = stripe_collect_provider.create_collect
+    entered, release = threading.Event(), threading.Event()
+
+    def slow_create_collect(amount, currency, customer_meta, **kwargs):
+        if amount == Decimal("20.00"):
+            entered.set()
+            assert release.wait(5)
+        return original(amount, currency, customer_meta, **kwargs)
+
+    monkeypatch.setattr(stripe_collect_provider, "create_collect", slow_create_collect)
+    async_service = AsyncPaymentsService(db_workers=1)
+    slow = CollectRequest(amount=Decimal("20.00"), currency="USD", customer_meta={})
+    fast = CollectRequest(amount=Decimal("10.00"), currency="USD", customer_meta={})
+
+    async def scenario():
+        first = asyncio.create_task(async_service.create_collect(slow, "dup"))
+        assert await asyncio.get_running_loop().run_in_executor(None, entered.wait, 5)
+        duplicates = [asyncio.create_task(async_service.create_collect(slow, "dup")) for _ in range(3)]
+        await asyncio.sleep(0.1)
+        other = await asyncio.wait_for(async_service.create_collect(fast, "other"), 1)
+        release.set()
+        return other, await asyncio.gather(first, *duplicates)
+
+    try:
+        other, responses = asyncio.run(scenario())
+    finally:
+        release.set()
+        async_service.close()
+    assert other.status.value == "pending"
+    assert len({response.payment_id for response in responses}) == 1
+
+
+def test_provider_idempotency_keys_expire_and_are_capped():
+    now = [0.0]
+    calls = _IdempotentCalls(ttl=timedelta(seconds=60), max_entries=2, clock=lambda: now[0])
+    counter = iter(range(100))
+    assert calls.call("a", lambda: next(counter)) == 0
+    assert calls.call("a", lambda: next(counter)) == 0
+    now[0] = 61.0
+    assert calls.call("a", lambda: next(counter)) == 1
+    calls.call("b", lambda: next(counter))
+    calls.call("c", lambda: next(counter))
+    assert list(calls._results) == ["b", "c"]
+    assert IDEMPOTENCY_KEY_TTL > service.RESERVATION_TTL
+
+
+def test_async_collect_matches_sync_idempotency(api):
+    async_api = AsyncPaymentsAPI(background=False)
+    payload = {"amount": "15.00", "currency": "BRL", "customer_meta": {"bank": "itau"}}
+    try:
+        status, body = asyncio.run(async_api.post_collect_create(payload, {"Idempotency-Key": "async-1"}))
+    finally:
+        async_api.close()
+    assert status == 200 and body["provider"] == "dlocal_bank_debit"
+    assert api.post_collect_create(payload, {"Idempotency-Key": "async-1"})[1]["payment_id"] == body["payment_id"]
+
+
+def test_payout_file_ingestion_reports_per_row_outcomes(tmp_path):
+    csv_path = tmp_path / "month-end.csv"
+    csv_path.write_text(
+        "idempotency_key,amount,currency,beneficiary_iban,beneficiary_name\n"
+        "pay-1,100.00,EUR,DE001,Ana\n"
+        "pay-2,-5,EUR,DE002,Bo\n"
+        "pay-3,250.50,usd,US003,Cy\n"
+        "pay-1,100.00,EUR,DE001,Ana\n"
+        ",10,EUR,DE004,Di\n"
+    )
+    report = ingest_payout_file(csv_path, chunk_size=2)
+    assert [(o.line, o.status) for o in report.outcomes] == [
+        (2, "created"),
+        (3, "invalid"),
+        (4, "created"),
+        (5, "duplicate"),
+        (6, "invalid"),
+    ]
+    assert report.outcomes[1].error == "amount must be positive"
+
+    jsonl = "\n".join(
+        [
+            json.dumps({"idempotency_key": "pay-3", "amount": "250.50", "currency": "USD"}),
+            json.dumps(
+                {"idempotency_key": "pay-4", "amount": "7", "currency": "BRL", "beneficiary_meta": {"pix": "x"}}
+            ),
+            "{not json",
+        ]
+    )
+    second = ingest_payout_text(jsonl, "jsonl")
+    assert [o.status for o in second.outcomes] == ["duplicate", "created", "invalid"]
+    assert second.outcomes[0].payout_id == report.outcomes[2].payout_id
+
+    with db_transaction() as conn:
+        rows = conn.execute("SELECT status, currency FROM payouts ORDER BY currency").fetchall()
+        meta = conn.execute(
+            "SELECT meta FROM beneficiaries WHERE idempotency_key = 'pay-1'"
+        ).fetchone()["meta"]
+    assert [(row["status"], row["currency"]) for row in rows] == [
+        ("queued", "BRL"),
+        ("queued", "EUR"),
+        ("queued", "USD"),
+    ]
+    assert json.loads(meta) == {"iban": "DE001", "name": "Ana"}
+
+    submitted = submit_queued_payouts(limit=10)
+    assert len(submitted) == 3 and {p.status.value for p in submitted} == {"processing"}
+    with db_transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM payouts WHERE status = 'processing'").fetchone()[0] == 3
+
+
+def test_ingest_gives_up_on_a_row_that_keeps_conflicting(monkeypatch):
+    original = ingest._insert_chunk
+    attempts = []
+
+    def conflicting_insert(rows):
+        attempts.append(len(rows))
+        if any(row.key == "stuck" for row in rows):
+            raise sqlite3.IntegrityError("UNIQUE constraint failed: beneficiaries.idempotency_key")
+        return original(rows)
+
+    monkeypatch.setattr(ingest, "_insert_chunk", conflicting_insert)
+    text = "idempotency_key,amount,currency\nok-1,10,EUR\nstuck,10,EUR\nok-2,10,EUR\n"
+    report = ingest_payout_text(text, "csv")
+    assert [o.status for o in report.outcomes] == ["created", "invalid", "created"]
+    assert report.outcomes[1].error.startswith("could not be stored")
+    assert attempts == [3] * ingest.MAX_CHUNK_ATTEMPTS + [1, 1, 1]
+
+
+def test_payout_claimed_by_a_dead_worker_is_recovered():
+    ingest_payout_text("idempotency_key,amount,currency\ncrash-1,10,EUR\n", "csv")
+    stale = (datetime.now(UTC) - service.RESERVATION_TTL - timedelta(seconds=1)).isoformat()
+    with db_transaction() as conn:
+        conn.execute("UPDATE payouts SET status = 'created', updated_at = ?", (stale,))
+    assert submit_queued_payouts() == []
+
+    assert service.expire_stale_reservations() == 1
+    [resolved] = service.resolve_unknown_payouts()
+    assert resolved.status.value == "processing"
+    assert service.expire_stale_reservations() == 0
+
+
+def test_durable_queue_survives_restart_and_tracks_consumers(tmp_path, settled_event):
+    path = str(tmp_path / "events.db")
+    queue = DurableEventQueue(lambda: path)
+    queue.register("ledger")
+    queue.register("audit")
+    assert queue.publish_many([settled_event(n) for n in range(5)]) == [1, 2, 3, 4, 5]
+    queue.ack("ledger", 3)
+    queue.close()
+
+    reopened = DurableEventQueue(lambda: path)
+    ledger = reopened.poll("ledger")
+    assert [event.offset for event in ledger] == [4, 5]
+    assert ledger[0].payload.payment_id == "p3" and str(ledger[0].payload.amount) == "1.50"
+    assert reopened.lag("audit") == 5
+    assert reopened.consumers() == {"audit": 0, "ledger": 3}
+    reopened.close()
+
+
+def test_durable_queue_redelivers_after_handler_failure(tmp_path, settled_event):
+    queue = DurableEventQueue(lambda: str(tmp_path / "events.db"))
+    queue.publish_many([settled_event(n) for n in range(5)])
+    seen = []
+
+    def handler(event):
+        if event.payload.payment_id == "p2" and "p2" not in seen:
+            seen.append("p2")
+            raise RuntimeError("ledger unavailable")
+        seen.append(event.payload.payment_id)
+
+    with pytest.raises(RuntimeError):
+        queue.process("notifications", handler, batch_size=10)
+    assert queue.committed("notifications") == 2
+    assert queue.process("notifications", handler, batch_size=2) == 3
+    assert seen == ["p0", "p1", "p2", "p2", "p3", "p4"]
+    assert queue.lag("notifications") == 0
+    queue.close()
+
+
+def test_durable_queue_retention_waits_for_every_consumer(tmp_path, settled_event):
+    queue = DurableEventQueue(lambda: str(tmp_path / "events.db"), retention=timedelta(days=1))
+    queue.register("ledger")
+    queue.register("audit")
+    queue.publish_many([settled_event(n) for n in range(4)])
+    queue.ack("ledger", 4)
+    queue.ack("audit", 2)
+    later = datetime.now(UTC) + timedelta(days=2)
+    assert queue.apply_retention(now=datetime.now(UTC)) == 0
+    assert queue.apply_retention(now=later) == 2
+    assert [event.offset for event in queue.poll("audit")] == [3, 4]
+    queue.close()
+
+
+def test_settlement_events_go_through_the_outbox(api, create_payment):
+    kept, rolled_back = create_payment(), create_payment()
+    with pytest.raises(RuntimeError):
+        with db_transaction():
+            settle_payment_by_id(rolled_back, Decimal("40.00"), "usd")
+            raise RuntimeError("ledger write failed")
+    settle_payment_by_id(kept, Decimal("40.00"), "usd")
+
+    # Commit is the only I/O on the request path; nothing is published yet.
+    assert pending_count() == 1
+    assert event_queue.lag("api") == 0
+
+    _, body = api.get_events()
+    assert [event["payload"]["payment_id"] for event in body["events"]] == [kept]
+    assert pending_count() == 0
+    assert outbox_relay.stats.events >= 1
+
+
+def test_importing_the_app_starts_no_workers(tmp_path):
+    script = (
+        "import threading, services.payments.app; "
+        "print(sorted(t.name for t in threading.enumerate() if t.name.startswith('payments-')))"
+    )
+    env = dict(os.environ, PAYMENTS_DATABASE_PATH=str(tmp_path / "payments.db"))
+    result = subprocess.run(
+        [sys.executable, "-c", script], cwd=ROOT_DIR, env=env, capture_output=True, text=True, check=True
+    )
+    assert result.stdout.strip() == "[]"
+
+
+def test_running_api_relays_settlements_to_consumers(create_payment):
+    event_queue.register("ledger", from_beginning=False)
+    running = PaymentsAPI()
+    try:
+        payment_id = create_payment()
+        settle_payment_by_id(payment_id, Decimal("40.00"), "usd")
+        deadline = time.monotonic() + 5
+        events = []
+        while not events and time.monotonic() < deadline:
+            events = event_queue.poll("ledger")
+            time.sleep(0.05)
+    finally:
+        running.close()
+    assert [event.payload.payment_id for event in events] == [payment_id]
+
+
+def test_outbox_relay_is_idempotent_after_a_crash(api, tmp_path, create_payment):
+    for _ in range(3):
+        settle_payment_by_id(create_payment(), Decimal("40.00"), "usd")
+    with db_transaction() as conn:
+        rows = [tuple(row) for row in conn.execute("SELECT event_id, name, payload, created_at FROM outbox")]
+
+    queue = DurableEventQueue(lambda: str(tmp_path / "relay.db"))
+    relay = OutboxRelay(queue, batch_size=2)
+    assert relay.relay_all() == 3
+    # A relay that died before deleting its batch publishes the same rows again.
+    with db_transaction() as conn:
+        conn.executemany("INSERT INTO outbox (event_id, name, payload, created_at) VALUES (?, ?, ?, ?)", rows)
+    assert relay.relay_all() == 3
+    events = queue.poll("ledger")
+    assert len(events) == 3
+    assert {event.event_id for event in events} == {row[0] for row in rows}
+    queue.close()
+
+
+def test_webhook_ingest_acks_once_and_dedupes_replays(api, create_payment, stripe_succeeded):
+    body = stripe_succeeded(create_payment(), "evt_1")
+    raw, headers = json.dumps(body).encode("utf-8"), {"Stripe-Signature": _stripe_signature(body)}
+
+    statuses = [api.post_webhook_ingest("stripe", raw, headers)[0] for _ in range(20)]
+    assert statuses == [202] + [200] * 19
+    assert api.webhook_ingestor.duplicates == 19
+
+    # A fresh process has an empty seen-set; the unique key still catches the replay.
+    status, response = WebhookIngestor().ingest("stripe", raw, headers)
+    assert (status, response["duplicate"]) == (200, True)
+    assert api.post_webhook_ingest("stripe", raw, {"Stripe-Signature": "bad"})[0] == 400
+    with db_transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM webhook_inbox").fetchone()[0] == 1
+
+
+def test_settlement_worker_applies_inbox_in_batches(api, monkeypatch, create_payment, stripe_succeeded):
+    payment_ids = [create_payment() for _ in range(5)]
+    for n, payment_id in enumerate(payment_ids):
+        body = stripe_succeeded(payment_id, f"evt_{n}")
+        api.post_webhook_ingest("stripe", json.dumps(body).encode(), {"Stripe-Signature": _stripe_signature(body)})
+
+    header, secret, name, apply = webhooks.PROVIDERS["stripe"]
+
+    def flaky_apply(payload):
+        result = apply(payload)
+        if payload["id"] == "evt_2":
+            raise RuntimeError("ledger unavailable")
+        return result
+
+    monkeypatch.setitem(webhooks.PROVIDERS, "stripe", (header, secret, name, flaky_apply))
+    worker = WebhookSettlementWorker(batch_size=10, max_attempts=2)
+    assert worker.pending() == 5
+    assert worker.process_batch() == 5
+    # The failed event stays in the inbox, backed off rather than closed.
+    assert worker.pending() == 1 and worker.failed == 1
+    assert worker.drain() == 0
+
+    with db_transaction() as conn:
+        statuses = dict(conn.execute("SELECT id, status FROM payments").fetchall())
+        failed = conn.execute("SELECT processed_at, attempts, result FROM webhook_inbox WHERE id = 3").fetchone()
+    assert [statuses[payment_id] for payment_id in payment_ids] == [
+        "settled",
+        "settled",
+        "pending",
+        "settled",
+        "settled",
+    ]
+    assert tuple(failed) == (None, 1, "error: ledger unavailable")
+    assert len(api.get_events()[1]["events"]) == 4
+
+    # Out of attempts: parked for an operator instead of marked processed.
+    later = datetime.now(UTC) + timedelta(minutes=5)
+    assert worker.process_batch(now=later) == 1
+    assert (worker.pending(), worker.parked()) == (0, 1)
+    monkeypatch.setitem(webhooks.PROVIDERS, "stripe", (header, secret, name, apply))
+    assert worker.requeue() == 1
+    assert worker.drain() == 1
+    with db_transaction() as conn:
+        assert conn.execute("SELECT status FROM payments WHERE id = ?", (payment_ids[2],)).fetchone()[0] == "settled"
+
+
+def test_webhook_for_an_unknown_payment_is_retried(api, stripe_succeeded):
+    body = stripe_succeeded("not-yet-finalized", "evt_early")
+    api.post_webhook_ingest("stripe", json.dumps(body).encode(), {"Stripe-Signature": _stripe_signature(body)})
+    worker = WebhookSettlementWorker(max_attempts=3)
+    assert worker.drain() == 1
+    assert worker.pending() == 1 and worker.ignored == 1
+
+    payment = {"id": "not-yet-finalized", "provider": "stripe_ach", "amount": "40.00", "currency": "USD"}
+    _insert_rows("payments", [dict(payment, status="pending")])
+    assert worker.drain(now=datetime.now(UTC) + timedelta(seconds=5)) == 1
+    with db_transaction() as conn:
+        row = conn.execute("SELECT processed_at, result FROM webhook_inbox").fetchone()
+    assert row["processed_at"] and row["result"] == "not-yet-finalized"
+
+
+def test_running_api_applies_ingested_webhooks(create_payment, stripe_succeeded):
+    payment_id = create_payment()
+    running = PaymentsAPI()
+    try:
+        body = stripe_succeeded(payment_id, "evt_bg")
+        raw = json.dumps(body).encode()
+        assert running.post_webhook_ingest("stripe", raw, {"Stripe-Signature": _stripe_signature(body)})[0] == 202
+        deadline = time.monotonic() + 5
+        while settlement_worker.pending() and time.monotonic() < deadline:
+            time.sleep(0.05)
+    finally:
+        running.close()
+    with db_transaction() as conn:
+        assert conn.execute("SELECT status FROM payments WHERE id = ?", (payment_id,)).fetchone()[0] == "settled"
+
+
+def _insert_rows(table, rows):
+    with db_transaction() as conn:
+        for row in rows:
+            row = {"created_at": "2024-06-01T00:00:00+00:00", "updated_at": "2024-06-03T12:00:00+00:00", **row}
+            row.setdefault("amount_units", to_units(Decimal(row["amount"])))
+            columns = ", ".join(row)
+            conn.execute(f"INSERT INTO {table} ({columns}) VALUES ({', '.join('?' * len(row))})", tuple(row.values()))
+
+
+def test_reconcile_stripe_export_reports_every_discrepancy():
+    def payment(ref, amount, status, provider="stripe_ach", currency="USD"):
+        return {
+            "id": f"pay-{ref}",
+            "provider": provider,
+            "amount": amount,
+            "currency": currency,
+            "status": status,
+            "external_reference": ref,
+        }
+
+    _insert_rows(
+        "payments",
+        [
+            payment("pi_ok", "100.00", "settled"),
+            payment("pi_amount", "75.00", "settled"),
+            payment("pi_drift", "20.00", "pending"),
+            payment("pi_eur", "40.00", "settled", currency="EUR"),
+            payment("pi_not_reported", "9.00", "settled"),
+            payment("dl_other_provider", "9.00", "settled", provider="dlocal_bank_debit"),
+        ],
+    )
+    report = reconcile("stripe", FIXTURES / "stripe_settlement.csv", chunk_size=2)
+
+    assert (report.rows_read, report.skipped, report.invalid, report.matched) == (7, 1, 1, 4)
+    assert report.counts == {"amount": 1, "status": 1, "missing_internal": 1, "missing_in_report": 1}
+    by_kind = {item.kind: item for item in report.discrepancies}
+    assert by_kind["amount"].external_reference == "pi_amount"
+    assert by_kind["amount"].actual == "75.00 USD"
+    assert (by_kind["status"].expected, by_kind["status"].actual) == ("settled", "pending")
+    assert by_kind["missing_internal"].external_reference == "pi_unknown"
+    assert by_kind["missing_in_report"].row_id == "pay-pi_not_reported"
+    assert not report.clean
+
+    windowed = reconcile("stripe", FIXTURES / "stripe_settlement.csv", since="2024-06-04")
+    assert windowed.counts["missing_in_report"] == 0
+
+
+def test_reconcile_wise_payouts():
+    _insert_rows(
+        "payouts",
+        [
+            {"id": "po-1", "amount": "25.00", "currency": "USD", "status": "paid", "beneficiary_id": "b1",
+             "external_reference": "wise_1"},
+            {"id": "po-2", "amount": "30.00", "currency": "EUR", "status": "failed", "beneficiary_id": "b2",
+             "external_reference": "wise_2"},
+            {"id": "po-3", "amount": "10.00", "currency": "BRL", "status": "paid", "beneficiary_id": "b3",
+             "external_reference": "wise_3"},
+        ],
+    )
+    report = reconcile("wise", FIXTURES / "wise_settlement.csv")
+    assert report.matched == 3 and report.clean
+
+
+def test_reconcile_compares_large_amounts_exactly():
+    _insert_rows(
+        "payouts",
+        [
+            {"id": "po-1", "amount": "1234567890123.4567", "currency": "USD", "status": "paid",
+             "beneficiary_id": "b1", "external_reference": "wise_1"},
+        ],
+    )
+    export = "transfer_id,status,amount,currency\n{}\n{}\n".format(
+        "wise_1,outgoing_payment_sent,1234567890123.4568,USD", "wise_2,outgoing_payment_sent,1.00001,USD"
+    )
+    report = reconcile("wise", io.StringIO(export))
+    assert report.invalid == 1
+    assert [item.kind for item in report.discrepancies] == ["amount"]
+
+
+def test_totals_read_model_tracks_status_changes(api, create_payment):
+    settled, pending = create_payment("40.10"), create_payment("12.25")
+    create_payment("0.05")
+    settle_payment_by_id(settled, Decimal("40.10"), "usd")
+    with pytest.raises(RuntimeError):
+        with db_transaction():
+            settle_payment_by_id(pending, Decimal("12.25"), "usd")
+            raise RuntimeError("rolled back with the status change")
+    status, body = api.post_payout_create({"amount": "25.00", "currency": "EUR", "beneficiary_meta": {"iban": "x"}})
+    assert status == 200
+
+    by_status = {total.group["status"]: total for total in aggregates.payment_totals(group_by=["status"])}
+    assert {status: (total.count, total.amount) for status, total in by_status.items()} == {
+        "pending": (2, Decimal("12.30")),
+        "settled": (1, Decimal("40.10")),
+    }
+    assert [total.as_dict() for total in aggregates.fee_totals()] == [
+        {"provider": "stripe_ach", "currency": "USD", "count": 3, "amount": "0.9"}
+    ]
+    assert api.get_totals("payouts", {"group_by": ""}) == (200, {"totals": [{"count": 1, "amount": "25"}]})
+    assert api.get_totals("payments", {"currency": "usd", "status": "settled"})[1]["totals"][0]["amount"] == "40.1"
+    assert api.get_totals("payments", {"group_by": "region"})[0] == 400
+    assert api.get_totals("refunds")[0] == 404
+
+    before = [aggregates.payment_totals(), aggregates.payout_totals(), aggregates.fee_totals()]
+    aggregates.rebuild()
+    assert [aggregates.payment_totals(), aggregates.payout_totals(), aggregates.fee_totals()] == before
+
+
+def test_totals_are_exact_in_scaled_units(api, create_payment):
+    create_payment("1234567890123.4567")
+    create_payment("0.0001")
+    [total] = aggregates.payment_totals()
+    assert total.amount_units == 12345678901234568
+    assert total.amount == Decimal("1234567890123.4568")
+    with pytest.raises(ValueError):
+        create_payment("1.23456")
+    with db_transaction() as conn:
+        assert conn.execute("SELECT COUNT(*) FROM payments").fetchone()[0] == 2
+
+
+def test_totals_migration_backfills_existing_rows(tmp_path):
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    try:
+        migrate(conn, target=4)
+        conn.executemany(
+            "INSERT INTO payments (id, provider, amount, currency, status, created_at, updated_at) "
+            "VALUES (?, 'dlocal_bank_debit', ?, 'BRL', 'settled', '2024-01-01', '2024-01-01')",
+            [("p1", "10.10"), ("p2", "0.20")],
+        )
+        conn.commit()
+        migrate(conn)
+        assert conn.execute("SELECT count, amount_units FROM payment_totals").fetchall() == [(2, 103_000)]
+        conn.execute("DELETE FROM payments WHERE id = 'p1'")
+        assert conn.execute("SELECT count, amount_units FROM payment_totals").fetchall() == [(1, 2_000)]
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def test_exact_totals_migration_rebuilds_the_read_model(tmp_path):
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    try:
+        migrate(conn, target=6)
+        conn.execute(
+            "INSERT INTO payments (id, provider, amount, currency, status, created_at, updated_at) "
+            "VALUES ('p1', 'stripe_ach', '1234567890123.4567', 'USD', 'settled', '2024-01-01', '2024-01-01')"
+        )
+        # Version 5 totals came from REAL arithmetic and may be off.
+        conn.execute("UPDATE payment_totals SET amount_units = 12345678901234568")
+        conn.commit()
+        migrate(conn)
+        assert conn.execute("SELECT count, amount_units FROM payment_totals").fetchall() == [(1, 12345678901234567)]
+    finally:
+        conn.close()
+
+
+def test_amount_units_migration_backfills_columns_and_totals(tmp_path):
+    conn = sqlite3.connect(tmp_path / "legacy.db")
+    try:
+        migrate(conn, target=7)
+        conn.executemany(
+            "INSERT INTO payments (id, provider, amount, currency, status, created_at, updated_at) "
+            "VALUES (?, 'stripe_ach', ?, 'USD', 'settled', '2024-01-01', '2024-01-01')",
+            [("p1", "1234567890123.4567"), ("p2", "-0.5")],
+        )
+        conn.commit()
+        migrate(conn)
+        rows = conn.execute("SELECT id, amount_units FROM payments ORDER BY id").fetchall()
+        assert rows == [("p1", 12345678901234567), ("p2", -5_000)]
+        assert conn.execute("SELECT count, amount_units FROM payment_totals").fetchall() == [(2, 12345678901229567)]
+        conn.execute("UPDATE payments SET amount_units = 10000 WHERE id = 'p2'")
+        assert conn.execute("SELECT count, amount_units FROM payment_totals").fetchall() == [(2, 12345678901244567)]
+        conn.commit()
+    finally:
+        conn.close()
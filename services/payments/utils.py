@@ -5,8 +5,13 @@ import hashlib
 import hmac
 import json
 import time
+from decimal import Decimal
 from typing import Callable, Optional
 
+# Money stored as integers (``amount_units`` columns, aggregates, reconciliation) is scaled by this factor.
+AMOUNT_SCALE = 10_000
+AMOUNT_DECIMALS = len(str(AMOUNT_SCALE)) - 1
+
 
 def retry_with_backoff(func: Callable[[], object], attempts: int = 3, base_delay: float = 0.2) -> object:
     """Run ``func`` with exponential backoff retries."""
@@ -34,8 +39,25 @@ def verify_signature(secret: str, payload: bytes, header_signature: str) -> bool
     return hmac.compare_digest(expected, header_signature)
 
 
+def to_units(amount: Decimal) -> int:
+    """Exact ``AMOUNT_SCALE`` integer units of ``amount``; finer amounts are rejected, not rounded."""
+    if not amount.is_finite():
+        raise ValueError(f"amount {amount} is not a finite number")
+    units = amount.scaleb(AMOUNT_DECIMALS)
+    if units != units.to_integral_value():
+        raise ValueError(f"amount {amount} has more than {AMOUNT_DECIMALS} decimal places")
+    return int(units)
+
+
 def json_dumps(data: object) -> str:
     return json.dumps(data, separators=(",", ":"), sort_keys=True)
 
 
-__all__ = ["retry_with_backoff", "verify_signature", "json_dumps"]
+__all__ = [
+    "AMOUNT_DECIMALS",
+    "AMOUNT_SCALE",
+    "retry_with_backoff",
+    "to_units",
+    "verify_signature",
+    "json_dumps",
+]
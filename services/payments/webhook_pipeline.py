@@ -0,0 +1,258 @@
+"""Webhook ingestion with deduplication and batched settlement.
+
+:meth:`WebhookIngestor.ingest` verifies the signature, drops replays, stores
+the payload in ``webhook_inbox`` and returns at once. Replays are caught first
+by a bounded in-memory seen-set and then by the ``(provider, event_id)``
+unique key. :class:`WebhookSettlementWorker` applies due inbox rows in
+batches. Each batch runs in one transaction, and every row gets its own
+savepoint, so one bad event does not roll back the rest. A row is marked
+processed in the same transaction that applies it, so each event is applied
+exactly once.
+
+A row that raises, or that matches no payment yet (e.g. it arrived before
+``external_reference`` was written), stays unprocessed and is retried with
+exponential backoff. After ``max_attempts`` an unmatched row is closed as
+``ignored``; a failing row is parked for :meth:`WebhookSettlementWorker.requeue`.
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import UTC, datetime, timedelta
+from typing import Dict, Hashable, Optional, Tuple
+
+from .database import db_transaction
+from .webhooks import PROVIDERS, WebhookError, verify_webhook
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEEN_SIZE = 10_000
+DEFAULT_BATCH_SIZE = 200
+DEFAULT_MAX_ATTEMPTS = 6
+DEFAULT_RETRY_DELAY = timedelta(seconds=1)
+MAX_RETRY_DELAY = timedelta(minutes=1)
+
+
+class BoundedSeenSet:
+    """LRU set of recently seen keys, capped at ``maxsize`` entries."""
+
+    def __init__(self, maxsize: int = DEFAULT_SEEN_SIZE) -> None:
+        self.maxsize = maxsize
+        self._keys: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def add(self, key: Hashable) -> bool:
+        """Remember ``key``; returns ``False`` if it was already present."""
+        with self._lock:
+            if key in self._keys:
+                self._keys.move_to_end(key)
+                return False
+            self._keys[key] = None
+            if len(self._keys) > self.maxsize:
+                self._keys.popitem(last=False)
+            return True
+
+    def discard(self, key: Hashable) -> None:
+        with self._lock:
+            self._keys.pop(key, None)
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+
+def provider_event_id(
+    provider: str, payload: Dict[str, object], raw_body: bytes, headers: Optional[Dict[str, str]] = None
+) -> str:
+    """The provider's own event id, or a body digest when it sends none."""
+    if provider == "stripe" and payload.get("id"):
+        return str(payload["id"])
+    if provider == "dlocal" and payload.get("id"):
+        # dLocal notifies per payment state, so the state is part of the identity.
+        return f"{payload['id']}:{payload.get('status', '')}"
+    if provider == "wise" and headers and headers.get("X-Delivery-Id"):
+        return str(headers["X-Delivery-Id"])
+    return "sha256:" + hashlib.sha256(raw_body).hexdigest()
+
+
+class WebhookIngestor:
+    """Fast acknowledgement path for provider webhooks."""
+
+    def __init__(self, *, seen_size: int = DEFAULT_SEEN_SIZE) -> None:
+        self.seen = BoundedSeenSet(seen_size)
+        self.accepted = 0
+        self.duplicates = 0
+
+    def ingest(self, provider: str, raw_body: bytes, headers: Dict[str, str]) -> Tuple[int, Dict[str, object]]:
+        if provider not in PROVIDERS:
+            return 404, {"error": "Unknown provider"}
+        header = PROVIDERS[provider][0]
+        try:
+            payload = verify_webhook(provider, raw_body, headers.get(header, ""))
+        except WebhookError as exc:
+            return 400, {"error": exc.message}
+
+        event_id = provider_event_id(provider, payload, raw_body, headers)
+        key = (provider, event_id)
+        if not self.seen.add(key):
+            self.duplicates += 1
+            return 200, {"event_id": event_id, "duplicate": True}
+        received_at = datetime.now(tz=UTC).isoformat()
+        try:
+            with db_transaction() as conn:
+                inserted = conn.execute(
+                    """
+                    INSERT OR IGNORE INTO webhook_inbox (provider, event_id, payload, received_at, next_attempt_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    """,
+                    (provider, event_id, json.dumps(payload), received_at, received_at),
+                ).rowcount
+        except Exception:
+            self.seen.discard(key)
+            raise
+        if not inserted:
+            self.duplicates += 1
+            return 200, {"event_id": event_id, "duplicate": True}
+        self.accepted += 1
+        return 202, {"event_id": event_id, "duplicate": False}
+
+
+class WebhookSettlementWorker:
+    """Applies due ``webhook_inbox`` rows in batched transactions."""
+
+    def __init__(
+        self,
+        *,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        max_attempts: int = DEFAULT_MAX_ATTEMPTS,
+        retry_delay: timedelta = DEFAULT_RETRY_DELAY,
+    ) -> None:
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.processed = 0
+        self.failed = 0
+        self.ignored = 0
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def process_batch(self, now: Optional[datetime] = None) -> int:
+        """Apply up to ``batch_size`` due events; returns how many were attempted."""
+        now = now or datetime.now(tz=UTC)
+        with self._lock, db_transaction() as conn:
+            rows = conn.execute(
+                """
+                SELECT id, provider, payload, attempts FROM webhook_inbox
+                WHERE processed_at IS NULL AND next_attempt_at <= ?
+                ORDER BY next_attempt_at, id LIMIT ?
+                """,
+                (now.isoformat(), self.batch_size),
+            ).fetchall()
+            for row in rows:
+                apply = PROVIDERS[row["provider"]][3]
+                attempts = row["attempts"] + 1
+                try:
+                    with db_transaction():
+                        applied = apply(json.loads(row["payload"]))
+                except Exception as exc:
+                    logger.exception("Webhook %s could not be applied (attempt %d)", row["id"], attempts)
+                    self.failed += 1
+                    self._reschedule(conn, row["id"], attempts, f"error: {exc}", now, park=True)
+                    continue
+                if applied:
+                    conn.execute(
+                        "UPDATE webhook_inbox SET processed_at = ?, result = ?, attempts = ? WHERE id = ?",
+                        (now.isoformat(), applied, attempts, row["id"]),
+                    )
+                else:
+                    self.ignored += 1
+                    self._reschedule(conn, row["id"], attempts, "ignored", now, park=False)
+            self.processed += len(rows)
+            return len(rows)
+
+    def _reschedule(
+        self, conn: sqlite3.Connection, row_id: int, attempts: int, result: str, now: datetime, *, park: bool
+    ) -> None:
+        processed_at = next_attempt_at = None
+        if attempts < self.max_attempts:
+            delay = min(self.retry_delay * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+            next_attempt_at = (now + delay).isoformat()
+        elif not park:
+            processed_at = now.isoformat()
+        conn.execute(
+            "UPDATE webhook_inbox SET attempts = ?, result = ?, next_attempt_at = ?, processed_at = ? WHERE id = ?",
+            (attempts, result, next_attempt_at, processed_at, row_id),
+        )
+
+    def drain(self, now: Optional[datetime] = None) -> int:
+        """Process every event that is due now; backed-off retries are left for later."""
+        total = 0
+        while True:
+            handled = self.process_batch(now)
+            if not handled:
+                return total
+            total += handled
+
+    def pending(self) -> int:
+        """Events still to be applied, including ones waiting for a retry."""
+        with db_transaction() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM webhook_inbox WHERE processed_at IS NULL AND next_attempt_at IS NOT NULL"
+            ).fetchone()[0]
+
+    def parked(self) -> int:
+        """Events that failed ``max_attempts`` times and wait for :meth:`requeue`."""
+        with db_transaction() as conn:
+            return conn.execute(
+                "SELECT COUNT(*) FROM webhook_inbox WHERE processed_at IS NULL AND next_attempt_at IS NULL"
+            ).fetchone()[0]
+
+    def requeue(self) -> int:
+        """Make parked events due again with a fresh attempt budget."""
+        with db_transaction() as conn:
+            return conn.execute(
+                """
+                UPDATE webhook_inbox SET attempts = 0, next_attempt_at = ?
+                WHERE processed_at IS NULL AND next_attempt_at IS NULL
+                """,
+                (datetime.now(tz=UTC).isoformat(),),
+            ).rowcount
+
+    def start(self, interval: float = 0.2) -> None:
+        """Process in a background thread, polling every ``interval`` seconds when idle."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="payments-webhooks", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self, interval: float) -> None:
+        while not self._stop.is_set():
+            try:
+                handled = self.process_batch()
+            except Exception:  # pragma: no cover - defensive
+                logger.exception("Webhook settlement batch failed")
+                handled = 0
+            if handled < self.batch_size:
+                self._stop.wait(interval)
+
+
+settlement_worker = WebhookSettlementWorker()
+
+__all__ = [
+    "BoundedSeenSet",
+    "WebhookIngestor",
+    "WebhookSettlementWorker",
+    "provider_event_id",
+    "settlement_worker",
+]
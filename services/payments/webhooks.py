@@ -3,7 +3,7 @@ from __future__ import annotations
 
 import json
 from decimal import Decimal
-from typing import Dict, Optional
+from typing import Callable, Dict, Optional, Tuple
 
 from .config import get_settings
 from .providers.dlocal_provider import dlocal_collect_provider
@@ -26,13 +26,7 @@ def _decode_payload(raw_body: bytes) -> Dict[str, object]:
         raise WebhookError("Invalid JSON payload") from exc
 
 
-def handle_stripe_webhook(raw_body: bytes, signature: str) -> Optional[str]:
-    settings = get_settings()
-    if not verify_signature(settings.stripe_webhook_secret, raw_body, signature):
-        raise WebhookError("Invalid Stripe signature")
-
-    payload = _decode_payload(raw_body)
-    outcome = stripe_collect_provider.interpret_webhook(payload)
+def _settle_collect(outcome: Optional[Dict[str, object]]) -> Optional[str]:
     if not outcome:
         return None
 
@@ -51,37 +45,15 @@ def handle_stripe_webhook(raw_body: bytes, signature: str) -> Optional[str]:
     return event.payment_id if event else None
 
 
-def handle_dlocal_webhook(raw_body: bytes, signature: str) -> Optional[str]:
-    settings = get_settings()
-    if not verify_signature(settings.dlocal_webhook_secret, raw_body, signature):
-        raise WebhookError("Invalid dLocal signature")
+def apply_stripe_payload(payload: Dict[str, object]) -> Optional[str]:
+    return _settle_collect(stripe_collect_provider.interpret_webhook(payload))
 
-    payload = _decode_payload(raw_body)
-    outcome = dlocal_collect_provider.interpret_webhook(payload)
-    if not outcome:
-        return None
-
-    payment_id = outcome.get("payment_id")
-    amount = Decimal(str(outcome.get("amount", "0")))
-    currency = str(outcome.get("currency", "USD"))
-    if payment_id:
-        event = settle_payment_by_id(payment_id, amount=amount, currency=currency)
-    else:
-        event = mark_payment_succeeded(
-            payment_external_reference=str(outcome.get("external_reference", "")),
-            payment_id="",
-            amount=amount,
-            currency=currency,
-        )
-    return event.payment_id if event else None
 
+def apply_dlocal_payload(payload: Dict[str, object]) -> Optional[str]:
+    return _settle_collect(dlocal_collect_provider.interpret_webhook(payload))
 
-def handle_wise_webhook(raw_body: bytes, signature: str) -> Optional[str]:
-    settings = get_settings()
-    if not verify_signature(settings.wise_webhook_secret, raw_body, signature):
-        raise WebhookError("Invalid Wise signature")
 
-    payload = _decode_payload(raw_body)
+def apply_wise_payload(payload: Dict[str, object]) -> Optional[str]:
     resource_id = wise_payout_provider.interpret_webhook(payload)
     if not resource_id:
         return None
@@ -90,7 +62,40 @@ def handle_wise_webhook(raw_body: bytes, signature: str) -> Optional[str]:
     return payout.id if payout else None
 
 
+# provider -> (signature header, Settings attribute holding the secret, display name, apply)
+PROVIDERS: Dict[str, Tuple[str, str, str, Callable[[Dict[str, object]], Optional[str]]]] = {
+    "stripe": ("Stripe-Signature", "stripe_webhook_secret", "Stripe", apply_stripe_payload),
+    "dlocal": ("Dlocal-Signature", "dlocal_webhook_secret", "dLocal", apply_dlocal_payload),
+    "wise": ("Wise-Signature", "wise_webhook_secret", "Wise", apply_wise_payload),
+}
+
+
+def verify_webhook(provider: str, raw_body: bytes, signature: str) -> Dict[str, object]:
+    """Check ``signature`` for ``provider`` and return the decoded payload."""
+    _, secret_name, display_name, _ = PROVIDERS[provider]
+    if not verify_signature(getattr(get_settings(), secret_name), raw_body, signature):
+        raise WebhookError(f"Invalid {display_name} signature")
+    return _decode_payload(raw_body)
+
+
+def handle_stripe_webhook(raw_body: bytes, signature: str) -> Optional[str]:
+    return apply_stripe_payload(verify_webhook("stripe", raw_body, signature))
+
+
+def handle_dlocal_webhook(raw_body: bytes, signature: str) -> Optional[str]:
+    return apply_dlocal_payload(verify_webhook("dlocal", raw_body, signature))
+
+
+def handle_wise_webhook(raw_body: bytes, signature: str) -> Optional[str]:
+    return apply_wise_payload(verify_webhook("wise", raw_body, signature))
+
+
 __all__ = [
+    "PROVIDERS",
+    "apply_dlocal_payload",
+    "apply_stripe_payload",
+    "apply_wise_payload",
+    "verify_webhook",
     "handle_stripe_webhook",
     "handle_dlocal_webhook",
     "handle_wise_webhook",
@@ -0,0 +1,34 @@
+"""Shared test doubles for the market data tests."""
+from __future__ import annotations
+
+import threading
+from datetime import datetime, timezone
+from typing import List, Optional
+
+from services.market_data.providers.banxico_fix import (
+    BanxicoFixClient,
+    BanxicoFixError,
+    BanxicoFixQuote,
+)
+
+STUB_TS = datetime(2024, 4, 5, tzinfo=timezone.utc)
+
+
+class StubBanxicoClient(BanxicoFixClient):
+    """Banxico client that answers every series with ``quote`` instead of calling the API."""
+
+    def __init__(self, quote: Optional[BanxicoFixQuote] = None) -> None:
+        super().__init__(token="dummy")
+        self._quote = quote or BanxicoFixQuote(value=17.3, ts=STUB_TS)
+        self.invocations = 0
+        self.should_fail = False
+        self.requested: List[str] = []
+        self.fetch_threads: List[str] = []
+
+    def _fetch_series(self, series_ids):  # type: ignore[override]
+        if self.should_fail:
+            raise BanxicoFixError("boom")
+        self.invocations += 1
+        self.requested = list(series_ids)
+        self.fetch_threads.append(threading.current_thread().name)
+        return {series_id: self._quote for series_id in series_ids}
@@ -0,0 +1,133 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from audit_client import AuditClient, AuditQuery
+from services.audit.archive import SegmentArchive
+from services.audit.chain import ChainIntegrityError
+from services.audit.cli import main as audit_cli_main
+from services.audit.db import AuditLogRepository
+
+BASE_TS = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+
+def archived_repository(tmp_path, count: int = 20) -> AuditLogRepository:
+    archive = SegmentArchive(tmp_path / "segments")
+    repo = AuditLogRepository(sqlite3.connect(tmp_path / "audit.db"), archive=archive)
+    repo.append_many(
+        [("svc", "emit" if n % 2 else "tick", {"n": n}, BASE_TS + timedelta(minutes=n)) for n in range(count)]
+    )
+    return repo
+
+
+def live_count(repo: AuditLogRepository) -> int:
+    return repo._conn.execute("SELECT COUNT(*) FROM audit_log").fetchone()[0]
+
+
+def test_rotate_moves_sealed_ranges_and_chain_still_verifies(tmp_path):
+    repo = archived_repository(tmp_path)
+    first = repo.rotate(keep_live=12)
+    second = repo.archive_through(15)
+    assert (first.first_id, first.last_id) == (1, 8)
+    assert (second.first_id, second.last_id) == (9, 15)
+    assert second.head_prev_hash == first.tail_hash
+    assert live_count(repo) == 5
+
+    repo.append("svc", "emit", {"n": 20})
+    repo.verify()
+    assert [json.loads(r.payload_json)["n"] for r in repo.all_records()] == list(range(21))
+    assert repo.archive_through(10**6).last_id == 20
+    assert live_count(repo) == 1
+    assert repo.inclusion_proof(3).verify()
+    repo._conn.close()
+
+    manifest = (tmp_path / "segments" / "manifest.jsonl").read_text().splitlines()
+    assert len(manifest) == 3
+    reopened = AuditLogRepository(sqlite3.connect(tmp_path / "audit.db"), archive=SegmentArchive(tmp_path / "segments"))
+    reopened.verify()
+    assert len(reopened.all_records()) == 21
+    reopened._conn.close()
+
+
+def test_query_spans_archive_and_live_table(tmp_path):
+    repo = archived_repository(tmp_path)
+    repo.rotate(keep_live=6)
+    query = AuditQuery(action="emit", since=BASE_TS + timedelta(minutes=5))
+    assert [json.loads(r.payload_json)["n"] for r in repo.iter_query(query)] == [5, 7, 9, 11, 13, 15, 17, 19]
+
+    pages = []
+    cursor = 0
+    while cursor is not None:
+        page = repo.query(query, after_id=cursor, limit=3)
+        pages.append([json.loads(r.payload_json)["n"] for r in page.records])
+        cursor = page.next_after_id
+    assert pages == [[5, 7, 9], [11, 13, 15], [17, 19]]
+
+    assert [json.loads(r.payload_json)["n"] for r in repo.iter_query(AuditQuery(payload={"n": 4}))] == [4]
+    repo._conn.close()
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_query_rejects_a_non_positive_limit(tmp_path, limit):
+    repo = archived_repository(tmp_path)
+    repo.rotate(keep_live=6)
+    with pytest.raises(ValueError, match="limit must be positive"):
+        repo.query(limit=limit)
+    with pytest.raises(ValueError, match="limit must be positive"):
+        repo._archive.query_page(AuditQuery(), limit=limit)
+    repo._conn.close()
+
+
+def test_reads_stay_complete_when_a_seal_lands_mid_read(tmp_path, monkeypatch):
+    repo = archived_repository(tmp_path)
+    repo.archive_through(5)
+    archive = repo._archive
+    original = archive.iter_records
+    sealed = []
+
+    def sealing_iter_records(*args, **kwargs):
+        yield from original(*args, **kwargs)
+        if not sealed:
+            sealed.append(repo.archive_through(12))
+
+    monkeypatch.setattr(archive, "iter_records", sealing_iter_records)
+    assert [json.loads(r.payload_json)["n"] for r in repo.all_records()] == list(range(20))
+    sealed.clear()
+    assert len(list(repo.iter_query(page_size=4))) == 20
+    sealed.clear()
+    assert [r.id for r in repo.query(after_id=10, limit=4).records] == [11, 12, 13, 14]
+    repo._conn.close()
+
+
+def test_seal_leaves_the_transaction_to_the_caller(tmp_path):
+    repo = archived_repository(tmp_path)
+    assert repo._archive.seal(repo._conn, 10) is not None
+    assert repo._conn.in_transaction
+    repo._conn.rollback()
+    assert live_count(repo) == 20
+    repo._conn.close()
+
+
+def test_tampered_segment_fails_verification(tmp_path, capsys):
+    repo = archived_repository(tmp_path)
+    info = repo.rotate(keep_live=5)
+    repo._conn.close()
+    assert audit_cli_main([str(tmp_path / "audit.db"), "--archive-dir", str(tmp_path / "segments")]) == 0
+    assert "20 entries" in capsys.readouterr().out
+
+    segment = tmp_path / "segments" / info.file
+    segment.write_bytes(segment.read_bytes()[:-4] + b"\x00\x00\x00\x00")
+    with pytest.raises(ChainIntegrityError):
+        SegmentArchive(tmp_path / "segments").verify_files()
+    assert audit_cli_main([str(tmp_path / "audit.db"), "--archive-dir", str(tmp_path / "segments")]) == 1
+
+
+def test_client_rotation_keeps_reads_transparent(tmp_path):
+    with AuditClient(str(tmp_path / "audit.db"), archive_dir=str(tmp_path / "segments")) as client:
+        for n in range(10):
+            client.log("svc", "emit", {"n": n})
+        assert client.rotate(keep_live=3).count == 7
+        assert len(client.iter_records()) == 10
+        assert len(list(client.iter_query(AuditQuery(actor="svc"), page_size=4))) == 10
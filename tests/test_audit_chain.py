@@ -2,6 +2,7 @@ import ast
 import json
 import inspect
 import sqlite3
+import threading
 from datetime import datetime, timezone
 from pathlib import Path
 from trace import Trace
@@ -91,6 +92,50 @@ def test_audit_client_log_and_iter(tmp_path):
     assert records[0].actor == "svc"
 
 
+def test_audit_client_reuses_connection_in_wal_mode(tmp_path, monkeypatch):
+    db_path = tmp_path / "audit.db"
+    opened = []
+    real_connect = sqlite3.connect
+
+    def counting_connect(*args, **kwargs):
+        conn = real_connect(*args, **kwargs)
+        opened.append(conn)
+        return conn
+
+    monkeypatch.setattr(sqlite3, "connect", counting_connect)
+    with AuditClient(str(db_path), pool_size=2) as client:
+        for value in range(20):
+            client.log("svc", "emit", {"value": value})
+        assert len(client.iter_records()) == 20
+        assert len(client.iter_records()) == 20
+        assert len(opened) == 2
+        mode = opened[0].execute("PRAGMA journal_mode").fetchone()[0]
+        assert mode == "wal"
+
+    with pytest.raises(RuntimeError):
+        client.log("svc", "emit", {})
+    client.close()
+
+
+def test_audit_client_concurrent_writers_keep_chain_valid(tmp_path):
+    db_path = tmp_path / "audit.db"
+    with AuditClient(str(db_path)) as client:
+        def worker(offset: int) -> None:
+            for value in range(25):
+                client.log("svc", "emit", {"value": offset + value})
+
+        threads = [threading.Thread(target=worker, args=(index * 100,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    repo = create_repository(db_path)
+    repo.verify()
+    assert len(repo.all_records()) == 100
+    repo._conn.close()
+
+
 def test_cli_success(tmp_path, capsys):
     db_path = tmp_path / "audit.db"
     repo = create_repository(db_path)
@@ -0,0 +1,88 @@
+import hashlib
+import sqlite3
+
+import pytest
+
+from services.audit.db import AuditLogRepository
+from services.audit.merkle import (
+    EMPTY_ROOT,
+    MerkleProofError,
+    leaf_hash,
+    node_hash,
+    verify_consistency,
+    verify_inclusion,
+)
+
+
+def reference_root(leaves: list[str]) -> str:
+    if not leaves:
+        return EMPTY_ROOT
+    if len(leaves) == 1:
+        return leaves[0]
+    k = 1 << ((len(leaves) - 1).bit_length() - 1)
+    return node_hash(reference_root(leaves[:k]), reference_root(leaves[k:]))
+
+
+def populated_repository(db_path, count: int, **kwargs) -> AuditLogRepository:
+    repo = AuditLogRepository(sqlite3.connect(db_path), **kwargs)
+    for value in range(count):
+        repo.append("svc", "emit", {"value": value})
+    return repo
+
+
+def test_merkle_root_matches_reference(tmp_path):
+    repo = populated_repository(tmp_path / "audit.db", 13)
+    leaves = [leaf_hash(record.this_hash) for record in repo.all_records()]
+    for size in range(0, 14):
+        assert repo.merkle_root(size) == reference_root(leaves[:size])
+    repo._conn.close()
+
+
+def test_inclusion_proofs_verify_for_every_record(tmp_path):
+    repo = populated_repository(tmp_path / "audit.db", 11)
+    records = list(repo.all_records())
+    for size in range(1, len(records) + 1):
+        for record in records[:size]:
+            proof = repo.inclusion_proof(record.id, tree_size=size)
+            assert len(proof.path) <= size.bit_length()
+            assert proof.verify(record.this_hash)
+    proof = repo.inclusion_proof(records[3].id)
+    assert not proof.verify(records[4].this_hash)
+    assert not verify_inclusion(proof.leaf_hash, proof.leaf_index + 1, proof.tree_size, proof.path, proof.root_hash)
+    with pytest.raises(MerkleProofError):
+        repo.inclusion_proof(records[5].id, tree_size=5)
+    repo._conn.close()
+
+
+def test_consistency_proofs_between_roots(tmp_path):
+    repo = populated_repository(tmp_path / "audit.db", 10)
+    for old_size in range(0, 11):
+        for new_size in range(old_size, 11):
+            proof = repo.consistency_proof(old_size, new_size)
+            assert proof.verify(), (old_size, new_size)
+    proof = repo.consistency_proof(3, 7)
+    forged_root = hashlib.sha256(b"forged").hexdigest()
+    assert not verify_consistency(3, 7, forged_root, proof.new_root, proof.path)
+    repo._conn.close()
+
+
+def test_periodic_signed_roots_and_backfill(tmp_path):
+    db_path = tmp_path / "audit.db"
+    key = b"audit-signing-key"
+    repo = populated_repository(db_path, 7, signing_key=key, sign_every=3)
+    roots = repo.merkle.signed_roots()
+    assert [root.tree_size for root in roots] == [3, 6]
+    assert all(root.verify(key) for root in roots)
+    assert not roots[0].verify(b"other-key")
+    assert repo.consistency_proof(roots[0].tree_size, roots[1].tree_size).old_root == roots[0].root_hash
+
+    repo._conn.execute("DELETE FROM audit_merkle_leaf")
+    repo._conn.execute("DELETE FROM audit_merkle_node")
+    repo._conn.commit()
+    expected_root = reference_root([leaf_hash(record.this_hash) for record in repo.all_records()])
+    repo._conn.close()
+
+    reopened = AuditLogRepository(sqlite3.connect(db_path))
+    assert reopened.merkle.size == 7
+    assert reopened.merkle_root() == expected_root
+    reopened._conn.close()
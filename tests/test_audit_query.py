@@ -0,0 +1,124 @@
+import json
+import sqlite3
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from audit_client import AuditClient, AuditQuery
+from services.audit.cli import main as audit_cli_main
+from services.audit.db import AuditLogRepository
+
+BASE_TS = datetime(2024, 3, 1, tzinfo=timezone.utc)
+
+
+def seeded_repository(db_path) -> AuditLogRepository:
+    repo = AuditLogRepository(sqlite3.connect(db_path))
+    entries = []
+    for index in range(30):
+        actor = "alice" if index % 3 == 0 else "bob"
+        action = "approve" if index % 2 == 0 else "create"
+        entries.append((actor, action, {"order_id": f"o-{index % 5}", "n": index}, BASE_TS + timedelta(hours=index)))
+    repo.append_many(entries)
+    return repo
+
+
+def query_plan(conn, sql: str, params=()) -> str:
+    return " ".join(row[-1] for row in conn.execute("EXPLAIN QUERY PLAN " + sql, params))
+
+
+def test_query_filters_by_actor_action_and_time(tmp_path):
+    repo = seeded_repository(tmp_path / "audit.db")
+    query = AuditQuery(
+        actor="alice",
+        action="approve",
+        since=BASE_TS + timedelta(hours=6),
+        until="2024-03-02T00:00:00Z",
+    )
+    records = list(repo.iter_query(query))
+    assert [json.loads(record.payload_json)["n"] for record in records] == [6, 12, 18]
+
+    by_payload = list(repo.iter_query(AuditQuery(payload={"order_id": "o-2"})))
+    assert [json.loads(record.payload_json)["n"] for record in by_payload] == [2, 7, 12, 17, 22, 27]
+
+    with pytest.raises(ValueError):
+        repo.query(AuditQuery(payload={"bad key": 1}))
+    with pytest.raises(ValueError):
+        repo.query(AuditQuery(since=datetime(2024, 1, 1)))
+    repo._conn.close()
+
+
+def test_query_pages_with_keyset_cursor(tmp_path):
+    repo = seeded_repository(tmp_path / "audit.db")
+    query = AuditQuery(actor="bob")
+    seen = []
+    cursor = 0
+    while cursor is not None:
+        page = repo.query(query, after_id=cursor, limit=7)
+        assert len(page.records) <= 7
+        seen.extend(record.id for record in page.records)
+        cursor = page.next_after_id
+    assert len(seen) == 20
+    assert seen == sorted(seen)
+    repo._conn.close()
+
+
+def test_queries_use_indexes(tmp_path):
+    repo = seeded_repository(tmp_path / "audit.db")
+    conn = repo._conn
+    assert "idx_audit_log_actor" in query_plan(
+        conn, "SELECT id FROM audit_log WHERE actor = ? AND id > ? ORDER BY id", ("alice", 0)
+    )
+    assert "idx_audit_log_ts" in query_plan(conn, "SELECT id FROM audit_log WHERE ts >= ? AND ts < ?", ("a", "b"))
+    name = repo.index_payload_key("order_id")
+    assert name in query_plan(
+        conn, "SELECT id FROM audit_log WHERE json_extract(payload_json, '$.order_id') = ?", ("o-1",)
+    )
+    conn.close()
+
+
+def test_client_query_and_cli_subcommand(tmp_path, capsys):
+    db_path = tmp_path / "audit.db"
+    seeded_repository(db_path)._conn.close()
+
+    with AuditClient(str(db_path)) as client:
+        assert len(list(client.iter_query(AuditQuery(action="create"), page_size=4))) == 15
+
+    exit_code = audit_cli_main(
+        ["query", str(db_path), "--actor", "alice", "--payload", "n=9", "--limit", "5"]
+    )
+    captured = capsys.readouterr()
+    assert exit_code == 0
+    lines = [json.loads(line) for line in captured.out.splitlines()]
+    assert [line["id"] for line in lines] == [10]
+
+    exit_code = audit_cli_main(["query", str(db_path), "--action", "create", "--limit", "2"])
+    captured = capsys.readouterr()
+    assert len(captured.out.splitlines()) == 2
+    assert "--after-id" in captured.err
+
+    assert audit_cli_main(["verify", str(db_path)]) == 0
+
+
+def test_cli_reads_without_writing(tmp_path, capsys):
+    db_path = tmp_path / "audit.db"
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE audit_log (id INTEGER PRIMARY KEY AUTOINCREMENT, ts TEXT NOT NULL, actor TEXT NOT NULL, "
+        "action TEXT NOT NULL, payload_json TEXT NOT NULL, prev_hash TEXT NOT NULL, this_hash TEXT NOT NULL)"
+    )
+    conn.commit()
+    conn.close()
+    db_path.chmod(0o444)
+    try:
+        assert audit_cli_main(["verify", str(db_path)]) == 0
+        assert audit_cli_main(["query", str(db_path), "--actor", "alice"]) == 0
+    finally:
+        db_path.chmod(0o644)
+    conn = sqlite3.connect(db_path)
+    names = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type IN ('table', 'index')")]
+    conn.close()
+    assert names == ["audit_log", "sqlite_sequence"]
+
+    assert audit_cli_main(["verify", str(tmp_path / "missing.db")]) == 2
+    assert not (tmp_path / "missing.db").exists()
+    assert "cannot open audit log" in capsys.readouterr().err
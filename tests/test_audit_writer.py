@@ -0,0 +1,114 @@
+import threading
+
+import pytest
+
+from audit_client import AuditClient, AuditWriter
+
+
+class GatedClient(AuditClient):
+    """Client whose batch writes wait until the test opens the gate."""
+
+    def __init__(self, database_path: str):
+        super().__init__(database_path)
+        self.gate = threading.Event()
+        self.batches: list[int] = []
+
+    def log_many(self, entries):
+        self.gate.wait(timeout=5)
+        entries = list(entries)
+        self.batches.append(len(entries))
+        return super().log_many(entries)
+
+
+def test_writer_batches_and_flushes_on_close(tmp_path):
+    client = GatedClient(str(tmp_path / "audit.db"))
+    with AuditWriter(client, max_queue=100, batch_size=10) as writer:
+        for value in range(25):
+            assert writer.submit("svc", "emit", {"value": value})
+        client.gate.set()
+    records = client.iter_records()
+    assert [record.payload_json for record in records] == [f'{{"value":{value}}}' for value in range(25)]
+    assert writer.written == 25
+    assert len(client.batches) < 25
+    client.close()
+
+
+def test_writer_drop_policy_counts_dropped(tmp_path):
+    client = GatedClient(str(tmp_path / "audit.db"))
+    writer = AuditWriter(client, max_queue=2, batch_size=1, backpressure="drop")
+    results = [writer.submit("svc", "emit", {"value": value}) for value in range(10)]
+    client.gate.set()
+    writer.close()
+    assert results.count(False) == writer.dropped
+    assert writer.dropped > 0
+    assert len(client.iter_records()) == 10 - writer.dropped
+    client.close()
+
+
+def test_writer_spill_policy_replays_into_chain(tmp_path):
+    client = GatedClient(str(tmp_path / "audit.db"))
+    spill_path = tmp_path / "audit.spill"
+    writer = AuditWriter(client, max_queue=2, batch_size=1, backpressure="spill", spill_path=spill_path)
+    for value in range(10):
+        assert writer.submit("svc", "emit", {"value": value})
+    assert writer.spilled > 0
+    assert spill_path.exists()
+    client.gate.set()
+    writer.flush()
+    assert len(client.iter_records()) == 10
+    assert not spill_path.exists()
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.submit("svc", "emit", {})
+    client.close()
+
+
+def test_writer_rejects_unknown_policy(tmp_path):
+    with AuditClient(str(tmp_path / "audit.db")) as client:
+        with pytest.raises(ValueError):
+            AuditWriter(client, backpressure="ignore")
+        with pytest.raises(ValueError):
+            AuditWriter(client, backpressure="spill")
+
+
+def test_writer_close_keeps_entries_submitted_while_closing(tmp_path):
+    client = GatedClient(str(tmp_path / "audit.db"))
+    client.gate.set()
+    writer = AuditWriter(client, max_queue=10)
+    entered, release = threading.Event(), threading.Event()
+    put = writer._queue.put
+
+    def paused_put(item, *args, **kwargs):
+        # Hold the submitted entry between the closed check and the enqueue.
+        if isinstance(item, tuple):
+            entered.set()
+            release.wait(timeout=5)
+        put(item, *args, **kwargs)
+
+    writer._queue.put = paused_put
+    producer = threading.Thread(target=writer.submit, args=("svc", "emit", {"value": 1}))
+    producer.start()
+    assert entered.wait(timeout=5)
+    closer = threading.Thread(target=writer.close)
+    closer.start()
+    closer.join(timeout=0.2)
+    with pytest.raises(RuntimeError):
+        writer.submit("svc", "emit", {"value": 2})
+    release.set()
+    producer.join(timeout=5)
+    closer.join(timeout=5)
+    assert not closer.is_alive()
+    assert [record.payload_json for record in client.iter_records()] == ['{"value":1}']
+    client.close()
+
+
+def test_writer_rejects_payloads_that_are_not_json(tmp_path):
+    client = AuditClient(str(tmp_path / "audit.db"))
+    with AuditWriter(client, backpressure="spill", spill_path=tmp_path / "audit.spill") as writer:
+        with pytest.raises(ValueError, match="JSON"):
+            writer.submit("svc", "emit", {"when": object()})
+        with pytest.raises(ValueError, match="JSON"):
+            writer.submit("svc", "emit", "not json")
+        assert writer.submit("svc", "emit", '{"ok": true}')
+    assert len(client.iter_records()) == 1
+    client.close()
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.market_data.app import MarketDataApp, ServiceState
+from services.market_data.asgi import MarketDataASGIApp
+from tests.market_data_stubs import StubBanxicoClient
+
+TS = datetime(2024, 4, 5, tzinfo=timezone.utc)
+
+
+def _build() -> MarketDataASGIApp:
+    return MarketDataASGIApp(MarketDataApp(state=ServiceState(banxico_client=StubBanxicoClient())))
+
+
+async def _get(app: MarketDataASGIApp, path: str, query: str) -> Dict[str, object]:
+    messages: List[Dict[str, object]] = []
+
+    async def receive() -> Dict[str, object]:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: Dict[str, object]) -> None:
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": path, "query_string": query.encode()}
+    await app(scope, receive, send)
+    start, body = messages
+    return {"status": start["status"], "headers": dict(start["headers"]), "body": json.loads(body["body"])}
+
+
+def test_asgi_serves_manual_quotes_from_cache() -> None:
+    app = _build()
+    app.state.manual_spot_store.set_fix("USDMXN", 18.1, ts=TS)
+
+    first = asyncio.run(_get(app, "/fx/spot", "pair=usdmxn"))
+    second = asyncio.run(_get(app, "/fx/spot", "pair=USDMXN"))
+    assert first["body"] == second["body"] == {"value": 18.1, "ts": "2024-04-05T00:00:00Z", "source": "manual"}
+    assert app.state.response_cache.hits == 1
+
+    app.state.manual_spot_store.set_fix("USDMXN", 18.2, ts=TS)
+    third = asyncio.run(_get(app, "/fx/spot", "pair=USDMXN"))
+    assert third["body"]["value"] == 18.2
+    assert asyncio.run(_get(app, "/fx/spot", "pair=EURUSD"))["status"] == 400
+
+
+def test_asgi_offloads_cold_banxico_fetch() -> None:
+    app = _build()
+    client = app.state.banxico_client
+    assert app._may_block("GET", "/fx/spot", {"pair": "USDMXN"})
+
+    response = asyncio.run(_get(app, "/fx/spot", "pair=USDMXN"))
+    assert response["body"]["source"] == "banxico_fix"
+    assert b"age" in response["headers"]
+    assert client.fetch_threads == ["banxico-fetch_0"]
+    assert not app._may_block("GET", "/fx/spot", {"pair": "USDMXN"})
+
+
+def test_asgi_stream_pushes_updates_until_disconnect() -> None:
+    app = _build()
+    app.heartbeat = 0.01
+    sent: List[Dict[str, object]] = []
+
+    async def scenario() -> None:
+        disconnect = asyncio.Event()
+
+        async def receive() -> Dict[str, object]:
+            await disconnect.wait()
+            return {"type": "http.disconnect"}
+
+        async def send(message: Dict[str, object]) -> None:
+            sent.append(message)
+
+        scope = {"type": "http", "method": "GET", "path": "/stream", "query_string": b"pairs=USDMXN"}
+        task = asyncio.ensure_future(app(scope, receive, send))
+        await asyncio.sleep(0.02)
+        await asyncio.get_running_loop().run_in_executor(
+            None, lambda: app.state.manual_spot_store.set_fix("USDMXN", 18.3, ts=TS)
+        )
+        await asyncio.sleep(0.02)
+        disconnect.set()
+        await asyncio.wait_for(task, 1)
+
+    asyncio.run(scenario())
+    bodies = [message.get("body", b"") for message in sent[1:]]
+    assert any(b'"value":18.3' in body for body in bodies)
+    assert b": keepalive\n\n" in bodies
+    assert app.state.stream.subscriber_count == 0
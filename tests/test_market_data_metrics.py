@@ -0,0 +1,60 @@
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.market_data.app import MarketDataApp, ServiceState
+from services.market_data.metrics import Histogram, MarketDataMetrics
+from tests.market_data_stubs import StubBanxicoClient
+
+TS = datetime(2024, 4, 5, tzinfo=timezone.utc)
+
+
+def test_histogram_is_cumulative() -> None:
+    histogram = Histogram((0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        histogram.observe(value)
+    assert histogram.as_dict()["buckets"] == {"0.1": 2, "1.0": 3, "+Inf": 4}
+
+
+def test_metrics_track_age_rate_and_jumps() -> None:
+    ticks = iter([0.0, 50.0, 100.0, 100.0])
+    metrics = MarketDataMetrics(jump_threshold=0.01, stale_after=timedelta(hours=1), clock=lambda: next(ticks))
+    metrics.record_update("spot", "usdmxn", 17.0, TS, "manual")
+    assert metrics.record_update("spot", "USDMXN", 17.05, TS, "manual") is None
+    alert = metrics.record_update("spot", "USDMXN", 17.5, TS, "manual")
+    assert alert is not None and alert.change == pytest.approx(17.5 / 17.05 - 1)
+
+    snapshot = metrics.snapshot(now=TS + timedelta(hours=2))
+    (key,) = snapshot["keys"]
+    assert key["updates"] == 3
+    assert key["updates_per_minute"] == 2.0
+    assert key["age_seconds"] == 7200
+    assert snapshot["stale_keys"] == ["spot:USDMXN:manual"]
+    assert snapshot["jumps"]["count"] == 1
+
+
+def test_metrics_endpoint_reports_sources_and_upstream() -> None:
+    state = ServiceState(banxico_client=StubBanxicoClient())
+    app = MarketDataApp(state=state)
+    state.manual_spot_store.set_fix("EURMXN", 19.5, ts=TS)
+
+    app.respond("GET", "/fx/spot", {"pair": "EURMXN"})
+    app.respond("GET", "/fx/spot", {"pair": "EURMXN"})
+    app.respond("GET", "/fx/spot", {"pair": "USDMXN"})
+    app.respond("GET", "/fx/spot", {"pair": "EURUSD"})
+
+    body = app.handle_request("GET", "/metrics", {}).body
+    spot = body["requests"]["/fx/spot"]
+    assert spot["by_source"] == {"manual": 2, "banxico_fix": 1, "error_400": 1}
+    assert spot["response_cache_hit_rate"] == 0.25
+    assert body["upstream"]["requests"] == 1
+    assert body["upstream"]["latency_seconds"]["count"] == 1
+    assert body["upstream"]["by_pair"]["USDMXN"] == 1
+    sources = {(key["pair"], key["source"]) for key in body["keys"]}
+    assert {("EURMXN", "manual"), ("USDMXN", "banxico_fix")} <= sources
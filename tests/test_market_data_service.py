@@ -2,6 +2,8 @@ from __future__ import annotations
 
 import json
 import sys
+import threading
+import time
 from pathlib import Path
 from datetime import datetime, timedelta, timezone
 from typing import Mapping
@@ -13,29 +15,13 @@ sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 from services.market_data.app import MarketDataApp, Response, ServiceState
 from services.market_data.providers.banxico_fix import (
     BanxicoFixClient,
-    BanxicoFixError,
     BanxicoFixQuote,
 )
-
-
-class StubBanxicoClient(BanxicoFixClient):
-    def __init__(self, quote: BanxicoFixQuote) -> None:
-        super().__init__(token="dummy", cache_ttl=timedelta(minutes=5))
-        self._quote = quote
-        self.invocations = 0
-        self.should_fail = False
-
-    def _fetch_latest_fix(self) -> BanxicoFixQuote:  # type: ignore[override]
-        if self.should_fail:
-            raise BanxicoFixError("boom")
-        self.invocations += 1
-        return self._quote
+from tests.market_data_stubs import StubBanxicoClient
 
 
 def build_app(quote: BanxicoFixQuote) -> MarketDataApp:
-    state = ServiceState()
-    state.banxico_client = StubBanxicoClient(quote)  # type: ignore[assignment]
-    return MarketDataApp(state=state)
+    return MarketDataApp(state=ServiceState(banxico_client=StubBanxicoClient(quote)))
 
 
 def get_json(response: Response) -> Mapping[str, object]:
@@ -109,3 +95,249 @@ def test_banxico_client_returns_cached_on_failure() -> None:
     client.should_fail = True
     cached = client.get_latest_fix("USDMXN")
     assert cached.value == quote.value
+
+
+def test_spot_as_of_uses_manual_history(app: MarketDataApp) -> None:
+    app.state.manual_spot_store.set_fix("USDMXN", 17.9, ts=datetime(2024, 4, 1, tzinfo=timezone.utc))
+    app.state.manual_spot_store.set_fix("USDMXN", 18.1, ts=datetime(2024, 4, 3, tzinfo=timezone.utc))
+
+    response = app.handle_request("GET", "/fx/spot", {"pair": "USDMXN", "as_of": "2024-04-02T00:00:00Z"})
+    assert get_json(response)["value"] == pytest.approx(17.9)
+
+    latest = app.handle_request("GET", "/fx/spot", {"pair": "USDMXN"})
+    assert get_json(latest)["value"] == pytest.approx(18.1)
+
+    too_early = app.handle_request("GET", "/fx/spot", {"pair": "USDMXN", "as_of": "2024-03-01T00:00:00Z"})
+    assert too_early.status == 404
+    bad = app.handle_request("GET", "/fx/spot", {"pair": "USDMXN", "as_of": "yesterday"})
+    assert bad.status == 400
+
+
+def test_spot_as_of_falls_back_to_banxico_history(app: MarketDataApp) -> None:
+    app.handle_request("GET", "/fx/spot", {"pair": "USDMXN"})
+    response = app.handle_request("GET", "/fx/spot", {"pair": "USDMXN", "as_of": "2024-04-05 12:00:00 00:00"})
+    payload = get_json(response)
+    assert payload["source"] == "banxico_fix"
+    assert payload["value"] == pytest.approx(17.25)
+
+
+def test_iv_as_of_lookup(app: MarketDataApp) -> None:
+    app.state.manual_iv_store.set_sigma("USDMXN", "1M", 0.10, ts=datetime(2024, 4, 1, tzinfo=timezone.utc))
+    app.state.manual_iv_store.set_sigma("USDMXN", "1M", 0.12, ts=datetime(2024, 4, 2, tzinfo=timezone.utc))
+    response = app.handle_request(
+        "GET", "/iv/atm", {"pair": "USDMXN", "tenor": "1M", "as_of": "2024-04-01T12:00:00Z"}
+    )
+    assert get_json(response)["sigma"] == pytest.approx(0.10)
+
+
+def test_banxico_client_refreshes_all_due_series_in_one_request() -> None:
+    quote = BanxicoFixQuote(value=20.0, ts=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    client = StubBanxicoClient(quote)
+
+    eur = client.get_latest_fix("eurmxn")
+    assert eur.value == quote.value
+    assert client.invocations == 1
+    assert sorted(client.requested) == sorted(client._series.values())
+
+    quotes = client.get_latest_fixes(["USDMXN", "GBPMXN", "JPYMXN"])
+    assert set(quotes) == {"USDMXN", "GBPMXN", "JPYMXN"}
+    assert client.invocations == 1
+
+
+def test_banxico_client_per_series_ttl_refreshes_in_background() -> None:
+    quote = BanxicoFixQuote(value=20.0, ts=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    client = StubBanxicoClient(quote)
+    client._min_request_interval = timedelta(0)
+    client._series_ttl = {"SF46410": timedelta(0)}
+
+    client.get_latest_fixes(["USDMXN", "EURMXN"])
+    assert client.invocations == 1
+
+    served = client.get_latest_fix("EURMXN")
+    assert served is quote
+    client.wait_idle(timeout=5)
+    assert client.invocations == 2
+    assert client.requested == ["SF46410"]
+    assert client.quote_age("EURMXN") < timedelta(seconds=5)
+
+
+def test_banxico_client_coalesces_concurrent_refreshes() -> None:
+    quote = BanxicoFixQuote(value=20.0, ts=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    release = threading.Event()
+
+    class SlowClient(StubBanxicoClient):
+        def _fetch_series(self, series_ids):  # type: ignore[override]
+            release.wait(timeout=5)
+            return super()._fetch_series(series_ids)
+
+    client = SlowClient(quote)
+    results = []
+    readers = [
+        threading.Thread(target=lambda: results.append(client.get_latest_fix("USDMXN"))) for _ in range(8)
+    ]
+    for reader in readers:
+        reader.start()
+    release.set()
+    for reader in readers:
+        reader.join(timeout=5)
+    assert len(results) == 8
+    assert client.invocations == 1
+
+    client._cache["SF43718"].expiry = datetime.now(tz=timezone.utc)
+    client._min_request_interval = timedelta(0)
+    release.clear()
+    started = time.perf_counter()
+    assert client.get_latest_fix("USDMXN") is quote
+    assert time.perf_counter() - started < 1
+    release.set()
+    client.stop(timeout=5)
+    assert client.invocations == 2
+
+
+def test_banxico_parses_multi_series_payload() -> None:
+    payload = {
+        "bmx": {
+            "series": [
+                {"idSerie": "SF43718", "datos": [{"fecha": "05/04/2024", "dato": "16.5432"}]},
+                {"idSerie": "SF46410", "datos": [{"fecha": "2024-04-05", "dato": "17,901.10"}]},
+            ]
+        }
+    }
+    quotes = BanxicoFixClient._parse_series(payload, ["SF43718", "SF46410"])
+    assert quotes["SF43718"] == BanxicoFixQuote(16.5432, datetime(2024, 4, 5, tzinfo=timezone.utc))
+    assert quotes["SF46410"].value == pytest.approx(17901.10)
+
+
+def test_banxico_skips_series_with_unparseable_date(caplog: pytest.LogCaptureFixture) -> None:
+    payload = {
+        "bmx": {
+            "series": [
+                {"idSerie": "SF43718", "datos": [{"fecha": "5 abr 2024", "dato": "16.5432"}]},
+                {"idSerie": "SF46410", "datos": [{"fecha": "2024-04-05", "dato": "19.10"}]},
+            ]
+        }
+    }
+    quotes = BanxicoFixClient._parse_series(payload, ["SF43718", "SF46410"])
+    assert list(quotes) == ["SF46410"]
+    assert "SF43718" in caplog.text
+
+
+def test_banxico_spot_reports_age_header(app: MarketDataApp) -> None:
+    response = app.handle_request("GET", "/fx/spot", {"pair": "USDMXN"})
+    _, headers, _ = response.to_wsgi()
+    assert dict(headers)["Age"] == "0"
+
+
+def test_banxico_refresher_fetches_ahead_of_expiry() -> None:
+    quote = BanxicoFixQuote(value=17.0, ts=datetime(2024, 1, 1, tzinfo=timezone.utc))
+    client = StubBanxicoClient(quote)
+    client._cache_ttl = timedelta(milliseconds=50)
+    client._min_request_interval = timedelta(0)
+    client._refresh_ahead = timedelta(0)
+    client.get_latest_fix("USDMXN")
+
+    client.start(poll_interval=timedelta(milliseconds=10))
+    deadline = time.monotonic() + 5
+    while client.invocations < 3 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    client.stop(timeout=5)
+    assert client.invocations >= 3
+
+
+def test_banxico_refresher_backs_off_while_cold_cache_fetches_fail() -> None:
+    client = StubBanxicoClient()
+    client.should_fail = True
+    client._min_request_interval = timedelta(milliseconds=50)
+    attempts: list[bool] = []
+    client.add_fetch_observer(lambda _pairs, _seconds, ok: attempts.append(ok))
+
+    client.start(poll_interval=timedelta(milliseconds=5))
+    time.sleep(0.4)
+    client.stop(timeout=5)
+    # Retries at roughly 50, 100 and 200 ms rather than on every 5 ms poll.
+    assert 1 <= len(attempts) <= 5
+
+    client.should_fail = False
+    assert client.get_latest_fix("USDMXN").value == 17.3
+    assert client._cache[client.series_id("USDMXN")].retry_at is None
+
+
+def test_spot_batch_returns_columnar_payload(app: MarketDataApp) -> None:
+    app.state.manual_spot_store.set_fix("EURMXN", 19.5, ts=datetime(2024, 4, 6, tzinfo=timezone.utc))
+    client = app.state.banxico_client
+
+    response = app.handle_request("GET", "/fx/spot/batch", {"pairs": "usdmxn,EURMXN,eurusd,USDMXN"})
+    assert response.status == 200
+    payload = get_json(response)
+    assert payload["pairs"] == ["USDMXN", "EURMXN", "EURUSD"]
+    assert payload["value"][:2] == [pytest.approx(17.25), pytest.approx(19.5)]
+    assert payload["value"][2] is None
+    assert payload["source"] == ["banxico_fix", "manual", None]
+    assert list(payload["errors"]) == ["EURUSD"]
+    assert client.invocations == 1
+
+    missing = app.handle_request("GET", "/fx/spot/batch", {})
+    assert missing.status == 400
+
+
+def test_iv_surface_returns_matrix(app: MarketDataApp) -> None:
+    ts = datetime(2024, 4, 5, tzinfo=timezone.utc)
+    app.state.manual_iv_store.set_sigma("USDMXN", "1M", 0.11, ts=ts)
+    app.state.manual_iv_store.set_sigma("USDMXN", "3M", 0.12, ts=ts)
+    app.state.manual_iv_store.set_sigma("EURMXN", "3M", 0.09, ts=ts)
+
+    response = app.handle_request("GET", "/iv/surface", {"pairs": "USDMXN,EURMXN", "tenors": "1m,3m"})
+    payload = get_json(response)
+    assert payload["tenors"] == ["1M", "3M"]
+    assert payload["sigma"] == [[pytest.approx(0.11), pytest.approx(0.12)], [None, pytest.approx(0.09)]]
+    assert payload["ts"][1][0] is None
+
+
+def _wsgi_get(app: MarketDataApp, path: str, query: str):
+    captured = {}
+
+    def start_response(status, headers):
+        captured["status"] = status
+        captured["headers"] = dict(headers)
+
+    body = b"".join(app({"REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": query}, start_response))
+    return captured["status"], captured["headers"], body
+
+
+def test_wsgi_serves_hot_keys_from_encoded_cache(app: MarketDataApp) -> None:
+    cache = app.state.response_cache
+    app.state.manual_spot_store.set_fix("USDMXN", 18.0, ts=datetime(2024, 4, 6, tzinfo=timezone.utc))
+
+    _, _, first = _wsgi_get(app, "/fx/spot", "pair=USDMXN")
+    _, headers, second = _wsgi_get(app, "/fx/spot", "pair=usdmxn")
+    assert first is second
+    assert headers["Content-Length"] == str(len(second))
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    app.state.manual_spot_store.set_fix("USDMXN", 18.4, ts=datetime(2024, 4, 7, tzinfo=timezone.utc))
+    assert json.loads(_wsgi_get(app, "/fx/spot", "pair=USDMXN")[2])["value"] == pytest.approx(18.4)
+
+    app.state.manual_spot_store.clear()
+    assert json.loads(_wsgi_get(app, "/fx/spot", "pair=USDMXN")[2])["source"] == "banxico_fix"
+
+
+def test_cached_banxico_response_keeps_age_dynamic_and_invalidates_on_new_fix(app: MarketDataApp) -> None:
+    client = app.state.banxico_client
+    client.add_listener(lambda pair, _quote: app.state.response_cache.invalidate(pair))
+
+    _wsgi_get(app, "/fx/spot", "pair=USDMXN")  # cold fetch; its own refresh bumps the generation
+    _, headers, body = _wsgi_get(app, "/fx/spot", "pair=USDMXN")
+    assert headers["Age"] == "0"
+    entry = client._cache[client.series_id("USDMXN")]
+    entry.fetched_at -= timedelta(seconds=42)
+    _, headers, cached = _wsgi_get(app, "/fx/spot", "pair=USDMXN")
+    assert cached is body
+    assert headers["Age"] == "42"
+
+    client._quote = BanxicoFixQuote(value=17.5, ts=datetime(2024, 4, 8, tzinfo=timezone.utc))
+    entry.expiry = datetime.now(tz=timezone.utc) - timedelta(seconds=1)
+    entry.last_request_at -= timedelta(minutes=5)
+    _wsgi_get(app, "/fx/spot", "pair=USDMXN")  # stale: triggers the background refresh
+    client.wait_idle(timeout=1)
+    payload = json.loads(_wsgi_get(app, "/fx/spot", "pair=USDMXN")[2])
+    assert payload["value"] == pytest.approx(17.5)
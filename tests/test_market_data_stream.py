@@ -0,0 +1,81 @@
+from __future__ import annotations
+
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.market_data.app import MarketDataApp, ServiceState
+from services.market_data.stream import MarketDataBroker
+from tests.market_data_stubs import StubBanxicoClient
+
+TS = datetime(2024, 4, 5, tzinfo=timezone.utc)
+
+
+def test_subscription_filters_by_pair_and_conflates() -> None:
+    broker = MarketDataBroker()
+    subscription = broker.subscribe(["usdmxn"])
+
+    broker.publish("spot", "EURMXN", 19.0, TS, "manual")
+    broker.publish("spot", "USDMXN", 17.0, TS, "manual")
+    broker.publish("iv", "USDMXN", 0.12, TS, "manual", tenor="1M")
+    broker.publish("spot", "USDMXN", 17.1, TS, "manual")
+
+    events = subscription.drain()
+    assert [(event.kind, event.value) for event in events] == [("spot", 17.1), ("iv", 0.12)]
+    assert subscription.conflated == 1
+
+
+def test_subscription_buffer_is_bounded() -> None:
+    broker = MarketDataBroker()
+    subscription = broker.subscribe(max_pending=2)
+    for pair in ("USDMXN", "EURMXN", "GBPMXN"):
+        broker.publish("spot", pair, 1.0, TS, "manual")
+
+    assert [event.pair for event in subscription.drain()] == ["EURMXN", "GBPMXN"]
+    assert subscription.dropped == 1
+    subscription.close()
+    assert broker.subscriber_count == 0
+    assert subscription.get(timeout=0) is None
+
+
+def test_store_and_banxico_updates_reach_stream() -> None:
+    state = ServiceState(banxico_client=StubBanxicoClient())
+    app = MarketDataApp(state=state)
+    state.manual_spot_store.set_fix("EURMXN", 19.5, ts=TS)
+
+    stream = app.stream_events({"pairs": "USDMXN,EURMXN"}, heartbeat=0.01)
+    assert next(stream).startswith(b"retry:")
+    snapshot = next(stream)
+    assert b"event: spot" in snapshot and b'"pair":"EURMXN"' in snapshot
+
+    state.manual_iv_store.set_sigma("USDMXN", "3M", 0.11, ts=TS)
+    assert b'"sigma":0.11' in next(stream)
+    state.banxico_client.get_latest_fix("USDMXN")
+    # Every due series is refreshed together, so EURMXN's FIX is pushed too.
+    pushed = [next(stream), next(stream)]
+    assert all(b'"source":"banxico_fix"' in chunk for chunk in pushed)
+    assert next(stream) == b": keepalive\n\n"
+
+    stream.close()
+    assert state.stream.subscriber_count == 0
+
+
+def test_failing_stream_listener_does_not_skip_cache_invalidation(monkeypatch) -> None:
+    state = ServiceState(banxico_client=StubBanxicoClient())
+    app = MarketDataApp(state=state)
+    state.manual_spot_store.set_fix("EURMXN", 19.0, ts=TS)
+    state.manual_iv_store.set_sigma("USDMXN", "1M", 0.11, ts=TS)
+    assert b'"value":19.0' in app.respond("GET", "/fx/spot", {"pair": "EURMXN"}).body
+    assert b'"sigma":0.11' in app.respond("GET", "/iv/atm", {"pair": "USDMXN", "tenor": "1M"}).body
+
+    def publish(*_args, **_kwargs):
+        raise RuntimeError("subscriber gone")
+
+    monkeypatch.setattr(state.stream, "publish", publish)
+    state.manual_spot_store.set_fix("EURMXN", 20.0, ts=TS.replace(hour=1))
+    state.manual_iv_store.set_sigma("USDMXN", "1M", 0.12, ts=TS.replace(hour=1))
+
+    assert b'"value":20.0' in app.respond("GET", "/fx/spot", {"pair": "EURMXN"}).body
+    assert b'"sigma":0.12' in app.respond("GET", "/iv/atm", {"pair": "USDMXN", "tenor": "1M"}).body
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+import math
+import sys
+from datetime import datetime, timezone
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from services.market_data.app import MarketDataApp, ServiceState
+from services.market_data.providers.manual_iv_store import ManualIVStore
+from services.market_data.surface import VolSurface, tenor_to_years
+
+TS = datetime(2024, 4, 5, tzinfo=timezone.utc)
+
+
+def test_tenor_parsing() -> None:
+    assert tenor_to_years("1Y") == pytest.approx(1.0)
+    assert tenor_to_years("3m") == pytest.approx(0.25)
+    assert tenor_to_years("45D") == pytest.approx(45 / 365)
+    with pytest.raises(ValueError):
+        tenor_to_years("soon")
+
+
+def test_surface_interpolates_linear_in_variance_and_smile() -> None:
+    surface = VolSurface(
+        "usdmxn",
+        {("1M", 0.5): 0.10, ("3M", 0.5): 0.12, ("3M", 0.25): 0.14, ("3M", 0.75): 0.13},
+    )
+    t1, t2 = 1 / 12, 0.25
+    t = 45 / 365
+    variance = 0.10**2 * t1 + (0.12**2 * t2 - 0.10**2 * t1) * (t - t1) / (t2 - t1)
+    assert surface.atm("45D") == pytest.approx(math.sqrt(variance / t))
+
+    sigmas = surface.sigma(["3M", "3M", "1W", "2Y"], [0.25, 0.375, 0.5, 0.75])
+    assert sigmas == pytest.approx([0.14, 0.13, 0.10, 0.13])
+    with pytest.raises(ValueError):
+        surface.sigma(["1M", "3M"], [0.5, 0.5, 0.5])
+    with pytest.raises(ValueError, match="delta"):
+        surface.sigma(["3M"], 17.2)
+
+
+def test_store_rebuilds_surface_only_on_change() -> None:
+    store = ManualIVStore()
+    assert store.surface("USDMXN") is None
+    store.set_sigma("USDMXN", "1M", 0.10, ts=TS)
+    first = store.surface("USDMXN")
+    assert store.surface("usdmxn") is first
+
+    store.set_smile("USDMXN", "1M", 0.25, 0.12, ts=TS)
+    second = store.surface("USDMXN")
+    assert second is not first
+    assert second.sigma(["1M"], 0.25) == pytest.approx([0.12])
+    store.set_sigma("EURMXN", "1M", 0.09, ts=TS)
+    assert store.surface("USDMXN") is second
+
+
+def test_iv_endpoint_interpolates_missing_tenor() -> None:
+    app = MarketDataApp(state=ServiceState())
+    app.state.manual_iv_store.set_sigma("USDMXN", "1M", 0.10, ts=TS)
+    app.state.manual_iv_store.set_sigma("USDMXN", "3M", 0.12, ts=TS)
+
+    response = app.handle_request("GET", "/iv/atm", {"pair": "USDMXN", "tenor": "45D"})
+    assert response.status == 200
+    assert response.body["source"] == "manual_interpolated"
+    assert 0.10 < response.body["sigma"] < 0.12
+
+    exact = app.handle_request("GET", "/iv/atm", {"pair": "USDMXN", "tenor": "1M"})
+    assert exact.body["source"] == "manual"
+
+
+def test_iv_endpoints_do_not_extrapolate_past_quoted_tenors() -> None:
+    app = MarketDataApp(state=ServiceState())
+    app.state.manual_iv_store.set_sigma("USDMXN", "1M", 0.10, ts=TS)
+    app.state.manual_iv_store.set_sigma("USDMXN", "3M", 0.12, ts=TS)
+
+    assert app.handle_request("GET", "/iv/atm", {"pair": "USDMXN", "tenor": "1Y"}).status == 404
+    response = app.handle_request("GET", "/iv/surface", {"pairs": "USDMXN", "tenors": "1M,45D,1Y"})
+    body = response.body
+    assert body["sigma"][0][0] == pytest.approx(0.10)
+    assert 0.10 < body["sigma"][0][1] < 0.12
+    assert body["sigma"][0][2] is None
+    assert body["interpolated"] == [[False, True, False]]
+    assert app.handle_request("GET", "/iv/surface", {"pairs": "USDMXN", "tenors": "soon"}).status == 400
+
+
+def test_smile_updates_notify_surface_listeners() -> None:
+    app = MarketDataApp(state=ServiceState())
+    store = app.state.manual_iv_store
+    changed = []
+    store.add_surface_listener(changed.append)
+    store.set_sigma("USDMXN", "1M", 0.10, ts=TS)
+    app.respond("GET", "/iv/atm", {"pair": "USDMXN", "tenor": "1M"})
+    assert app.state.response_cache.keys()
+
+    store.set_smile("USDMXN", "1M", 0.25, 0.12, ts=TS)
+    assert changed == ["USDMXN", "USDMXN"]
+    assert app.state.response_cache.keys() == []
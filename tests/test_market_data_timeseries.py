@@ -0,0 +1,74 @@
+from datetime import datetime, timedelta, timezone
+
+from services.market_data.providers.manual_iv_store import ManualIVStore
+from services.market_data.providers.manual_spot_store import ManualSpotEntry, ManualSpotStore
+from services.market_data.timeseries import TimeSeries, from_micros, to_micros
+
+T0 = datetime(2024, 1, 1, tzinfo=timezone.utc)
+
+
+def test_micros_round_trip_and_naive_is_utc():
+    value = datetime(2024, 2, 29, 13, 45, 1, 123456, tzinfo=timezone.utc)
+    assert from_micros(to_micros(value)) == value
+    assert to_micros(value.replace(tzinfo=None)) == to_micros(value)
+
+
+def test_series_as_of_and_range_with_late_points():
+    series = TimeSeries()
+    for minute in (0, 10, 20, 40):
+        series.append(T0 + timedelta(minutes=minute), float(minute))
+    series.append(T0 + timedelta(minutes=30), 30.0)
+
+    assert series.as_of(T0 - timedelta(seconds=1)) is None
+    assert series.as_of(T0 + timedelta(minutes=35)) == (T0 + timedelta(minutes=30), 30.0)
+    assert series.latest() == (T0 + timedelta(minutes=40), 40.0)
+    window = series.range(T0 + timedelta(minutes=10), T0 + timedelta(minutes=30))
+    assert [value for _, value in window] == [10.0, 20.0, 30.0]
+
+
+def test_series_evicts_by_capacity_and_retention():
+    series = TimeSeries(capacity=16)
+    for minute in range(100):
+        series.append(T0 + timedelta(minutes=minute), float(minute))
+    assert len(series) <= 16
+    assert series.latest()[1] == 99.0
+
+    aged = TimeSeries(retention=timedelta(minutes=5))
+    for minute in range(20):
+        aged.append(T0 + timedelta(minutes=minute), float(minute))
+    assert [value for _, value in aged.range()] == [14.0, 15.0, 16.0, 17.0, 18.0, 19.0]
+
+
+def test_manual_spot_store_keeps_history():
+    store = ManualSpotStore(capacity=100)
+    store.set_fix("usdmxn", 17.0, ts=T0)
+    store.set_fix("USDMXN", 17.5, ts=T0 + timedelta(days=1))
+    assert store.get_fix("USDMXN").value == 17.5
+    assert store.get_fix_as_of("USDMXN", T0 + timedelta(hours=12)).value == 17.0
+    assert [entry.value for entry in store.history("USDMXN")] == [17.0, 17.5]
+    assert store.pairs() == ["USDMXN"]
+    store.clear()
+    assert store.get_fix("USDMXN") is None
+
+
+def test_manual_stores_serve_the_last_write_even_when_back_dated():
+    store = ManualSpotStore(capacity=100)
+    store.set_fix("USDMXN", 17.5, ts=T0 + timedelta(hours=1))
+    store.set_fix("USDMXN", 17.4, ts=T0)  # correction posted with an earlier timestamp
+    assert store.get_fix("USDMXN") == ManualSpotEntry(value=17.4, ts=T0)
+    assert store.get_fix_as_of("USDMXN", T0 + timedelta(hours=2)).value == 17.5
+
+    iv = ManualIVStore()
+    iv.set_sigma("USDMXN", "1M", 0.12, ts=T0 + timedelta(hours=1))
+    iv.set_sigma("USDMXN", "1M", 0.11, ts=T0)
+    assert iv.get_sigma("USDMXN", "1M").sigma == 0.11
+    assert iv.get_sigma_as_of("USDMXN", "1M", T0 + timedelta(hours=2)).sigma == 0.12
+    assert iv.surface("USDMXN").sigma(["1M"]) == [0.11]
+
+
+def test_series_last_written_falls_back_to_latest_once_evicted():
+    series = TimeSeries(retention=timedelta(minutes=5))
+    series.append(T0 + timedelta(minutes=10), 10.0)
+    series.append(T0, 0.0)
+    assert series.last_written() == (T0 + timedelta(minutes=10), 10.0)
+    assert [value for _, value in series.export()] == [10.0]